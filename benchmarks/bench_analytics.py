@@ -0,0 +1,103 @@
+"""
+Сравнение движков аналитики на одной базе: агрегирующие запросы к SQLite, pandas поверх колоночного
+снимка и встроенный DuckDB поверх того же снимка. Для каждого движка замеряется первый запуск
+(с выгрузкой снимка) и повторный полный анализ, результаты сверяются с движком sqlite.
+
+База берётся готовая (--db) или собирается во временном каталоге из вакансий mock-сервера (--rows).
+
+    python -m benchmarks.bench_analytics --rows 500000
+    python -m benchmarks.bench_analytics --db db.sqlite --backends sqlite duckdb
+"""
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.mock_hh_server import MockConfig, MockHeadHunter
+from src.analytics.extractor import BACKENDS, create_extractor
+from src.db_manager.db import Database
+from src.utils import VacancyParser
+
+_FIRST_ID = 100000000
+
+
+async def build_database(path: str, rows: int, batch_size: int = 20000):
+    """Вакансии mock-сервера с разнообразием для группировок: 5000 работодателей, 300 навыков, 400 городов."""
+    mock = MockHeadHunter(MockConfig(non_it_ratio=0, not_found_ratio=0))
+    parser = VacancyParser()
+    db = Database(path)
+    await db.async_connect()
+    await db.create_table()
+    for start in range(_FIRST_ID, _FIRST_ID + rows, batch_size):
+        records = []
+        for vacancy_id in range(start, min(start + batch_size, _FIRST_ID + rows)):
+            data = mock.vacancy(vacancy_id)
+            data['employer']['name'] = f'Employer {vacancy_id % 5000}'
+            data['key_skills'] = [{'name': f'Skill {(vacancy_id * 7 + k * 13) % 300}'} for k in range(vacancy_id % 6)]
+            if data['address'] and vacancy_id % 3 == 0:
+                data['address']['city'] = f'City {vacancy_id % 400}'
+            records.append(data)
+        await db.insert_vacancies([vacancy for vacancy in parser.parse(records) if vacancy])
+    await db.async_disconnect()
+
+
+def _same(expected, actual, path: str = '') -> list[str]:
+    if isinstance(expected, dict):
+        return [difference for key in expected for difference in _same(expected[key], actual[key], f'{path}.{key}')]
+    try:
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                      check_dtype=False, rtol=1e-9)
+    except AssertionError:
+        return [path.lstrip('.')]
+    return []
+
+
+def bench(db: Database, backend: str, snapshot_dir: str):
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    starting_time = time.perf_counter()
+    extractor = create_extractor(db, backend, snapshot_dir)
+    cold = extractor.full_analysis()
+    cold_time = time.perf_counter() - starting_time
+    starting_time = time.perf_counter()
+    create_extractor(db, backend, snapshot_dir).full_analysis()
+    warm_time = time.perf_counter() - starting_time
+    return cold, cold_time, warm_time
+
+
+def main(db_path: str | None, rows: int, backends: list[str]):
+    with tempfile.TemporaryDirectory() as directory:
+        if db_path is None:
+            db_path = os.path.join(directory, 'bench.sqlite')
+            starting_time = time.perf_counter()
+            asyncio.run(build_database(db_path, rows))
+            print(f'database of {rows} vacancies built in {time.perf_counter() - starting_time:.1f} sec')
+        db = Database(db_path)
+        db.connect()
+        db.create_analytic_indexes()
+        db.create_sketches()
+        reference = None
+        print(f'{"backend":10s} {"first run":>12s} {"repeat run":>12s}  result')
+        for backend in backends:
+            result, cold_time, warm_time = bench(db, backend, os.path.join(directory, f'snapshot-{backend}'))
+            if reference is None:
+                reference, verdict = result, 'reference'
+            else:
+                differences = _same(reference, result)
+                verdict = 'same' if not differences else f'differs in {", ".join(differences)}'
+            print(f'{backend:10s} {cold_time:10.3f} s {warm_time:10.3f} s  {verdict}')
+        db.disconnect()
+    print(f'peak rss: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB, cpus: {os.cpu_count()}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='existing database, otherwise a synthetic one is built')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    args = parser.parse_args()
+    main(args.db, args.rows, args.backends)
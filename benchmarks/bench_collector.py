@@ -0,0 +1,102 @@
+"""
+Сквозной замер сборщика: настоящий Collector и HeadHunterApi против локального mock-сервера.
+
+    python -m benchmarks.bench_collector --ids 20000 --latency-ms 50 --rate-limit 0
+    python -m benchmarks.bench_collector --mode harvest --days 1 --ids-per-second 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.mock_hh_server import add_arguments, config_from_args, start_in_process
+from src.api.rate_controller import RateController
+from src.data_collector.collector import Collector
+from src.db_manager.db import Database
+
+
+class TimedDatabase(Database):
+    def __init__(self, db_name: str):
+        super().__init__(db_name)
+        self.rows = 0
+        self.write_time = 0.0
+
+    async def insert_vacancies(self, vacancies, *args, **kwargs):
+        starting_time = time.perf_counter()
+        failed = await super().insert_vacancies(vacancies, *args, **kwargs)
+        self.write_time += time.perf_counter() - starting_time
+        self.rows += len(vacancies) - len(failed)
+        return failed
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return float('nan')
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+
+async def run(args):
+    latencies = []
+    statuses = Counter()
+
+    async def on_request(request: httpx.Request):
+        request.extensions['started_at'] = time.perf_counter()
+
+    async def on_response(response: httpx.Response):
+        latencies.append(time.perf_counter() - response.request.extensions['started_at'])
+        statuses[response.status_code] += 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = TimedDatabase(os.path.join(directory, 'bench.sqlite'))
+        await db.async_connect()
+        await db.create_table()
+        rate_controller = RateController(rate=args.rate, burst=max(1, int(args.rate)),
+                                         max_concurrency=args.max_concurrency)
+        async with httpx.AsyncClient(event_hooks={'request': [on_request], 'response': [on_response]},
+                                     limits=httpx.Limits(max_connections=args.max_concurrency)) as client:
+            collector = Collector(client, db, rate_controller, api_url=f'http://{args.host}:{args.port}')
+            starting_time = time.perf_counter()
+            if args.mode == 'harvest':
+                await collector.harvest(days=args.days)
+            else:
+                await collector.start(depth=args.ids)
+            elapsed = time.perf_counter() - starting_time
+        await db.async_disconnect()
+
+    requests = sum(statuses.values())
+    retries = sum(count for status, count in statuses.items() if status == 429 or status >= 500)
+    print(f'mode:               {args.mode}')
+    print(f'elapsed:            {elapsed:.2f} sec')
+    print(f'requests:           {requests} ({requests / elapsed:.1f} req/sec)')
+    print(f'statuses:           {dict(sorted(statuses.items()))}')
+    print(f'retries (429/5xx):  {retries}')
+    print(f'vacancies stored:   {db.rows} ({db.rows / elapsed:.1f} vacancies/sec)')
+    print(f'latency p50/p99:    {_percentile(latencies, 50) * 1000:.1f} / {_percentile(latencies, 99) * 1000:.1f} ms')
+    print(f'db write rate:      {db.rows / db.write_time if db.write_time else 0:.0f} rows/sec '
+          f'({db.write_time:.2f} sec in writes)')
+    print(f'final concurrency:  {rate_controller.limit}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument('--mode', choices=['scan', 'harvest'], default='scan')
+    parser.add_argument('--ids', type=int, default=20000, help='scan depth in vacancy ids')
+    parser.add_argument('--days', type=int, default=1, help='harvest window in days')
+    parser.add_argument('--rate', type=float, default=1000.0, help='collector token bucket, requests/sec')
+    parser.add_argument('--max-concurrency', type=int, default=100)
+    args = parser.parse_args()
+    server = start_in_process(config_from_args(args))
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Сравнение скорости записи вакансий: по одной строке на транзакцию против пачек BatchWriter.
+
+    python -m benchmarks.bench_db_writer --rows 5000 --batch-size 500
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from src.db_manager.db import Database
+from src.models.vacancy_model import Vacancy
+
+
+def make_vacancies(count: int, start_id: int = 1):
+    return [Vacancy(id=vacancy_id,
+                    name=f'Python developer {vacancy_id}',
+                    city='Москва',
+                    salary_bottom=100000 + vacancy_id % 1000,
+                    salary_top=200000 + vacancy_id % 1000,
+                    currency='RUR',
+                    published_at='2025-05-01T12:00:00+0300',
+                    employer_name=f'Employer {vacancy_id % 100}',
+                    key_skills=['Python', 'SQL'],
+                    schedule='remote',
+                    professional_role='Программист, разработчик',
+                    professional_role_id=96,
+                    experience='between1And3')
+            for vacancy_id in range(start_id, start_id + count)]
+
+
+async def bench_single(db: Database, vacancies):
+    starting_time = time.perf_counter()
+    for vacancy in vacancies:
+        await db.insert_vacancy(vacancy)
+    return time.perf_counter() - starting_time
+
+
+async def bench_batched(db: Database, vacancies, batch_size: int):
+    starting_time = time.perf_counter()
+    async with db.batch_writer(batch_size=batch_size) as writer:
+        for vacancy in vacancies:
+            await writer.add([vacancy])
+    return time.perf_counter() - starting_time
+
+
+async def main(rows: int, batch_size: int):
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.sqlite'))
+        await db.async_connect()
+        await db.create_table()
+        single = await bench_single(db, make_vacancies(rows))
+        batched = await bench_batched(db, make_vacancies(rows, start_id=rows + 1), batch_size)
+        refetch = await bench_batched(db, make_vacancies(rows, start_id=rows + 1), batch_size)
+        await db.async_disconnect()
+    print(f'single inserts:        {rows / single:10.0f} rows/sec')
+    print(f'batched inserts:       {rows / batched:10.0f} rows/sec (batch_size={batch_size})')
+    print(f'batched upserts:       {rows / refetch:10.0f} rows/sec (refetch of the same ids)')
+    print(f'speedup:               {single / batched:10.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.batch_size))
@@ -0,0 +1,125 @@
+"""
+Микробенчмарк стадии разбора сборщика на одном ядре: прежний путь (асинхронные json_loads/skills_check,
+pydantic-модель и несколько строк лога на каждую запись) против пачечного Collector._process_batch.
+
+Записи берутся из генератора mock-сервера или из файла с сохранёнными ответами (по одному JSON на строку).
+
+    python -m benchmarks.bench_parse --records 50000
+    python -m benchmarks.bench_parse --payloads recorded.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from benchmarks.mock_hh_server import IT_ROLES, MockConfig, MockHeadHunter
+from src.data_collector.collector import Collector
+from src.models.vacancy_model import Vacancy
+from src.utils import json_loads
+
+
+class _LegacyVacancy(Vacancy):
+    key_skills: str | None
+
+
+async def _legacy_json_loads(raw_data):
+    return json.loads(raw_data)
+
+
+async def _legacy_skills_check(skills):
+    result = ''
+    for skill in skills:
+        result += skill['name'] + ', '
+    return result or None
+
+
+async def _legacy_formalize(data: dict):
+    try:
+        if data.get('errors'):
+            return None
+        return _LegacyVacancy(id=data['id'],
+                              name=data['name'],
+                              city=data['address']['city'] if data.get('address') else None,
+                              salary_bottom=data['salary_range']['from'] if data.get('salary_range') else None,
+                              salary_top=data['salary_range']['to'] if data.get('salary_range') else None,
+                              currency=data['salary_range']['currency'] if data.get('salary_range') else None,
+                              published_at=data['published_at'],
+                              employer_name=data['employer']['name'],
+                              key_skills=await _legacy_skills_check(data['key_skills']),
+                              schedule=data['schedule']['id'],
+                              professional_role_id=data['professional_roles'][0]['id'],
+                              professional_role=data['professional_roles'][0]['name'],
+                              experience=data['experience']['id'])
+    except Exception as e:
+        logging.warning(f'Formalizing error {e} with data {data}')
+
+
+def make_payloads(count: int, reject_ratio: float) -> list[bytes]:
+    mock = MockHeadHunter(MockConfig(not_found_ratio=0, non_it_ratio=0))
+    payloads = []
+    for vacancy_id in range(mock.config.newest_id - count, mock.config.newest_id):
+        vacancy = mock.vacancy(vacancy_id)
+        vacancy['description'] = '<p>' + 'Описание вакансии. ' * 150 + '</p>'
+        if vacancy_id % 1000 < reject_ratio * 1000:
+            del vacancy['employer']
+        payloads.append(json.dumps(vacancy, ensure_ascii=False).encode())
+    return payloads
+
+
+def load_payloads(path: str) -> list[bytes]:
+    with open(path, 'rb') as file:
+        return [line.rstrip(b'\n') for line in file if line.strip()]
+
+
+async def _legacy_process(vacancy_id: int, raw_vacancy):
+    if raw_vacancy.get('professional_roles'):
+        for role in raw_vacancy['professional_roles']:
+            if role['id'] in IT_ROLES:
+                logging.info(f'Vacancy {vacancy_id} processing has started')
+                vacancy = await _legacy_formalize(raw_vacancy)
+                logging.info(f'Vacancy {vacancy_id} processing completed successfully')
+                return vacancy
+    logging.info(f'Vacancy {vacancy_id} was skipped')
+
+
+async def bench_legacy(payloads) -> float:
+    starting_time = time.perf_counter()
+    for vacancy_id, payload in enumerate(payloads):
+        await _legacy_process(vacancy_id, await _legacy_json_loads(payload.decode()))
+    return time.perf_counter() - starting_time
+
+
+def bench_collector(payloads, batch_size: int) -> tuple[float, Collector]:
+    collector = Collector(None, None)
+    collector._roles = IT_ROLES
+    starting_time = time.perf_counter()
+    for start in range(0, len(payloads), batch_size):
+        batch = [(None, vacancy_id, True, json_loads(payload))
+                 for vacancy_id, payload in enumerate(payloads[start:start + batch_size], start)]
+        for _ in collector._process_batch(batch):
+            pass
+    return time.perf_counter() - starting_time, collector
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--payloads', help='file with one recorded /vacancies/{id} response per line')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--reject-ratio', type=float, default=0.01)
+    args = parser.parse_args()
+    # уровень логирования как в src/__main__, но без вывода: форматирование записей тоже часть стоимости разбора
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+
+    payloads = load_payloads(args.payloads) if args.payloads else make_payloads(args.records, args.reject_ratio)
+    legacy_time = asyncio.run(bench_legacy(payloads))
+    batched_time, collector = bench_collector(payloads, args.batch_size)
+    print(f'records:        {len(payloads)}')
+    print(f'legacy path:    {len(payloads) / legacy_time:.0f} records/sec')
+    print(f'batched path:   {len(payloads) / batched_time:.0f} records/sec ({legacy_time / batched_time:.2f}x)')
+    print(f'rejected:       {dict(collector._parser.rejected)}')
+
+
+if __name__ == '__main__':
+    main()
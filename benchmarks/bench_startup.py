@@ -0,0 +1,55 @@
+"""
+Стоимость запуска подкоманд `python -m src`: время импорта и пиковый RSS интерпретатора после импорта
+модулей, которые подкоманда загружает до начала работы. `all` импортирует всё — столько же при старте
+загружал прежний `python -m src` для любого запуска. Каждый замер — в отдельном процессе, берётся медиана.
+
+    python -m benchmarks.bench_startup --repeat 7
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# модули, которые импортируют функции подкоманды в src/__main__
+_COLLECT = ['httpx', 'src.data_collector.collector', 'src.data_collector.refresher']
+_ANALYZE = ['src.analytics.cache', 'src.analytics.extractor']
+_PLOT = [*_ANALYZE, 'src.analytics.infographics']
+COMMANDS = {
+    'collect': _COLLECT,
+    'analyze': _ANALYZE,
+    'plot': _PLOT,
+    'all': [*_COLLECT, *_PLOT],
+}
+
+_PROBE = """
+import resource, sys, time
+starting_time = time.perf_counter()
+import src.__main__
+for module in sys.argv[1:]:
+    __import__(module)
+print(time.perf_counter() - starting_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def measure(modules: list[str]) -> tuple[float, float]:
+    output = subprocess.run([sys.executable, '-c', _PROBE, *modules], capture_output=True, text=True, check=True)
+    seconds, rss = output.stdout.split()
+    return float(seconds), int(rss) / 1024
+
+
+def main(repeat: int):
+    # прогрев: байткод и файловый кэш, чтобы первый замер не отличался от остальных
+    measure(COMMANDS['all'])
+    print(f'{"command":10s} {"import":>10s} {"peak rss":>10s}')
+    for command, modules in COMMANDS.items():
+        samples = [measure(modules) for _ in range(repeat)]
+        seconds = statistics.median(sample[0] for sample in samples)
+        rss = statistics.median(sample[1] for sample in samples)
+        print(f'{command:10s} {seconds * 1000:8.0f} ms {rss:7.0f} MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.repeat)
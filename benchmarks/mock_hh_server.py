@@ -0,0 +1,244 @@
+"""
+Локальная замена api.hh.ru для замеров сборщика без обращения к настоящему API.
+
+Отдаёт синтетические /professional_roles, /vacancies и /vacancies/{id} с настраиваемой задержкой
+(логнормальное распределение), долей несуществующих id, долей не-IT вакансий и лимитом запросов,
+сверх которого отвечает 429 с Retry-After.
+
+    python -m benchmarks.mock_hh_server --port 8085 --latency-ms 80 --rate-limit 50
+    HH_API_URL=http://127.0.0.1:8085 python -m src
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import socket
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+IT_ROLES = {
+    '96': 'Программист, разработчик',
+    '104': 'Руководитель группы разработки',
+    '113': 'Системный администратор',
+    '114': 'Системный инженер',
+    '116': 'Специалист по информационной безопасности',
+    '124': 'Тестировщик',
+    '125': 'Технический директор (CTO)',
+    '126': 'Технический писатель',
+    '160': 'DevOps-инженер',
+    '165': 'Дата-сайентист',
+}
+OTHER_ROLES = {'70': 'Менеджер по продажам, менеджер по работе с клиентами', '40': 'Бухгалтер'}
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', None]
+SKILLS = ['Python', 'SQL', 'Git', 'Linux', 'Docker', 'PostgreSQL', 'Java', 'JavaScript', 'Kubernetes', 'Go']
+SCHEDULES = ['fullDay', 'remote', 'flexible', 'shift']
+EXPERIENCE = ['noExperience', 'between1And3', 'between3And6', 'moreThan6']
+REASONS = {200: 'OK', 304: 'Not Modified', 404: 'Not Found', 429: 'Too Many Requests'}
+
+
+@dataclass
+class MockConfig:
+    host: str = '127.0.0.1'
+    port: int = 8085
+    newest_id: int = 130000000
+    ids_per_second: float = 5.0
+    latency_ms: float = 50.0
+    latency_sigma: float = 0.5
+    not_found_ratio: float = 0.6
+    non_it_ratio: float = 0.9
+    rate_limit: float = 0.0
+    search_depth: int = 2000
+
+
+def _fraction(vacancy_id: int, salt: int) -> float:
+    return ((vacancy_id * 2654435761 + salt * 40503) % 4294967296) / 4294967296
+
+
+class MockHeadHunter:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.started_at = datetime.now().replace(microsecond=0)
+        self.requests = 0
+        self.throttled = 0
+        self._tokens = config.rate_limit
+        self._updated = time.monotonic()
+
+    def _exists(self, vacancy_id: int) -> bool:
+        return vacancy_id <= self.config.newest_id and _fraction(vacancy_id, 1) >= self.config.not_found_ratio
+
+    def _role(self, vacancy_id: int):
+        roles = OTHER_ROLES if _fraction(vacancy_id, 2) < self.config.non_it_ratio else IT_ROLES
+        role_id = list(roles)[vacancy_id % len(roles)]
+        return role_id, roles[role_id]
+
+    def _published_at(self, vacancy_id: int) -> datetime:
+        return self.started_at - timedelta(seconds=(self.config.newest_id - vacancy_id) / self.config.ids_per_second)
+
+    def _id_at(self, moment: datetime) -> int:
+        return self.config.newest_id - int((self.started_at - moment).total_seconds() * self.config.ids_per_second)
+
+    def vacancy(self, vacancy_id: int) -> dict:
+        role_id, role_name = self._role(vacancy_id)
+        with_salary = _fraction(vacancy_id, 3) < 0.5
+        bottom = 50000 + int(_fraction(vacancy_id, 4) * 250000) // 1000 * 1000
+        return {
+            'id': str(vacancy_id),
+            'name': f'{role_name} #{vacancy_id}',
+            'archived': False,
+            'address': {'city': city} if (city := CITIES[vacancy_id % len(CITIES)]) else None,
+            'salary_range': {'from': bottom, 'to': bottom + 50000, 'currency': 'RUR'} if with_salary else None,
+            'published_at': self._published_at(vacancy_id).strftime('%Y-%m-%dT%H:%M:%S+0300'),
+            'employer': {'name': f'Employer {vacancy_id % 500}'},
+            'key_skills': [{'name': SKILLS[(vacancy_id + i) % len(SKILLS)]} for i in range(vacancy_id % 5)],
+            'schedule': {'id': SCHEDULES[vacancy_id % len(SCHEDULES)]},
+            'professional_roles': [{'id': role_id, 'name': role_name}],
+            'experience': {'id': EXPERIENCE[vacancy_id % len(EXPERIENCE)]},
+        }
+
+    def professional_roles(self) -> dict:
+        return {'categories': [
+            {'id': '7', 'name': 'Информационные технологии',
+             'roles': [{'id': role_id, 'name': name} for role_id, name in IT_ROLES.items()]},
+            {'id': '17', 'name': 'Продажи, обслуживание клиентов',
+             'roles': [{'id': role_id, 'name': name} for role_id, name in OTHER_ROLES.items()]},
+        ]}
+
+    def search(self, query: dict) -> dict:
+        per_page = int(query.get('per_page', ['20'])[0])
+        page = int(query.get('page', ['0'])[0])
+        roles = set(query.get('professional_role', []))
+        date_from = datetime.fromisoformat(query['date_from'][0]) if 'date_from' in query else None
+        date_to = datetime.fromisoformat(query['date_to'][0]) if 'date_to' in query else self.started_at
+        high = min(self.config.newest_id, self._id_at(date_to))
+        low = self._id_at(date_from) if date_from else high - per_page * 100
+
+        def matches(vacancy_id: int) -> bool:
+            return self._exists(vacancy_id) and (not roles or self._role(vacancy_id)[0] in roles)
+
+        needed = min((page + 1) * per_page, self.config.search_depth)
+        visible = []
+        for vacancy_id in range(high, low, -1):
+            if len(visible) >= needed:
+                break
+            if matches(vacancy_id):
+                visible.append(vacancy_id)
+        if len(visible) < needed or high - low <= 200000:
+            found = sum(1 for vacancy_id in range(high, low, -1) if matches(vacancy_id))
+        else:
+            # для широких окон точный подсчёт слишком дорог — хватает оценки по долям
+            it_share = 1 - self.config.non_it_ratio if roles <= set(IT_ROLES) else 1
+            found = int((high - low) * (1 - self.config.not_found_ratio) * it_share)
+        pages = math.ceil(min(found, self.config.search_depth) / per_page)
+        items = visible[page * per_page:(page + 1) * per_page]
+        return {'found': found, 'pages': pages, 'page': page,
+                'per_page': per_page, 'items': [{'id': str(vacancy_id)} for vacancy_id in items]}
+
+    def _throttle(self) -> bool:
+        if not self.config.rate_limit:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.config.rate_limit, self._tokens + (now - self._updated) * self.config.rate_limit)
+        self._updated = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    async def respond(self, target: str, headers: dict):
+        self.requests += 1
+        await asyncio.sleep(random.lognormvariate(math.log(self.config.latency_ms / 1000), self.config.latency_sigma))
+        if self._throttle():
+            self.throttled += 1
+            return 429, {'errors': [{'type': 'too_many_requests'}]}, {'Retry-After': '1'}
+        url = urlsplit(target)
+        if url.path == '/professional_roles':
+            return 200, self.professional_roles(), {}
+        if url.path == '/vacancies':
+            return 200, self.search(parse_qs(url.query)), {}
+        if url.path.startswith('/vacancies/'):
+            vacancy_id = int(url.path.rsplit('/', 1)[1])
+            if not self._exists(vacancy_id):
+                return 404, {'errors': [{'type': 'not_found'}]}, {}
+            etag = f'"{vacancy_id}"'
+            if headers.get('if-none-match') == etag:
+                return 304, None, {'ETag': etag}
+            return 200, self.vacancy(vacancy_id), {'ETag': etag}
+        return 404, {'errors': [{'type': 'not_found'}]}, {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while request_line := await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                _, target, _ = request_line.decode('latin-1').split(' ', 2)
+                status, payload, extra_headers = await self.respond(target, headers)
+                body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode()
+                head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}',
+                        'Content-Type: application/json; charset=utf-8',
+                        f'Content-Length: {len(body)}']
+                head += [f'{name}: {value}' for name, value in extra_headers.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(config: MockConfig):
+    mock = MockHeadHunter(config)
+    server = await asyncio.start_server(mock.handle, config.host, config.port)
+    async with server:
+        await server.serve_forever()
+
+
+def _serve_process(config: MockConfig):
+    asyncio.run(serve(config))
+
+
+def start_in_process(config: MockConfig, timeout: float = 10.0) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=_serve_process, args=(config,), daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((config.host, config.port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f'Mock server did not start on {config.host}:{config.port}')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = MockConfig()
+    parser.add_argument('--host', default=defaults.host)
+    parser.add_argument('--port', type=int, default=defaults.port)
+    parser.add_argument('--newest-id', type=int, default=defaults.newest_id)
+    parser.add_argument('--ids-per-second', type=float, default=defaults.ids_per_second)
+    parser.add_argument('--latency-ms', type=float, default=defaults.latency_ms)
+    parser.add_argument('--latency-sigma', type=float, default=defaults.latency_sigma)
+    parser.add_argument('--not-found-ratio', type=float, default=defaults.not_found_ratio)
+    parser.add_argument('--non-it-ratio', type=float, default=defaults.non_it_ratio)
+    parser.add_argument('--rate-limit', type=float, default=defaults.rate_limit, help='requests/sec, 0 = unlimited')
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(host=args.host, port=args.port, newest_id=args.newest_id, ids_per_second=args.ids_per_second,
+                      latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                      not_found_ratio=args.not_found_ratio, non_it_ratio=args.non_it_ratio,
+                      rate_limit=args.rate_limit)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    config = config_from_args(parser.parse_args())
+    print(f'Mock hh.ru API is listening on http://{config.host}:{config.port}')
+    asyncio.run(serve(config))
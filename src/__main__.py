@@ -1,48 +1,108 @@
+"""
+Сбор вакансий и аналитика по ним:
+
+    python -m src collect   # только сбор, без pandas и matplotlib
+    python -m src analyze   # анализы в кэш результатов CACHE_DIR, без matplotlib
+    python -m src plot      # анализы и графики в reports/plots
+    python -m src [all]     # сбор, затем анализы и графики
+"""
+import argparse
 import asyncio
 import logging
-
-import httpx
-from nest_asyncio import apply
+import os
+import signal
 
 from src.db_manager.db import Database
-from src.analytics.infographics import Infographics
-
-logging.basicConfig(level=logging.INFO)
-logging.getLogger('httpx').setLevel(logging.WARNING)
-
-apply()
-db = Database()
 
 
-async def start_collect():
-    from src.data_collector.collector import Collector
+async def start_collect(db: Database):
+    import httpx
     await db.async_connect()
     check_db = await db.create_table()
-    if check_db is None:
-        client = httpx.AsyncClient()
-        await Collector(client, db).start()
-        await client.aclose()
+    crawl_state = await db.get_crawl_state()
+    client = httpx.AsyncClient()
+    api_url = os.getenv('HH_API_URL')
+    mode = os.getenv('COLLECT_MODE', 'scan')
+    if mode == 'refresh':
+        from src.data_collector.refresher import Refresher
+        worker = Refresher(client, db, api_url=api_url)
+        run = worker.start()
     else:
-        logging.info('Database is not empty.')
+        from src.data_collector.collector import Collector
+        worker = Collector(client, db, api_url=api_url, metrics_file=os.getenv('METRICS_FILE'),
+                           report_interval=float(os.getenv('METRICS_INTERVAL', 30)))
+        if crawl_state is not None:
+            run = worker.start()
+        elif check_db is None:
+            run = worker.harvest() if mode == 'harvest' else worker.start()
+        else:
+            logging.info('Database is not empty, collecting new vacancies only.')
+            run = worker.update(overlap=int(os.getenv('COLLECT_OVERLAP', 20000)))
+    # сигналы останавливают тот объект, который действительно работает
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await run
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.remove_signal_handler(sig)
+    await client.aclose()
     await db.async_disconnect()
 
 
-def start_analytics():
+def _report(db: Database, extractor, plot: bool):
+    if plot:
+        from src.analytics.infographics import Infographics
+        Infographics(db, extractor).generate_all()
+    else:
+        results = extractor.full_analysis()
+        logging.info(f'{len(results)} analyses are ready.')
+
+
+def start_analytics(db: Database, plot: bool = True):
+    from src.analytics.cache import ResultCache
+    from src.analytics.extractor import create_extractor
     db.connect()
-    infographics = Infographics(db)
-    infographics.generate_all()
+    db.create_analytic_indexes()
+    db.create_sketches()
+    snapshot_dir = os.getenv('SNAPSHOT_DIR')
+    backend = os.getenv('ANALYTICS_BACKEND', 'snapshot' if snapshot_dir else 'sqlite')
+    cache_dir = os.getenv('CACHE_DIR', 'reports/cache')
+    cache = ResultCache(cache_dir) if cache_dir else None
+    if backend == 'sqlite':
+        with db.snapshot() as reader:
+            _report(reader, create_extractor(reader, backend, cache=cache), plot)
+    else:
+        _report(db, create_extractor(db, backend, snapshot_dir or 'reports/snapshot', cache), plot)
     db.disconnect()
 
 
-async def main():
+def main():
+    parser = argparse.ArgumentParser(prog='python -m src')
+    parser.add_argument('--db', default='db.sqlite')
+    # --db принимается и после подкоманды; SUPPRESS не даёт подкоманде затереть значение, заданное до неё
+    database = argparse.ArgumentParser(add_help=False)
+    database.add_argument('--db', default=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('collect', parents=[database], help='collect vacancies from the API')
+    commands.add_parser('analyze', parents=[database], help='compute the analyses into the result cache')
+    commands.add_parser('plot', parents=[database], help='compute the analyses and render the charts')
+    commands.add_parser('all', parents=[database], help='collect, then analyze and plot (default)')
+    args = parser.parse_args()
+    command = args.command or 'all'
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    db = Database(args.db, wal=os.getenv('SQLITE_WAL', '1') != '0')
     logging.info('Application is running...')
-    await start_collect()
-    start_analytics()
+    try:
+        if command in ('collect', 'all'):
+            asyncio.run(start_collect(db))
+        if command != 'collect':
+            start_analytics(db, plot=command != 'analyze')
+    except Exception as e:
+        print(f'Something went wrong: {str(e)}')
     logging.info('End.')
 
 
 if __name__ == '__main__':
-    try:
-        asyncio.run(main())
-    except Exception as e:
-        print(f'Something went wrong: {str(e)}')
+    main()
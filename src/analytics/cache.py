@@ -0,0 +1,134 @@
+import logging
+import os
+import pickle
+from pathlib import Path
+from typing import Callable
+
+from src.analytics.extractor import ANALYSES, Extractor
+from src.db_manager.db import Database
+
+_SUFFIX = '.pkl'
+# версия состава результатов: растёт, когда анализы получают новые столбцы, и старые файлы не читаются
+_FORMAT = 2
+
+
+class ResultCache:
+    """
+    Результаты анализов на диске: файл `<метод>@<метка данных>.pkl` в формате pickle (protocol 5),
+    DataFrame сохраняются и читаются без разбора текста. Давность использования — mtime файла:
+    при превышении `max_bytes` удаляются файлы, которые дольше всего не читали.
+    """
+
+    def __init__(self, root: str | Path = 'reports/cache', max_bytes: int = 256 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _path(self, method: str, stamp: str) -> Path:
+        return self.root / f'{method}@{stamp}{_SUFFIX}'
+
+    def get(self, method: str, stamp: str):
+        path = self._path(method, stamp)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logging.warning(f'Cached result {path.name} is unreadable and will be recomputed: {e}')
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, method: str, stamp: str, value):
+        self.root.mkdir(parents=True, exist_ok=True)
+        # результаты того же метода для других меток больше не понадобятся
+        for stale in self.root.glob(f'{method}@*{_SUFFIX}'):
+            stale.unlink(missing_ok=True)
+        path = self._path(method, stamp)
+        temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as file:
+            pickle.dump(value, file, protocol=5)
+        os.replace(temporary, path)
+        self._evict()
+
+    def _evict(self):
+        files = sorted(self.root.glob(f'*{_SUFFIX}'), key=lambda path: path.stat().st_mtime, reverse=True)
+        total = 0
+        for path in files:
+            total += path.stat().st_size
+            if total > self.max_bytes:
+                path.unlink(missing_ok=True)
+
+    def invalidate(self, method: str | None = None):
+        """Удаляет сохранённые результаты метода `method` или, без аргумента, все."""
+        for path in self.root.glob(f'{method or "*"}@*{_SUFFIX}'):
+            path.unlink(missing_ok=True)
+
+
+class CachedExtractor(Extractor):
+    """
+    `Extractor` с результатами из `ResultCache`: ключ — имя метода, `Database.data_stamp` и версия состава результатов.
+    Сам движок создаётся через `factory` только при промахе, поэтому повторный запуск
+    на неизменной базе не выгружает снимок и не выполняет запросов, кроме чтения метки.
+    """
+
+    def __init__(self, db: Database, cache: ResultCache, factory: Callable[[], Extractor]):
+        super().__init__(db)
+        self.cache = cache
+        self.stamp = f'{db.data_stamp()}.r{_FORMAT}'
+        self._factory = factory
+        self._extractor: Extractor | None = None
+
+    @property
+    def extractor(self) -> Extractor:
+        if self._extractor is None:
+            self._extractor = self._factory()
+        return self._extractor
+
+    def invalidate(self, method: str | None = None):
+        self.cache.invalidate(method)
+
+    def _cached(self, method: str):
+        result = self.cache.get(method, self.stamp)
+        if result is None:
+            result = getattr(self.extractor, method)()
+            self.cache.put(method, self.stamp, result)
+        return result
+
+    def full_analysis(self):
+        full_results = {name: self.cache.get(method, self.stamp) for name, method in ANALYSES.items()}
+        if any(result is None for result in full_results.values()):
+            # пересчитываются только устаревшие анализы; если устарели все — одним проходом движка
+            stale = [name for name, result in full_results.items() if result is None]
+            if len(stale) == len(ANALYSES):
+                full_results = self.extractor.full_analysis()
+            else:
+                full_results.update({name: getattr(self.extractor, ANALYSES[name])() for name in stale})
+            for name in stale:
+                self.cache.put(ANALYSES[name], self.stamp, full_results[name])
+        return full_results
+
+    def analyze_salaries_by_role(self):
+        return self._cached('analyze_salaries_by_role')
+
+    def analyze_salaries_by_city(self):
+        return self._cached('analyze_salaries_by_city')
+
+    def analyze_roles_count(self):
+        return self._cached('analyze_roles_count')
+
+    def analyze_salaries_by_experience(self):
+        return self._cached('analyze_salaries_by_experience')
+
+    def analyze_key_skills(self):
+        return self._cached('analyze_key_skills')
+
+    def analyze_schedule(self):
+        return self._cached('analyze_schedule')
+
+    def analyze_vacancy_dynamics(self):
+        return self._cached('analyze_vacancy_dynamics')
+
+    def analyze_employers(self):
+        return self._cached('analyze_employers')
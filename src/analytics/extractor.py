@@ -1,65 +1,105 @@
 import pandas as pd
 
+from src.analytics.sketch import percentiles
 from src.db_manager.db import Database
 
+BACKENDS = ('sqlite', 'rollup', 'streaming', 'snapshot', 'duckdb')
+# ключи результата full_analysis и методы, которые их считают
+ANALYSES = {
+    'salary_by_role': 'analyze_salaries_by_role',
+    'salary_by_city': 'analyze_salaries_by_city',
+    'roles_count': 'analyze_roles_count',
+    'salaries_by_experience': 'analyze_salaries_by_experience',
+    'key_skills': 'analyze_key_skills',
+    'schedule_analysis': 'analyze_schedule',
+    'vacancy_dynamics': 'analyze_vacancy_dynamics',
+    'employers_analysis': 'analyze_employers'
+}
+
+# группировки зарплатных анализов и их ключи
+SALARY_KEYS = {'role': ['professional_role'], 'city': ['city'], 'experience': ['experience', 'professional_role']}
+_SALARY_STATS = ['count_vacancies', 'sum_salary_bottom', 'sum_squares_bottom', 'sum_salary_top', 'sum_squares_top',
+                 'min_salary', 'max_salary', 'total_vacancies']
+
+
+def _std(total, squares, count):
+    # выборочное стандартное отклонение (ddof=1) по сумме и сумме квадратов; для одной вакансии — NaN
+    variance = ((squares - total ** 2 / count) / (count - 1)).clip(lower=0)
+    return (variance ** 0.5).where(count > 1)
+
+
+def _to_month(months: pd.Series) -> pd.Series:
+    return pd.PeriodIndex(months, freq='M').to_series(index=months.index)
+
 
 class Extractor:
     def __init__(self, db: Database):
         self._db = db
 
     def full_analysis(self):
-        salary_by_role = self.analyze_salaries_by_role()
-        salary_by_city = self.analyze_salaries_by_city()
-        roles_count = self.analyze_roles_count()
-        salaries_by_experience = self.analyze_salaries_by_experience()
-        key_skills = self.analyze_key_skills()
-        schedule_analysis = self.analyze_schedule()
-        vacancy_dynamics = self.analyze_vacancy_dynamics()
-        employers_analysis = self.analyze_employers()
-
-        full_results = {
-            'salary_by_role': salary_by_role,
-            'salary_by_city': salary_by_city,
-            'roles_count': roles_count,
-            'salaries_by_experience': salaries_by_experience,
-            'key_skills': key_skills,
-            'schedule_analysis': schedule_analysis,
-            'vacancy_dynamics': vacancy_dynamics,
-            'employers_analysis': employers_analysis
-        }
+        full_results = {name: getattr(self, method)() for name, method in ANALYSES.items()}
 
         return full_results
 
+    def _select(self, statement: str, params=()) -> list:
+        return self._db.select_for_analytics(statement, params)
+
+    def _medians(self, grouping: str, keys: list[str], groups: pd.DataFrame) -> pd.DataFrame:
+        """
+        Точные медианы нижней и верхней границы зарплаты: по одному запросу `get_median_by_{grouping}`
+        на группу из `groups` (столбцы `keys` и count_vacancies), строки группы читаются из индекса.
+        """
+        medians = []
+        for row in groups[keys + ['count_vacancies']].itertuples(index=False):
+            count = row[-1]
+            params = dict(zip(keys, row), median_limit=2 - count % 2, median_offset=(count - 1) // 2)
+            medians += self._select(f'get_median_by_{grouping}', params)
+        return pd.DataFrame(medians, columns=['median_salary_bottom', 'median_salary_top'], dtype=float)
+
+    def _salary_summary(self, grouping: str, keys: list[str]) -> pd.DataFrame:
+        """
+        Статистика зарплат по группам `keys`: из базы приходит по одной строке агрегатов на группу
+        (`get_salary_by_{grouping}`), медианы — из `_medians`.
+        """
+        stats = pd.DataFrame(self._select(f'get_salary_by_{grouping}'), columns=keys + _SALARY_STATS)
+        medians = self._medians(grouping, keys, stats)
+        count = stats['count_vacancies']
+        summary = stats[keys].copy()
+        summary['avg_salary_bottom'] = stats['sum_salary_bottom'] / count
+        summary['avg_salary_top'] = stats['sum_salary_top'] / count
+        summary['median_salary_bottom'] = medians['median_salary_bottom']
+        summary['median_salary_top'] = medians['median_salary_top']
+        summary['min_salary'] = stats['min_salary']
+        summary['max_salary'] = stats['max_salary']
+        summary['std_salary_bottom'] = _std(stats['sum_salary_bottom'], stats['sum_squares_bottom'], count)
+        summary['std_salary_top'] = _std(stats['sum_salary_top'], stats['sum_squares_top'], count)
+        summary['count_vacancies'] = count
+        summary['total_vacancies'] = stats['total_vacancies']
+        return summary
+
+    def salary_percentiles(self, grouping: str, since: str | None = None, until: str | None = None) -> pd.DataFrame:
+        """
+        p10/p25/p50/p75/p90 нижней и верхней границы зарплаты по группам `grouping` ('role', 'city'
+        или 'experience') за месяцы с `since` по `until` включительно ('YYYY-MM', None — без границы).
+        Считаются по скетчам salary_sketches: помесячные скетчи групп складываются без чтения вакансий,
+        относительная погрешность — не больше SKETCH_ACCURACY.
+        """
+        keys = SALARY_KEYS[grouping]
+        sketch = pd.DataFrame(self._select(f'get_sketch_by_{grouping}', {'since': since, 'until': until}),
+                              columns=keys + ['bucket', 'count_bottom', 'count_top'])
+        return percentiles(sketch, keys)
+
+    def _with_percentiles(self, grouping: str, summary: pd.DataFrame) -> pd.DataFrame:
+        return summary.merge(self.salary_percentiles(grouping), on=SALARY_KEYS[grouping], how='left')
+
     def analyze_salaries_by_role(self):
         """
         Задача 1. Анализ уровня заработных плат по направлениям (`professional_role`)
         :return:
         pd.DataFrame: DataFrame, содержащий статистику зарплат, сгруппированную по профессиональным ролям,
-                      включая долю вакансий с указанными зарплатами.
+                      включая долю вакансий с указанными зарплатами и перцентили p10–p90 по скетчам.
         """
-        raw_data = self._db.select_for_analytics('get_salary_by_role')
-
-        df = pd.DataFrame(raw_data, columns=['professional_role', 'salary_bottom', 'salary_top', 'currency',
-                                             'total_vacancies'])
-        for col in ['professional_role', 'salary_bottom', 'salary_top', 'currency']:
-            df[col] = df[col].str.strip('"')
-        df['salary_bottom'] = df['salary_bottom'].astype(float)
-        df['salary_top'] = df['salary_top'].astype(float)
-
-        summary = df.groupby('professional_role').agg(
-            avg_salary_bottom=('salary_bottom', 'mean'),
-            avg_salary_top=('salary_top', 'mean'),
-            median_salary_bottom=('salary_bottom', 'median'),
-            median_salary_top=('salary_top', 'median'),
-            min_salary=('salary_bottom', 'min'),
-            max_salary=('salary_top', 'max'),
-            std_salary_bottom=('salary_bottom', 'std'),
-            std_salary_top=('salary_top', 'std'),
-            count_vacancies=('salary_bottom', 'count')
-        ).reset_index()
-
-        summary = summary.merge(df[['professional_role', 'total_vacancies']].drop_duplicates(), on='professional_role',
-                                how='left')
+        summary = self._with_percentiles('role', self._salary_summary('role', SALARY_KEYS['role']))
         summary['with_salary'] = summary['count_vacancies'] / summary['total_vacancies']
 
         return summary
@@ -69,30 +109,9 @@ class Extractor:
         Задача 2. Анализ зарплатных ожиданий по городам (`city`)
         :return:
         pd.DataFrame: DataFrame, содержащий статистику зарплат, сгруппированную по городам,
-                      включая долю вакансий с указанными зарплатами.
+                      включая долю вакансий с указанными зарплатами и перцентили p10–p90 по скетчам.
         """
-        raw_data = self._db.select_for_analytics('get_salary_by_city')
-
-        df = pd.DataFrame(raw_data, columns=['city', 'salary_bottom', 'salary_top', 'currency', 'total_vacancies'])
-        for col in ['city', 'salary_bottom', 'salary_top', 'currency']:
-            df[col] = df[col].str.strip('"')
-
-        df['salary_bottom'] = df['salary_bottom'].astype(float)
-        df['salary_top'] = df['salary_top'].astype(float)
-
-        summary = df.groupby('city').agg(
-            avg_salary_bottom=('salary_bottom', 'mean'),
-            avg_salary_top=('salary_top', 'mean'),
-            median_salary_bottom=('salary_bottom', 'median'),   # ← ДОБАВЛЕНО
-            median_salary_top=('salary_top', 'median'),         # ← ДОБАВЛЕНО
-            min_salary=('salary_bottom', 'min'),
-            max_salary=('salary_top', 'max'),
-            std_salary_bottom=('salary_bottom', 'std'),
-            std_salary_top=('salary_top', 'std'),
-            count_vacancies=('salary_bottom', 'count')
-        ).reset_index()
-
-        summary = summary.merge(df[['city', 'total_vacancies']].drop_duplicates(), on='city', how='left')
+        summary = self._with_percentiles('city', self._salary_summary('city', SALARY_KEYS['city']))
         summary['with_salary'] = summary['count_vacancies'] / summary['total_vacancies']
 
         return summary
@@ -103,11 +122,9 @@ class Extractor:
         :return:
         pd.DataFrame: DataFrame, содержащий количество и долю вакансий, сгруппированных по профессиональным ролям.
         """
-        raw_data = self._db.select_for_analytics('get_roles_count')
+        raw_data = self._select('get_roles_count')
 
         df = pd.DataFrame(raw_data, columns=['professional_role', 'count_vacancies'])
-        for col in ['professional_role']:
-            df[col] = df[col].str.strip('"')
 
         total_vacancies = df['count_vacancies'].sum()
         df['share'] = df['count_vacancies'] / total_vacancies
@@ -119,33 +136,11 @@ class Extractor:
         Задача 4. Анализ опыта работы (`experience`) и его влияния на зарплату
         :return:
         pd.DataFrame: DataFrame, содержащий статистику зарплат, сгруппированную по категориям опыта
-                      и профессиональным ролям, включая общее количество вакансий и вакансии с указанными зарплатами.
+                      и профессиональным ролям, включая общее количество вакансий и вакансии с указанными зарплатами
+                      и перцентили p10–p90 по скетчам.
         """
-        raw_data = self._db.select_for_analytics('get_salary_by_experience')
-
-        df = pd.DataFrame(raw_data,
-                          columns=['experience', 'professional_role', 'salary_bottom', 'salary_top', 'currency',
-                                   'total_vacancies'])
-        for col in ['experience', 'professional_role', 'salary_bottom', 'salary_top', 'currency']:
-            df[col] = df[col].str.strip('"')
-
-        df['salary_bottom'] = df['salary_bottom'].astype(float)
-        df['salary_top'] = df['salary_top'].astype(float)
-
-        summary = df.groupby(['experience', 'professional_role']).agg(
-            avg_salary_bottom=('salary_bottom', 'mean'),
-            avg_salary_top=('salary_top', 'mean'),
-            median_salary_bottom=('salary_bottom', 'median'),   # ← ДОБАВЛЕНО
-            median_salary_top=('salary_top', 'median'),         # ← ДОБАВЛЕНО
-            min_salary=('salary_bottom', 'min'),
-            max_salary=('salary_top', 'max'),
-            std_salary_bottom=('salary_bottom', 'std'),
-            std_salary_top=('salary_top', 'std'),
-            count_vacancies=('salary_bottom', 'count')
-        ).reset_index()
-
-        summary = summary.merge(df[['experience', 'professional_role', 'total_vacancies']].drop_duplicates(),
-                                on=['experience', 'professional_role'], how='left')
+        summary = self._with_percentiles('experience',
+                                         self._salary_summary('experience', SALARY_KEYS['experience']))
 
         return summary
 
@@ -157,21 +152,10 @@ class Extractor:
             - overall: DataFrame с частотой встречаемости ключевых навыков.
             - by_role: DataFrame с частотой встречаемости ключевых навыков по профессиональным ролям.
         """
-        raw_data = self._db.select_for_analytics('get_key_skills')
-
-        df = pd.DataFrame(raw_data, columns=['professional_role', 'key_skills'])
-        for col in ['professional_role', 'key_skills']:
-            df[col] = df[col].str.strip('"')
-
-        df['key_skills'] = df['key_skills'].str.split(',')
-        df = df.explode('key_skills')
-        df['key_skills'] = df['key_skills'].str.strip()
-        df = df[df['key_skills'] != '']
-
-        skill_counts = df['key_skills'].value_counts().reset_index()
-        skill_counts.columns = ['skill', 'frequency']
-
-        role_skill_counts = df.groupby(['professional_role', 'key_skills']).size().reset_index(name='frequency')
+        skill_counts = pd.DataFrame(self._select('get_skill_frequency'),
+                                    columns=['skill', 'frequency'])
+        role_skill_counts = pd.DataFrame(self._select('get_skills_by_role'),
+                                         columns=['professional_role', 'key_skills', 'frequency'])
 
         return {
             'overall': skill_counts,
@@ -187,41 +171,20 @@ class Extractor:
             - avg_salary_by_schedule: DataFrame со средними зарплатами по типам графика работы.
             - schedule_dynamics: DataFrame с динамикой популярности типов графика работы по месяцам.
         """
-        raw_data = self._db.select_for_analytics('get_schedule_analysis')
-
-        df = pd.DataFrame(raw_data, columns=['schedule', 'salary_bottom', 'salary_top', 'currency',
-                                             'published_at', 'total_vacancies'])
-        for col in ['schedule', 'salary_bottom', 'salary_top', 'currency', 'published_at']:
-            df[col] = df[col].str.strip('"')
-
-        df['salary_bottom'] = df['salary_bottom'].replace('None', None).astype(float)
-        df['salary_top'] = df['salary_top'].replace('None', None).astype(float)
-        df['published_at'] = pd.to_datetime(df['published_at']).dt.tz_localize(None)
-
         # 1
-        schedule_shares = (
-            df.groupby('schedule')['total_vacancies']
-            .first()
-            .reset_index()
-        )
+        schedule_shares = pd.DataFrame(self._select('get_schedule_shares'),
+                                       columns=['schedule', 'total_vacancies'])
         total_vacancies = schedule_shares['total_vacancies'].sum()
         schedule_shares['share'] = schedule_shares['total_vacancies'] / total_vacancies
 
         # 2
-        df_with_salary = df.dropna(subset=['salary_bottom', 'salary_top'])
-        df_with_salary = df_with_salary[df_with_salary['currency'] == 'RUR']
-        avg_salary_by_schedule = df_with_salary.groupby('schedule').agg(
-            avg_salary_bottom=('salary_bottom', 'mean'),
-            avg_salary_top=('salary_top', 'mean')
-        ).reset_index()
+        avg_salary_by_schedule = pd.DataFrame(self._select('get_salary_by_schedule'),
+                                              columns=['schedule', 'avg_salary_bottom', 'avg_salary_top'])
 
         # 3
-        df['month'] = df['published_at'].dt.to_period('M')
-        schedule_dynamics = (
-            df.groupby(['month', 'schedule'])
-            .size()
-            .reset_index(name='count')
-        )
+        schedule_dynamics = pd.DataFrame(self._select('get_schedule_dynamics'),
+                                         columns=['month', 'schedule', 'count'])
+        schedule_dynamics['month'] = _to_month(schedule_dynamics['month'])
         return {
             'schedule_shares': schedule_shares,
             'avg_salary_by_schedule': avg_salary_by_schedule,
@@ -236,30 +199,13 @@ class Extractor:
             - monthly_summary: DataFrame с ежемесячной статистикой (средние зарплаты, количество вакансий).
             - role_monthly_summary: DataFrame с ежемесячной статистикой по ролям.
         """
-        raw_data = self._db.select_for_analytics('get_vacancy_dynamics')
-
-        df = pd.DataFrame(raw_data,
-                          columns=['published_at', 'salary_bottom', 'salary_top', 'currency',
-                                   'professional_role'])
-        for col in ['published_at', 'salary_bottom', 'salary_top', 'currency', 'professional_role']:
-            df[col] = df[col].str.strip('"')
-
-        df['published_at'] = pd.to_datetime(df['published_at']).dt.tz_localize(None)
-        df['salary_bottom'] = df['salary_bottom'].replace('None', None).astype(float)
-        df['salary_top'] = df['salary_top'].replace('None', None).astype(float)
+        role_monthly_summary = pd.DataFrame(self._select('get_role_dynamics'),
+                                            columns=['month', 'professional_role', 'count'])
+        role_monthly_summary['month'] = _to_month(role_monthly_summary['month'])
 
-        df['month'] = df['published_at'].dt.to_period('M')
-
-        role_monthly_summary = df.groupby(['month', 'professional_role']).size().reset_index(name='count')
-
-        df = df[df['currency'] == 'RUR']
-        df = df.dropna(subset=['salary_bottom', 'salary_top'])
-
-        monthly_summary = df.groupby('month').agg(
-            avg_salary_bottom=('salary_bottom', 'mean'),
-            avg_salary_top=('salary_top', 'mean'),
-            count_vacancies=('salary_bottom', 'count')
-        ).reset_index()
+        monthly_summary = pd.DataFrame(self._select('get_monthly_salary'),
+                                       columns=['month', 'avg_salary_bottom', 'avg_salary_top', 'count_vacancies'])
+        monthly_summary['month'] = _to_month(monthly_summary['month'])
 
         return {
             'monthly_summary': monthly_summary,
@@ -276,50 +222,49 @@ class Extractor:
             - skill_counts_by_employer: DataFrame с частотой встречаемости ключевых навыков,
                                          где компании перечислены через запятую для каждого навыка.
         """
-        raw_data = self._db.select_for_analytics('get_employer_analysis')
-
-        df = pd.DataFrame(raw_data, columns=['employer_name', 'professional_role', 'key_skills',
-                                             'salary_bottom', 'salary_top', 'currency'])
-        for col in ['employer_name', 'professional_role', 'key_skills',
-                    'salary_bottom', 'salary_top', 'currency']:
-            df[col] = df[col].str.strip('"')
-
-        df['salary_bottom'] = df['salary_bottom'].replace('None', None).astype(float)
-        df['salary_top'] = df['salary_top'].replace('None', None).astype(float)
-        df_with_salary = df.dropna(subset=['salary_bottom', 'salary_top'])
-        df_with_salary = df_with_salary[df_with_salary['currency'] == 'RUR']
-
         # 1. top 10
-        top_employers = df['employer_name'].value_counts().reset_index()
-        top_employers.columns = ['employer_name', 'vacancy_count']
-        top_employers = top_employers.head(10)
+        top_employers = pd.DataFrame(self._select('get_top_employers'),
+                                     columns=['employer_name', 'vacancy_count'])
         # 2
-        employer_salary_summary = df_with_salary.groupby('employer_name').agg(
-            avg_salary_bottom=('salary_bottom', 'mean'),
-            avg_salary_top=('salary_top', 'mean'),
-            count_vacancies=('salary_bottom', 'count')
-        ).reset_index()
+        employer_salary_summary = pd.DataFrame(self._select('get_salary_by_employer'),
+                                               columns=['employer_name', 'avg_salary_bottom', 'avg_salary_top',
+                                                        'count_vacancies'])
 
         # 3
-        df['key_skills'] = df['key_skills'].str.split(',')
-        df = df.explode('key_skills')
-        df['key_skills'] = df['key_skills'].str.strip()
-        df = df[df['key_skills'] != '']
-        df = df[df['key_skills'] != 'None']
-        skill_counts_by_employer = (
-            df.groupby('key_skills')['employer_name']
-            .agg(
-                companies=lambda x: ', '.join(x.unique()),
-                frequency='size'
-            )
-            .reset_index()
-        )
-        skill_counts_by_employer = skill_counts_by_employer.sort_values(
-            by='frequency', ascending=False
-        ).reset_index(drop=True)
+        skill_counts_by_employer = pd.DataFrame(self._select('get_skills_by_employer'),
+                                                columns=['key_skills', 'companies', 'frequency'])
 
         return {
             'top_employers': top_employers,
             'employer_salary_summary': employer_salary_summary,
             'skill_counts_by_employer': skill_counts_by_employer
         }
+
+
+def create_extractor(db: Database, backend: str = 'sqlite', snapshot_dir: str = 'reports/snapshot',
+                     cache=None) -> Extractor:
+    """
+    Выбор движка аналитики: 'sqlite' — агрегирующие запросы к базе, 'rollup' — запросы к инкрементально
+    обновляемой сводке vacancy_rollups (нужно соединение на запись), 'streaming' — построчное чтение
+    пачками с частичными агрегатами в ограниченной памяти, 'snapshot' — pandas поверх
+    колоночного снимка, 'duckdb' — встроенный DuckDB поверх того же снимка (нужен пакет duckdb).
+    С `cache` (`ResultCache`) результаты берутся с диска, а движок создаётся только при промахе.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown analytics backend {backend!r}, expected one of: {", ".join(BACKENDS)}')
+    if cache is not None:
+        from src.analytics.cache import CachedExtractor
+        return CachedExtractor(db, cache, lambda: create_extractor(db, backend, snapshot_dir))
+    if backend == 'sqlite':
+        return Extractor(db)
+    if backend == 'rollup':
+        from src.analytics.rollup import RollupExtractor
+        return RollupExtractor(db)
+    if backend == 'streaming':
+        from src.analytics.streaming import StreamingExtractor
+        return StreamingExtractor(db)
+    if backend == 'snapshot':
+        from src.analytics.snapshot import SnapshotExtractor
+        return SnapshotExtractor(db, snapshot_dir)
+    from src.analytics.olap import DuckDBExtractor
+    return DuckDBExtractor(db, snapshot_dir)
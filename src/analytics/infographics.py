@@ -1,176 +1,353 @@
+import hashlib
+import json
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import matplotlib
 import pandas as pd
+import seaborn as sns
+from cycler import cycler
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from wordcloud import WordCloud
 
 from src.analytics.extractor import Extractor
 
-sns.set(style="whitegrid")
-plt.rcParams.update({'font.size': 10})
 
-os.makedirs("reports/plots", exist_ok=True)
+_MANIFEST = '.hashes.json'
+_SOURCE_HASH = hashlib.sha256(Path(__file__).read_bytes()).digest()
+
+_EXPERIENCE_LABELS = {
+    'noExperience': 'Нет опыта',
+    'between1And3': '1–3 года',
+    'between3And6': '3–6 лет',
+    'moreThan6': 'Более 6 лет',
+}
+_SCHEDULE_LABELS = {
+    'fullDay': 'Полный день',
+    'remote': 'Удалёнка',
+    'flexible': 'Гибкий',
+    'shift': 'Сменный',
+    'flyInFlyOut': 'Вахта'
+}
+
+
+def _theme() -> dict:
+    # то же, что sns.set(style="whitegrid") и font.size 10, но только на время отрисовки:
+    # импорт модуля не меняет глобальные rcParams
+    return {
+        **sns.plotting_context('notebook'),
+        **sns.axes_style('whitegrid'),
+        'axes.prop_cycle': cycler(color=sns.color_palette('deep')),
+        'font.family': 'sans-serif',
+        'font.size': 10,
+    }
+
+
+def _figure(width: float, height: float) -> Figure:
+    # отдельный Figure с холстом Agg: без глобального состояния pyplot и без GUI-бэкенда
+    figure = Figure(figsize=(width, height))
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def _save(figure: Figure, path: str):
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def _barplot(ax, data: pd.DataFrame, x: str, y: str, palette: str):
+    # цвет по категории без легенды — то же, что palette без hue в прежних версиях seaborn
+    category = y if data[y].dtype == object else x
+    sns.barplot(data=data, x=x, y=y, hue=category, palette=palette, legend=False, ax=ax)
+
+
+def _render_salary_by_role(top: pd.DataFrame, path: str):
+    figure = _figure(12, 8)
+    ax = figure.subplots()
+    _barplot(ax, top, x='avg_salary', y='professional_role', palette="viridis")
+    ax.set_title("Средняя зарплата по IT-направлениям (ТОП-15)")
+    ax.set_xlabel("Средняя зарплата (RUB)")
+    _save(figure, path)
+
+
+def _render_salary_by_city(top: pd.DataFrame, path: str):
+    figure = _figure(10, 6)
+    ax = figure.subplots()
+    _barplot(ax, top, x='avg_salary', y='city', palette="magma")
+    ax.set_title("ТОП-10 городов по средней зарплате")
+    ax.set_xlabel("Средняя зарплата (RUB)")
+    _save(figure, path)
+
+
+def _render_roles_count(data: tuple[pd.DataFrame, pd.DataFrame], path: str):
+    top, pie_data = data
+    figure = _figure(16, 6)
+    ax = figure.subplots(1, 2)
+    _barplot(ax[0], top, x='count_vacancies', y='professional_role', palette="Blues_d")
+    ax[0].set_title("Количество вакансий по направлениям (ТОП-15)")
+    ax[1].pie(pie_data['count_vacancies'], labels=pie_data['professional_role'], autopct='%1.1f%%')
+    ax[1].set_title("Доля направлений")
+    _save(figure, path)
+
+
+def _render_salaries_by_experience(summary: pd.DataFrame, path: str):
+    figure = _figure(10, 6)
+    ax = figure.subplots()
+    _barplot(ax, summary, x='experience', y='avg_salary', palette="rocket")
+    ax.set_title("Средняя зарплата в зависимости от опыта")
+    ax.set_xlabel("Уровень опыта")
+    ax.set_ylabel("Средняя зарплата (RUB)")
+    ax.set_xticks(range(len(summary)), labels=[_EXPERIENCE_LABELS[level] for level in summary['experience']])
+    _save(figure, path)
+
+
+def _render_key_skills_bar(overall: pd.DataFrame, path: str):
+    figure = _figure(12, 8)
+    ax = figure.subplots()
+    _barplot(ax, overall, x='frequency', y='skill', palette="cividis")
+    ax.set_title("ТОП-20 самых востребованных навыков")
+    ax.set_xlabel("Частота упоминания")
+    _save(figure, path)
+
+
+def _render_key_skills_wordcloud(word_freq: dict, path: str):
+    wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(word_freq)
+    figure = _figure(10, 5)
+    ax = figure.subplots()
+    ax.imshow(wordcloud, interpolation='bilinear')
+    ax.axis("off")
+    ax.set_title("Облако популярных навыков")
+    _save(figure, path)
+
+
+def _render_schedule_pie(dist: pd.DataFrame, path: str):
+    figure = _figure(8, 8)
+    ax = figure.subplots()
+    ax.pie(dist['share'], labels=dist['label'], autopct='%1.1f%%')
+    ax.set_title("Доля форматов работы")
+    _save(figure, path)
+
+
+def _render_schedule_salary(salary: pd.DataFrame, path: str):
+    figure = _figure(10, 5)
+    ax = figure.subplots()
+    _barplot(ax, salary, x='label', y='avg_salary', palette="Spectral")
+    ax.set_title("Средняя зарплата по типу графика")
+    ax.set_xlabel("")
+    ax.set_ylabel("Средняя зарплата (RUB)")
+    ax.tick_params(axis='x', rotation=15)
+    _save(figure, path)
+
+
+def _render_vacancy_dynamics(monthly: pd.DataFrame, path: str):
+    figure = _figure(12, 6)
+    ax1 = figure.subplots()
+    sns.lineplot(data=monthly, x='month', y='count_vacancies', color='blue', marker='o', ax=ax1)
+    ax1.set_ylabel("Количество вакансий", color='blue')
+    ax1.tick_params(axis='y', labelcolor='blue')
+    ax1.tick_params(axis='x', rotation=45)
+    ax2 = ax1.twinx()
+    sns.lineplot(data=monthly, x='month', y='avg_salary_bottom', color='red', marker='s', ax=ax2)
+    ax2.set_ylabel("Средняя зарплата (RUB)", color='red')
+    ax2.tick_params(axis='y', labelcolor='red')
+    ax1.set_title("Динамика вакансий и зарплат по месяцам")
+    _save(figure, path)
+
+
+def _render_top_employers(top: pd.DataFrame, path: str):
+    figure = _figure(10, 8)
+    ax = figure.subplots()
+    _barplot(ax, top, x='vacancy_count', y='employer_name', palette="crest")
+    ax.set_title("ТОП-10 работодателей по числу вакансий")
+    ax.set_xlabel("Количество вакансий")
+    _save(figure, path)
+
+
+def _with_avg_salary(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(avg_salary=(df['avg_salary_bottom'] + df['avg_salary_top']) / 2)
+
+
+def _prepare_roles_count(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    top7 = df.nlargest(7, 'count_vacancies')
+    others = pd.DataFrame({
+        'professional_role': ['Остальные'],
+        'count_vacancies': [df['count_vacancies'].sum() - top7['count_vacancies'].sum()]
+    })
+    pie_data = pd.concat([top7[['professional_role', 'count_vacancies']], others], ignore_index=True)
+    return df.nlargest(15, 'count_vacancies'), pie_data
+
+
+def _prepare_salaries_by_experience(df: pd.DataFrame) -> pd.DataFrame:
+    df = _with_avg_salary(df)
+    df['experience'] = pd.Categorical(df['experience'], categories=list(_EXPERIENCE_LABELS), ordered=True)
+    return df.groupby('experience', observed=True)['avg_salary'].mean().reset_index()
+
+
+def _prepare_key_skills_wordcloud(skill_data: dict) -> dict:
+    overall = skill_data['overall'].head(20)
+    return dict(zip(overall['skill'], overall['frequency']))
+
+
+def _with_schedule_label(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(label=df['schedule'].map(_SCHEDULE_LABELS).fillna(df['schedule']))
+
+
+@dataclass(frozen=True)
+class _Chart:
+    analysis: str
+    prepare: Callable
+    render: Callable
+
+
+# график -> (ключ full_analysis, подготовка данных в основном процессе, отрисовка в пуле);
+# имя графика — имя его файла в каталоге отчёта
+_CHARTS = {
+    'salary_by_role': _Chart(
+        'salary_by_role', lambda df: _with_avg_salary(df).nlargest(15, 'avg_salary'), _render_salary_by_role),
+    'salary_by_city': _Chart(
+        'salary_by_city', lambda df: _with_avg_salary(df).nlargest(10, 'avg_salary'), _render_salary_by_city),
+    'roles_count': _Chart('roles_count', _prepare_roles_count, _render_roles_count),
+    'salaries_by_experience': _Chart(
+        'salaries_by_experience', _prepare_salaries_by_experience, _render_salaries_by_experience),
+    'key_skills_bar': _Chart('key_skills', lambda data: data['overall'].head(20), _render_key_skills_bar),
+    'key_skills_wordcloud': _Chart('key_skills', _prepare_key_skills_wordcloud, _render_key_skills_wordcloud),
+    'schedule_pie': _Chart(
+        'schedule_analysis', lambda data: _with_schedule_label(data['schedule_shares']), _render_schedule_pie),
+    'schedule_salary': _Chart(
+        'schedule_analysis',
+        lambda data: _with_schedule_label(_with_avg_salary(data['avg_salary_by_schedule'])),
+        _render_schedule_salary),
+    'vacancy_dynamics': _Chart(
+        'vacancy_dynamics',
+        lambda data: data['monthly_summary'].assign(month=data['monthly_summary']['month'].dt.to_timestamp()),
+        _render_vacancy_dynamics),
+    'top_employers': _Chart('employers_analysis', lambda data: data['top_employers'], _render_top_employers),
+}
+
+
+def _draw(name: str, data, path: str):
+    with matplotlib.rc_context(_theme()):
+        _CHARTS[name].render(data, path)
+
+
+def _feed(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.dtypes.items())).encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _feed(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def _data_hash(name: str, data) -> str:
+    """Хэш входных данных графика вместе с исходником модуля: правка отрисовки тоже перерисовывает графики."""
+    digest = hashlib.sha256(_SOURCE_HASH + name.encode())
+    _feed(digest, data)
+    return digest.hexdigest()
 
 
 class Infographics:
-    """Класс для визуализации результатов аналитики."""
+    """
+    Класс для визуализации результатов аналитики.
+    Данные каждого графика готовятся в основном процессе, отрисовка идёт в пуле процессов
+    (`workers`, по умолчанию число CPU). График, у которого не изменился хэш входных данных
+    и есть файл, не перерисовывается; хэши хранятся в `.hashes.json` каталога `output_dir`.
+    """
+
+    def __init__(self, db, extractor: Extractor | None = None, output_dir: str | Path = 'reports/plots',
+                 workers: int | None = None):
+        self.ex = extractor or Extractor(db)
+        self.output_dir = Path(output_dir)
+        self.workers = workers or os.cpu_count() or 1
+
+    def _load_hashes(self) -> dict:
+        try:
+            with open(self.output_dir / _MANIFEST, encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_hashes(self, hashes: dict):
+        path = self.output_dir / _MANIFEST
+        temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(hashes, file, indent=2, sort_keys=True)
+        os.replace(temporary, path)
+
+    def _render(self, prepared: dict) -> int:
+        """Отрисовывает графики `{имя: подготовленные данные}` с изменившимися данными, возвращает их число."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        hashes = self._load_hashes()
+        jobs = {}
+        for name, data in prepared.items():
+            data_hash = _data_hash(name, data)
+            path = self.output_dir / f'{name}.png'
+            if hashes.get(name) != data_hash or not path.exists():
+                jobs[name] = (data_hash, data, str(path))
+
+        try:
+            if len(jobs) > 1 and self.workers > 1:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                    futures = {name: pool.submit(_draw, name, data, path)
+                               for name, (_, data, path) in jobs.items()}
+                    for name, future in futures.items():
+                        future.result()
+                        hashes[name] = jobs[name][0]
+            else:
+                for name, (data_hash, data, path) in jobs.items():
+                    _draw(name, data, path)
+                    hashes[name] = data_hash
+        finally:
+            self._save_hashes(hashes)
+        return len(jobs)
 
-    def __init__(self, db):
-        self.ex = Extractor(db)
+    def _plot(self, analysis: str, result):
+        self._render({name: chart.prepare(result) for name, chart in _CHARTS.items() if chart.analysis == analysis})
 
     def plot_salary_by_role(self, df: pd.DataFrame):
         """Задача 1: Зарплаты по направлениям"""
-        df['avg_salary'] = (df['avg_salary_bottom'] + df['avg_salary_top']) / 2
-        top = df.nlargest(15, 'avg_salary')
-        plt.figure(figsize=(12, 8))
-        sns.barplot(data=top, y='professional_role', x='avg_salary', palette="viridis")
-        plt.title("Средняя зарплата по IT-направлениям (ТОП-15)")
-        plt.xlabel("Средняя зарплата (RUB)")
-        plt.tight_layout()
-        plt.savefig("reports/plots/salary_by_role.png")
-        plt.close()
+        self._plot('salary_by_role', df)
 
     def plot_salary_by_city(self, df: pd.DataFrame):
         """Задача 2: Зарплаты по городам"""
-        df['avg_salary'] = (df['avg_salary_bottom'] + df['avg_salary_top']) / 2
-        top = df.nlargest(10, 'avg_salary')
-        plt.figure(figsize=(10, 6))
-        sns.barplot(data=top, y='city', x='avg_salary', palette="magma")
-        plt.title("ТОП-10 городов по средней зарплате")
-        plt.xlabel("Средняя зарплата (RUB)")
-        plt.tight_layout()
-        plt.savefig("reports/plots/salary_by_city.png")
-        plt.close()
+        self._plot('salary_by_city', df)
 
     def plot_roles_count(self, df: pd.DataFrame):
         """Задача 3: Востребованность направлений"""
-        top = df.nlargest(15, 'count_vacancies')
-        fig, ax = plt.subplots(1, 2, figsize=(16, 6))
-        sns.barplot(data=top, y='professional_role', x='count_vacancies', ax=ax[0], palette="Blues_d")
-        ax[0].set_title("Количество вакансий по направлениям (ТОП-15)")
-
-        top7 = df.nlargest(7, 'count_vacancies')
-        others = pd.DataFrame({
-            'professional_role': ['Остальные'],
-            'count_vacancies': [df['count_vacancies'].sum() - top7['count_vacancies'].sum()]
-        })
-        pie_data = pd.concat([top7, others])
-        ax[1].pie(pie_data['count_vacancies'], labels=pie_data['professional_role'], autopct='%1.1f%%')
-        ax[1].set_title("Доля направлений")
-        plt.tight_layout()
-        plt.savefig("reports/plots/roles_count.png")
-        plt.close()
+        self._plot('roles_count', df)
 
     def plot_salaries_by_experience(self, df: pd.DataFrame):
         """Задача 4: Опыт vs зарплата"""
-        df['avg_salary'] = (df['avg_salary_bottom'] + df['avg_salary_top']) / 2
-        exp_order = ['noExperience', 'between1And3', 'between3And6', 'moreThan6']
-        df['experience'] = pd.Categorical(df['experience'], categories=exp_order, ordered=True)
-        summary = df.groupby('experience', observed=True)['avg_salary'].mean().reset_index()
-        plt.figure(figsize=(10, 6))
-        sns.barplot(data=summary, x='experience', y='avg_salary', palette="rocket")
-        plt.title("Средняя зарплата в зависимости от опыта")
-        plt.xlabel("Уровень опыта")
-        plt.ylabel("Средняя зарплата (RUB)")
-        plt.xticks(ticks=[0,1,2,3], labels=['Нет опыта', '1–3 года', '3–6 лет', 'Более 6 лет'])
-        plt.tight_layout()
-        plt.savefig("reports/plots/salaries_by_experience.png")
-        plt.close()
+        self._plot('salaries_by_experience', df)
 
     def plot_key_skills(self, skill_data: dict):
         """Задача 5: Навыки"""
-        overall = skill_data['overall'].head(20)
-        plt.figure(figsize=(12, 8))
-        sns.barplot(data=overall, y='skill', x='frequency', palette="cividis")
-        plt.title("ТОП-20 самых востребованных навыков")
-        plt.xlabel("Частота упоминания")
-        plt.tight_layout()
-        plt.savefig("reports/plots/key_skills_bar.png")
-        plt.close()
-
-        word_freq = dict(zip(overall['skill'], overall['frequency']))
-        wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(word_freq)
-        plt.figure(figsize=(10, 5))
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.axis("off")
-        plt.title("Облако популярных навыков")
-        plt.tight_layout()
-        plt.savefig("reports/plots/key_skills_wordcloud.png")
-        plt.close()
+        self._plot('key_skills', skill_data)
 
     def plot_schedule_analysis(self, schedule_data: dict):
         """Задача 6: График работы"""
-        dist = schedule_data['distribution']
-        salary = schedule_data['salary_summary']
-
-        labels_map = {
-            'fullDay': 'Полный день',
-            'remote': 'Удалёнка',
-            'flexible': 'Гибкий',
-            'shift': 'Сменный',
-            'flyInFlyOut': 'Вахта'
-        }
-
-        dist['label'] = dist['schedule'].map(labels_map).fillna(dist['schedule'])
-        plt.figure(figsize=(8, 8))
-        plt.pie(dist['share'], labels=dist['label'], autopct='%1.1f%%')
-        plt.title("Доля форматов работы")
-        plt.tight_layout()
-        plt.savefig("reports/plots/schedule_pie.png")
-        plt.close()
-
-        salary['avg_salary'] = (salary['avg_salary_bottom'] + salary['avg_salary_top']) / 2
-        salary['label'] = salary['schedule'].map(labels_map).fillna(salary['schedule'])
-        plt.figure(figsize=(10, 5))
-        sns.barplot(data=salary, x='label', y='avg_salary', palette="Spectral")
-        plt.title("Средняя зарплата по типу графика")
-        plt.xlabel("")
-        plt.ylabel("Средняя зарплата (RUB)")
-        plt.xticks(rotation=15)
-        plt.tight_layout()
-        plt.savefig("reports/plots/schedule_salary.png")
-        plt.close()
+        self._plot('schedule_analysis', schedule_data)
 
     def plot_vacancy_dynamics(self, dynamics: dict):
         """Задача 7: Динамика публикаций"""
-        monthly = dynamics['monthly_summary']
-        monthly['month'] = monthly['month'].astype(str)
-        plt.figure(figsize=(12, 6))
-        ax1 = sns.lineplot(data=monthly, x='month', y='count_vacancies', color='blue', marker='o')
-        ax1.set_ylabel("Количество вакансий", color='blue')
-        ax1.tick_params(axis='y', labelcolor='blue')
-        ax2 = ax1.twinx()
-        sns.lineplot(data=monthly, x='month', y='avg_salary_bottom', color='red', marker='s', ax=ax2)
-        ax2.set_ylabel("Средняя зарплата (RUB)", color='red')
-        ax2.tick_params(axis='y', labelcolor='red')
-        plt.title("Динамика вакансий и зарплат по месяцам")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig("reports/plots/vacancy_dynamics.png")
-        plt.close()
+        self._plot('vacancy_dynamics', dynamics)
 
     def plot_employers_analysis(self, employers: dict):
         """Задача 8: Работодатели"""
-        top = employers['top_employers']
-        plt.figure(figsize=(10, 8))
-        sns.barplot(data=top, y='employer_name', x='vacancy_count', palette="crest")
-        plt.title("ТОП-10 работодателей по числу вакансий")
-        plt.xlabel("Количество вакансий")
-        plt.tight_layout()
-        plt.savefig("reports/plots/top_employers.png")
-        plt.close()
+        self._plot('employers_analysis', employers)
 
     def generate_all(self):
         """
         Генерирует все графики, используя методы Analyzer.
-        Вызывает каждый метод аналитики и передаёт результат в визуализацию.
+        Все анализы считаются одним вызовом full_analysis, графики отрисовываются параллельно.
         """
-        self.plot_salary_by_role(self.ex.analyze_salaries_by_role())
-        self.plot_salary_by_city(self.ex.analyze_salaries_by_city())
-        self.plot_roles_count(self.ex.analyze_roles_count())
-        self.plot_salaries_by_experience(self.ex.analyze_salaries_by_experience())
-        self.plot_key_skills(self.ex.analyze_key_skills())
-        # self.plot_schedule_analysis(self.ex.analyze_schedule())
-        # self.plot_vacancy_dynamics(self.ex.analyze_vacancy_dynamics())
-        # self.plot_employers_analysis(self.ex.analyze_employers())
-        print("✅ Все графики сохранены в reports/plots/")
+        results = self.ex.full_analysis()
+        rendered = self._render({name: chart.prepare(results[chart.analysis]) for name, chart in _CHARTS.items()})
+        print(f"✅ Все графики сохранены в {self.output_dir}/ "
+              f"(перерисовано: {rendered}, без изменений: {len(_CHARTS) - rendered})")
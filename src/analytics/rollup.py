@@ -0,0 +1,34 @@
+from src.analytics.extractor import Extractor
+from src.db_manager.db import Database
+
+# запросы `Extractor`, у которых есть вариант по сводке vacancy_rollups;
+# навыки и медианы по-прежнему читаются из vacancy_skills и индексов vacancies
+_ROLLUPS = {
+    'get_salary_by_role': 'rollup_salary_by_role',
+    'get_salary_by_city': 'rollup_salary_by_city',
+    'get_salary_by_experience': 'rollup_salary_by_experience',
+    'get_roles_count': 'rollup_roles_count',
+    'get_schedule_shares': 'rollup_schedule_shares',
+    'get_salary_by_schedule': 'rollup_salary_by_schedule',
+    'get_schedule_dynamics': 'rollup_schedule_dynamics',
+    'get_role_dynamics': 'rollup_role_dynamics',
+    'get_monthly_salary': 'rollup_monthly_salary',
+    'get_top_employers': 'rollup_top_employers',
+    'get_salary_by_employer': 'rollup_salary_by_employer',
+}
+
+
+class RollupExtractor(Extractor):
+    """
+    `Extractor`, который считает количества и зарплатную статистику по сводке vacancy_rollups.
+    Перед анализом сводка догоняет базу через `refresh_rollups` (при первом запуске — включается
+    и строится целиком): переносятся только изменения после watermark, поэтому `db` должен быть
+    соединением на запись.
+    """
+
+    def __init__(self, db: Database):
+        super().__init__(db)
+        db.refresh_rollups()
+
+    def _select(self, statement: str, params=()) -> list:
+        return super()._select(_ROLLUPS.get(statement, statement), params)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from src.db_manager.statements import SKETCH_LOG_GAMMA
+
+PERCENTILES = (10, 25, 50, 75, 90)
+PERCENTILE_COLUMNS = [f'p{percentile}_salary_{bound}' for bound in ('bottom', 'top') for percentile in PERCENTILES]
+_GAMMA = np.exp(SKETCH_LOG_GAMMA)
+
+
+def bucket_value(buckets: np.ndarray) -> np.ndarray:
+    """Оценка значения корзины: для любого значения из (gamma^(i-1), gamma^i] ошибка не больше SKETCH_ACCURACY."""
+    return 2 * _GAMMA ** buckets / (_GAMMA + 1)
+
+
+def percentiles(sketch: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """
+    p10/p25/p50/p75/p90 нижней и верхней границы зарплаты по скетчам групп `keys`.
+    `sketch` — столбцы `keys`, bucket, count_bottom, count_top, упорядоченные по группам и корзинам.
+    Квантиль q группы из n значений — значение ранга floor(q * (n - 1)) с относительной погрешностью
+    не больше SKETCH_ACCURACY (для медианы чётного n — меньшее из двух центральных значений).
+    """
+    starts = np.flatnonzero(sketch[keys].ne(sketch[keys].shift()).any(axis=1).to_numpy())
+    ends = np.append(starts[1:], len(sketch))[:len(starts)] - 1
+    result = sketch[keys].iloc[starts].reset_index(drop=True)
+    buckets = sketch['bucket'].to_numpy(dtype=float)
+    for bound in ('bottom', 'top'):
+        # счётчики всех групп накапливаются подряд: квантиль группы — первая корзина, где сумма превысила
+        # сумму до группы плюс ранг, поэтому один поиск находит квантиль всех групп сразу
+        cumulative = np.cumsum(sketch[f'count_{bound}'].to_numpy(dtype=np.int64))
+        before = np.concatenate(([0], cumulative))[starts]
+        total = cumulative[ends] - before
+        for percentile in PERCENTILES:
+            rank = np.floor(percentile / 100 * (total - 1))
+            position = np.minimum(np.searchsorted(cumulative, before + rank, side='right'), ends)
+            values = bucket_value(buckets[position])
+            result[f'p{percentile}_salary_{bound}'] = np.where(total > 0, values, np.nan)
+    return result[keys + PERCENTILE_COLUMNS]
@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from src.analytics.extractor import Extractor
+from src.db_manager.db import Database
+
+# порядок столбцов совпадает с SnapshotStatements.get_vacancies
+_NUMERIC = {'id': np.int64, 'salary_bottom': np.float64, 'salary_top': np.float64, 'published_at': np.int64}
+_CATEGORICAL = ('currency', 'city', 'employer_name', 'schedule', 'professional_role', 'experience')
+_MANIFEST = 'manifest.json'
+
+
+class _Dictionary:
+    """Словарное кодирование столбца по мере выгрузки: код — номер первого появления значения, NULL — -1."""
+
+    def __init__(self):
+        self._codes: dict[str, int] = {}
+
+    @property
+    def values(self) -> list[str]:
+        return list(self._codes)
+
+    def encode(self, values) -> np.ndarray:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        mapping = np.array([self._codes.setdefault(value, len(self._codes)) for value in uniques], dtype=np.int32)
+        result = np.full(len(codes), -1, dtype=np.int32)
+        present = codes >= 0
+        result[present] = mapping[codes[present]]
+        return result
+
+
+class Snapshot:
+    """
+    Колоночный снимок таблицы vacancies для аналитики: по файлу .npy на столбец, зарплаты — float64
+    с NaN вместо NULL, published_at — datetime64[s], текстовые столбцы — коды int32 и словарь значений.
+    Снимок лежит в каталоге с меткой версии данных (`Database.data_stamp`), файлы читаются через mmap.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / _MANIFEST) as file:
+            manifest = json.load(file)
+        self.stamp: str = manifest['stamp']
+        self.rows: int = manifest['rows']
+        self._dictionaries: dict[str, list[str]] = manifest['dictionaries']
+        self._skills: list[str] = manifest['skills']
+
+    @classmethod
+    def ensure(cls, db: Database, root: str | Path = 'reports/snapshot', batch_size: int = 100000) -> 'Snapshot':
+        """
+        Возвращает снимок для текущей версии данных, при необходимости выгружая его заново.
+        Выгрузка идёт из одной читающей транзакции, поэтому снимок согласован, даже если сборщик пишет.
+        """
+        root = Path(root)
+        with db.snapshot() as reader:
+            stamp = reader.data_stamp()
+            path = root / stamp
+            if (path / _MANIFEST).exists():
+                return cls(path)
+            cls._export(reader, root, stamp, batch_size)
+        for stale in root.iterdir():
+            if stale.name != stamp and (stale / _MANIFEST).exists():
+                shutil.rmtree(stale, ignore_errors=True)
+        return cls(path)
+
+    @staticmethod
+    def _export(reader: Database, root: Path, stamp: str, batch_size: int):
+        starting_time = time.time()
+        rows, links = reader.count_for_snapshot()
+        # каталог собирается под временным именем и переименовывается целиком
+        temporary = root / f'.{stamp}.{os.getpid()}.tmp'
+        shutil.rmtree(temporary, ignore_errors=True)
+        temporary.mkdir(parents=True)
+
+        columns = {name: open_memmap(temporary / f'{name}.npy', mode='w+', dtype=dtype, shape=(rows,))
+                   for name, dtype in _NUMERIC.items()}
+        columns |= {name: open_memmap(temporary / f'{name}.npy', mode='w+', dtype=np.int32, shape=(rows,))
+                    for name in _CATEGORICAL}
+        dictionaries = {name: _Dictionary() for name in _CATEGORICAL}
+        position = 0
+        for batch in reader.iter_vacancies(batch_size):
+            values = list(zip(*batch))
+            end = position + len(batch)
+            for name, column in zip(_NUMERIC, values):
+                columns[name][position:end] = np.array(column, dtype=_NUMERIC[name])
+            for name, column in zip(_CATEGORICAL, values[len(_NUMERIC):]):
+                columns[name][position:end] = dictionaries[name].encode(column)
+            position = end
+
+        skill_ids, skills = zip(*reader.get_skills()) if links else ((), ())
+        skill_ids = np.array(skill_ids, dtype=np.int64)
+        vacancy_ids = open_memmap(temporary / 'skill_vacancy_id.npy', mode='w+', dtype=np.int64, shape=(links,))
+        skill_codes = open_memmap(temporary / 'skill_code.npy', mode='w+', dtype=np.int32, shape=(links,))
+        position = 0
+        for batch in reader.iter_vacancy_skills(batch_size):
+            pairs = np.array(batch, dtype=np.int64)
+            end = position + len(batch)
+            vacancy_ids[position:end] = pairs[:, 0]
+            skill_codes[position:end] = np.searchsorted(skill_ids, pairs[:, 1])
+            position = end
+
+        for column in [*columns.values(), vacancy_ids, skill_codes]:
+            column.flush()
+        with open(temporary / _MANIFEST, 'w') as file:
+            json.dump({'stamp': stamp, 'rows': rows, 'links': links, 'skills': list(skills),
+                       'dictionaries': {name: dictionary.values for name, dictionary in dictionaries.items()}},
+                      file, ensure_ascii=False)
+        target = root / stamp
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(temporary, target)
+        logging.info(f'Snapshot {stamp} of {rows} vacancies is exported in {time.time() - starting_time:.3f} sec')
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    def column(self, name: str):
+        if name in _CATEGORICAL:
+            return pd.Categorical.from_codes(self._load(name), categories=self._dictionaries[name], validate=False)
+        if name == 'published_at':
+            return self._load(name).view('datetime64[s]')
+        return self._load(name)
+
+    def frame(self, columns: list[str]) -> pd.DataFrame:
+        return pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+
+    def vacancy_skills(self) -> pd.DataFrame:
+        """Пары (vacancy_id, skill) в порядке vacancy_id; skill — категориальный столбец с названием навыка."""
+        return pd.DataFrame({'vacancy_id': self._load('skill_vacancy_id'),
+                             'skill': pd.Categorical.from_codes(self._load('skill_code'), categories=self._skills,
+                                                                validate=False)},
+                            copy=False)
+
+
+def _by_values(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    # категориальные ключи группировки возвращаются строками и в лексикографическом порядке, как из SQL
+    for key in keys:
+        if isinstance(df[key].dtype, pd.CategoricalDtype):
+            df[key] = df[key].astype(object)
+    return df.sort_values(keys, ignore_index=True)
+
+
+class SnapshotExtractor(Extractor):
+    """
+    `Extractor` поверх колоночного снимка: результаты те же, но повторные запуски читают
+    только нужные столбцы через mmap вместо построчной выборки из SQLite.
+    """
+
+    def __init__(self, db: Database, root: str | Path = 'reports/snapshot'):
+        super().__init__(db)
+        self.snapshot = Snapshot.ensure(db, root)
+        self._cache: dict | None = None
+
+    def full_analysis(self):
+        # общие промежуточные данные (столбцы, вакансии с зарплатой, месяцы, связи с навыками)
+        # строятся один раз на все анализы и освобождаются после них
+        self._cache = {}
+        try:
+            return super().full_analysis()
+        finally:
+            self._cache = None
+
+    def _shared(self, name: str, build):
+        if self._cache is None:
+            return build()
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    def _frame(self) -> pd.DataFrame:
+        """Все столбцы снимка; столбцы — представления mmap-файлов, поэтому без копирования."""
+        return self._shared('frame', lambda: self.snapshot.frame([*_NUMERIC, *_CATEGORICAL]))
+
+    def _months(self) -> pd.Series:
+        return self._shared('months', lambda: self._frame()['published_at'].dt.to_period('M').rename('month'))
+
+    def _salaries(self) -> pd.DataFrame:
+        """Вакансии с зарплатой в рублях вместе со столбцом month."""
+        def build():
+            frame = self._frame()
+            mask = ((frame['currency'] == 'RUR') & frame['salary_bottom'].notna() & frame['salary_top'].notna())
+            return frame[mask].assign(month=self._months()[mask])
+        return self._shared('salaries', build)
+
+    def _salary_summary(self, grouping: str, keys: list[str]) -> pd.DataFrame:
+        frame = self._frame()
+        summary = self._salaries().groupby(keys, observed=True).agg(
+            avg_salary_bottom=('salary_bottom', 'mean'),
+            avg_salary_top=('salary_top', 'mean'),
+            median_salary_bottom=('salary_bottom', 'median'),
+            median_salary_top=('salary_top', 'median'),
+            min_salary=('salary_bottom', 'min'),
+            max_salary=('salary_top', 'max'),
+            std_salary_bottom=('salary_bottom', 'std'),
+            std_salary_top=('salary_top', 'std'),
+            count_vacancies=('salary_bottom', 'count')
+        )
+        summary['total_vacancies'] = frame.groupby(keys, observed=True).size()
+        return _by_values(summary.reset_index(), keys)
+
+    def analyze_roles_count(self):
+        df = self._frame().groupby('professional_role', observed=True).size().reset_index(name='count_vacancies')
+        df = _by_values(df, ['professional_role'])
+        df['share'] = df['count_vacancies'] / df['count_vacancies'].sum()
+        return df
+
+    def _skill_links(self) -> pd.DataFrame:
+        """Связи вакансия—навык с ролью и работодателем вакансии; id в снимке отсортированы, поиск — бинарный."""
+        def build():
+            links = self.snapshot.vacancy_skills()
+            ids = self.snapshot.column('id')
+            positions = np.searchsorted(ids, links['vacancy_id'].to_numpy()).clip(max=max(len(ids) - 1, 0))
+            found = ids[positions] == links['vacancy_id'].to_numpy() if len(ids) else np.zeros(len(links), dtype=bool)
+            links = links[found]
+            for column in ('professional_role', 'employer_name'):
+                links[column] = self.snapshot.column(column)[positions[found]]
+            return links
+        return self._shared('links', build)
+
+    def analyze_key_skills(self):
+        links = self._skill_links()
+        skill_counts = links.groupby('skill', observed=True).size().reset_index(name='frequency')
+        skill_counts = _by_values(skill_counts, ['skill']).sort_values('frequency', ascending=False, kind='stable',
+                                                                      ignore_index=True)
+        role_skill_counts = (links.groupby(['professional_role', 'skill'], observed=True).size()
+                             .reset_index(name='frequency').rename(columns={'skill': 'key_skills'}))
+        return {
+            'overall': skill_counts,
+            'by_role': _by_values(role_skill_counts, ['professional_role', 'key_skills'])
+        }
+
+    def analyze_schedule(self):
+        frame = self._frame()
+        schedule_shares = _by_values(frame.groupby('schedule', observed=True).size()
+                                     .reset_index(name='total_vacancies'), ['schedule'])
+        schedule_shares['share'] = schedule_shares['total_vacancies'] / schedule_shares['total_vacancies'].sum()
+
+        avg_salary_by_schedule = self._salaries().groupby('schedule', observed=True).agg(
+            avg_salary_bottom=('salary_bottom', 'mean'),
+            avg_salary_top=('salary_top', 'mean')
+        ).reset_index()
+
+        schedule_dynamics = frame.groupby([self._months(), 'schedule'], observed=True).size().reset_index(name='count')
+        return {
+            'schedule_shares': schedule_shares,
+            'avg_salary_by_schedule': _by_values(avg_salary_by_schedule, ['schedule']),
+            'schedule_dynamics': _by_values(schedule_dynamics, ['month', 'schedule'])
+        }
+
+    def analyze_vacancy_dynamics(self):
+        role_monthly_summary = (self._frame().groupby([self._months(), 'professional_role'], observed=True).size()
+                                .reset_index(name='count'))
+        monthly_summary = self._salaries().groupby('month').agg(
+            avg_salary_bottom=('salary_bottom', 'mean'),
+            avg_salary_top=('salary_top', 'mean'),
+            count_vacancies=('salary_bottom', 'count')
+        ).reset_index()
+        return {
+            'monthly_summary': monthly_summary,
+            'role_monthly_summary': _by_values(role_monthly_summary, ['month', 'professional_role'])
+        }
+
+    def analyze_employers(self):
+        top_employers = self._frame().groupby('employer_name', observed=True).agg(
+            vacancy_count=('id', 'size'),
+            first_id=('id', 'min')
+        ).reset_index()
+        top_employers = (top_employers.sort_values(['vacancy_count', 'first_id'], ascending=[False, True])
+                         .head(10)[['employer_name', 'vacancy_count']])
+        top_employers = top_employers.astype({'employer_name': object}).reset_index(drop=True)
+
+        employer_salary_summary = self._salaries().groupby('employer_name', observed=True).agg(
+            avg_salary_bottom=('salary_bottom', 'mean'),
+            avg_salary_top=('salary_top', 'mean'),
+            count_vacancies=('salary_bottom', 'count')
+        ).reset_index()
+
+        # компании перечисляются в порядке первой вакансии с навыком
+        links = self._skill_links()
+        pairs = links.groupby(['skill', 'employer_name'], observed=True).agg(
+            frequency=('vacancy_id', 'size'),
+            first_id=('vacancy_id', 'min')
+        ).reset_index().sort_values(['skill', 'first_id'])
+        pairs['employer_name'] = pairs['employer_name'].astype(object)
+        skill_counts_by_employer = pairs.groupby('skill', observed=True).agg(
+            companies=('employer_name', ', '.join),
+            frequency=('frequency', 'sum')
+        ).reset_index().rename(columns={'skill': 'key_skills'})
+        skill_counts_by_employer = _by_values(skill_counts_by_employer, ['key_skills']).sort_values(
+            'frequency', ascending=False, kind='stable', ignore_index=True)
+
+        return {
+            'top_employers': top_employers,
+            'employer_salary_summary': _by_values(employer_salary_summary, ['employer_name']),
+            'skill_counts_by_employer': skill_counts_by_employer
+        }
@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+
+from src.analytics.extractor import SALARY_KEYS, Extractor, _to_month
+from src.db_manager.db import Database
+
+_SALARIES = ['salary_bottom', 'salary_top']
+
+
+def _sorted(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    # порядок ORDER BY из SQLite: NULL раньше остальных значений
+    return df.sort_values(keys, na_position='first', ignore_index=True)
+
+
+class FrequencyCounter:
+    """
+    Частоты по ключам `keys`: каждая часть сворачивается groupby и складывается с накопленным.
+    Если задан `first`, по группе запоминается и минимальное значение этого столбца.
+    """
+
+    def __init__(self, keys: list[str], first: str | None = None):
+        self.keys = keys
+        self.first = first
+        self._state: pd.DataFrame | None = None
+
+    def update(self, chunk: pd.DataFrame):
+        groups = chunk.groupby(self.keys, dropna=False, sort=False)
+        part = groups.size().to_frame('count')
+        if self.first is not None:
+            part['first'] = groups[self.first].min()
+        if self._state is None:
+            self._state = part
+            return
+        merged = pd.concat([self._state, part]).groupby(level=list(range(len(self.keys))), dropna=False, sort=False)
+        self._state = merged.agg({'count': 'sum', 'first': 'min'} if self.first is not None else {'count': 'sum'})
+
+    def result(self, name: str = 'count') -> pd.DataFrame:
+        columns = ['count'] + (['first'] if self.first is not None else [])
+        if self._state is None:
+            return pd.DataFrame(columns=self.keys + columns).rename(columns={'count': name})
+        return _sorted(self._state.reset_index(), self.keys).rename(columns={'count': name})
+
+
+class RunningStats:
+    """
+    Количество, среднее, M2 (сумма квадратов отклонений), min и max столбцов `columns` по группам `keys`.
+    Части сливаются по формулам Чана, поэтому состояние занимает O(групп) при любом числе строк.
+    """
+
+    def __init__(self, keys: list[str], columns: list[str]):
+        self.keys = keys
+        self.columns = columns
+        self._state: pd.DataFrame | None = None
+
+    def update(self, chunk: pd.DataFrame):
+        if chunk.empty:
+            return
+        groups = chunk.groupby(self.keys, dropna=False, sort=False)[self.columns]
+        count = groups.size()
+        part = pd.concat({'mean': groups.mean(), 'm2': groups.var(ddof=0).mul(count, axis=0),
+                          'min': groups.min(), 'max': groups.max()}, axis=1)
+        part['count'] = count
+        self._state = part if self._state is None else self._merge(self._state, part)
+
+    @staticmethod
+    def _merge(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+        index = left.index.union(right.index)
+        left, right = left.reindex(index), right.reindex(index)
+        left_count, right_count = left['count'].fillna(0), right['count'].fillna(0)
+        count = left_count + right_count
+        delta = right['mean'] - left['mean']
+        merged = pd.concat({
+            'mean': (left['mean'] + delta.mul(right_count / count, axis=0)).fillna(left['mean']).fillna(right['mean']),
+            'm2': (left['m2'].fillna(0) + right['m2'].fillna(0)
+                   + (delta ** 2).mul(left_count * right_count / count, axis=0).fillna(0)),
+            'min': np.fmin(left['min'], right['min']),
+            'max': np.fmax(left['max'], right['max']),
+        }, axis=1)
+        merged['count'] = count.astype(np.int64)
+        return merged
+
+    def result(self) -> pd.DataFrame:
+        """По строке на группу: count и mean_/std_/min_/max_ каждого столбца; std выборочное (ddof=1)."""
+        if self._state is None:
+            return pd.DataFrame(columns=self.keys + ['count'] + [f'{stat}_{column}' for column in self.columns
+                                                                  for stat in ('mean', 'std', 'min', 'max')])
+        state = self._state
+        count = state['count']
+        result = pd.DataFrame({'count': count.astype(np.int64)}, index=state.index)
+        for column in self.columns:
+            result[f'mean_{column}'] = state[('mean', column)]
+            result[f'std_{column}'] = (state[('m2', column)] / (count - 1)).clip(lower=0).pow(0.5).where(count > 1)
+            result[f'min_{column}'] = state[('min', column)]
+            result[f'max_{column}'] = state[('max', column)]
+        return _sorted(result.reset_index(), self.keys)
+
+
+class _Pass:
+    """
+    Один проход по vacancies и по связям с навыками: анализы регистрируют нужные им накопители,
+    одинаковые накопители (например, количество вакансий по ролям) создаются один раз и общие для всех.
+    """
+
+    def __init__(self):
+        self.counters: dict[tuple, FrequencyCounter] = {}
+        self.salaries: dict[tuple, RunningStats] = {}
+        self.link_counters: dict[tuple, FrequencyCounter] = {}
+        self.columns: dict[str, None] = {}
+        self.link_columns: dict[str, None] = {}
+
+    def counter(self, keys: list[str], first: str | None = None) -> FrequencyCounter:
+        self.columns.update(dict.fromkeys(keys + ([first] if first else [])))
+        return self.counters.setdefault((*keys, first), FrequencyCounter(keys, first))
+
+    def salary_stats(self, keys: list[str]) -> RunningStats:
+        self.columns.update(dict.fromkeys(keys + ['currency'] + _SALARIES))
+        return self.salaries.setdefault(tuple(keys), RunningStats(keys, _SALARIES))
+
+    def link_counter(self, keys: list[str], first: str | None = None) -> FrequencyCounter:
+        self.link_columns.update(dict.fromkeys(keys + ([first] if first else [])))
+        return self.link_counters.setdefault((*keys, first), FrequencyCounter(keys, first))
+
+
+def _drop_null(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    # аналог WHERE key IS NOT NULL: NULL-группа просто не попадает в результат
+    return df[df[key].notna()].reset_index(drop=True)
+
+
+class StreamingExtractor(Extractor):
+    """
+    `Extractor`, который читает построчные выборки пачками через fetchmany и сворачивает каждую пачку
+    в частичные агрегаты. Память ограничена размером пачки и числом групп, а не числом вакансий;
+    медианы — точные, через поиск по индексу на группу, как в `Extractor`.
+    `full_analysis` проходит по таблице один раз и заполняет накопители всех восьми анализов сразу.
+    """
+
+    _SALARY_KEYS = SALARY_KEYS
+
+    def __init__(self, db: Database, batch_size: int = 50000):
+        super().__init__(db)
+        self.batch_size = batch_size
+
+    def _chunks(self, table: str, columns: list[str]):
+        for rows in self._db.iter_columns(table, columns, self.batch_size):
+            chunk = pd.DataFrame.from_records(rows, columns=columns)
+            for column in _SALARIES:
+                if column in chunk:
+                    chunk[column] = chunk[column].astype(float)
+            yield chunk
+
+    @staticmethod
+    def _with_salary(chunk: pd.DataFrame) -> pd.DataFrame:
+        return chunk[(chunk['currency'] == 'RUR') & chunk['salary_bottom'].notna() & chunk['salary_top'].notna()]
+
+    def _run(self, scan: _Pass):
+        if scan.columns:
+            for chunk in self._chunks('vacancies', list(scan.columns)):
+                for counter in scan.counters.values():
+                    counter.update(chunk)
+                if scan.salaries:
+                    salaries = self._with_salary(chunk)
+                    for stats in scan.salaries.values():
+                        stats.update(salaries)
+        if scan.link_columns:
+            for chunk in self._chunks('skill_links', list(scan.link_columns)):
+                for counter in scan.link_counters.values():
+                    counter.update(chunk)
+
+    def _analyze(self, plan):
+        scan = _Pass()
+        finish = plan(scan)
+        self._run(scan)
+        return finish()
+
+    def full_analysis(self):
+        scan = _Pass()
+        plans = {
+            'salary_by_role': self._plan_salaries(scan, 'role'),
+            'salary_by_city': self._plan_salaries(scan, 'city'),
+            'roles_count': self._plan_roles_count(scan),
+            'salaries_by_experience': self._plan_salaries(scan, 'experience'),
+            'key_skills': self._plan_key_skills(scan),
+            'schedule_analysis': self._plan_schedule(scan),
+            'vacancy_dynamics': self._plan_vacancy_dynamics(scan),
+            'employers_analysis': self._plan_employers(scan)
+        }
+        self._run(scan)
+        full_results = {name: finish() for name, finish in plans.items()}
+        for name, grouping in (('salary_by_role', 'role'), ('salary_by_city', 'city'),
+                               ('salaries_by_experience', 'experience')):
+            full_results[name] = self._with_percentiles(grouping, full_results[name])
+        for name in ('salary_by_role', 'salary_by_city'):
+            summary = full_results[name]
+            summary['with_salary'] = summary['count_vacancies'] / summary['total_vacancies']
+        return full_results
+
+    def _salary_summary(self, grouping: str, keys: list[str]) -> pd.DataFrame:
+        return self._analyze(lambda scan: self._plan_salaries(scan, grouping))
+
+    def _plan_salaries(self, scan: _Pass, grouping: str):
+        keys = self._SALARY_KEYS[grouping]
+        totals = scan.counter(keys)
+        salaries = scan.salary_stats(keys)
+
+        def finish():
+            stats = salaries.result().merge(totals.result('total_vacancies'), on=keys, how='left')
+            if grouping == 'city':
+                stats = _drop_null(stats, 'city')
+            summary = stats[keys].copy()
+            summary['avg_salary_bottom'] = stats['mean_salary_bottom']
+            summary['avg_salary_top'] = stats['mean_salary_top']
+            summary = summary.join(self._medians(grouping, keys, stats.rename(columns={'count': 'count_vacancies'})))
+            summary['min_salary'] = stats['min_salary_bottom']
+            summary['max_salary'] = stats['max_salary_top']
+            summary['std_salary_bottom'] = stats['std_salary_bottom']
+            summary['std_salary_top'] = stats['std_salary_top']
+            summary['count_vacancies'] = stats['count']
+            summary['total_vacancies'] = stats['total_vacancies']
+            return summary
+        return finish
+
+    def analyze_roles_count(self):
+        return self._analyze(self._plan_roles_count)
+
+    def _plan_roles_count(self, scan: _Pass):
+        counter = scan.counter(['professional_role'])
+
+        def finish():
+            df = counter.result('count_vacancies')
+            df['share'] = df['count_vacancies'] / df['count_vacancies'].sum()
+            return df
+        return finish
+
+    def analyze_key_skills(self):
+        return self._analyze(self._plan_key_skills)
+
+    def _plan_key_skills(self, scan: _Pass):
+        counter = scan.link_counter(['professional_role', 'key_skills'])
+
+        def finish():
+            role_skill_counts = counter.result('frequency')
+            skill_counts = (role_skill_counts.groupby('key_skills', dropna=False)['frequency'].sum().reset_index()
+                            .rename(columns={'key_skills': 'skill'}))
+            skill_counts = _sorted(skill_counts, ['skill']).sort_values('frequency', ascending=False, kind='stable',
+                                                                       ignore_index=True)
+            return {
+                'overall': skill_counts,
+                'by_role': role_skill_counts
+            }
+        return finish
+
+    def analyze_schedule(self):
+        return self._analyze(self._plan_schedule)
+
+    def _plan_schedule(self, scan: _Pass):
+        shares = scan.counter(['schedule'])
+        salaries = scan.salary_stats(['schedule'])
+        dynamics = scan.counter(['month', 'schedule'])
+
+        def finish():
+            schedule_shares = _drop_null(shares.result('total_vacancies'), 'schedule')
+            schedule_shares['share'] = schedule_shares['total_vacancies'] / schedule_shares['total_vacancies'].sum()
+            avg_salary_by_schedule = _drop_null(salaries.result(), 'schedule').rename(
+                columns={'mean_salary_bottom': 'avg_salary_bottom', 'mean_salary_top': 'avg_salary_top'})
+            schedule_dynamics = _drop_null(dynamics.result(), 'schedule')
+            schedule_dynamics['month'] = _to_month(schedule_dynamics['month'])
+            return {
+                'schedule_shares': schedule_shares,
+                'avg_salary_by_schedule': avg_salary_by_schedule[['schedule', 'avg_salary_bottom', 'avg_salary_top']],
+                'schedule_dynamics': schedule_dynamics
+            }
+        return finish
+
+    def analyze_vacancy_dynamics(self):
+        return self._analyze(self._plan_vacancy_dynamics)
+
+    def _plan_vacancy_dynamics(self, scan: _Pass):
+        roles = scan.counter(['month', 'professional_role'])
+        salaries = scan.salary_stats(['month'])
+
+        def finish():
+            role_monthly_summary = roles.result()
+            role_monthly_summary['month'] = _to_month(role_monthly_summary['month'])
+            monthly_summary = salaries.result().rename(columns={'mean_salary_bottom': 'avg_salary_bottom',
+                                                                'mean_salary_top': 'avg_salary_top',
+                                                                'count': 'count_vacancies'})
+            monthly_summary = monthly_summary[['month', 'avg_salary_bottom', 'avg_salary_top', 'count_vacancies']]
+            monthly_summary['month'] = _to_month(monthly_summary['month'])
+            return {
+                'monthly_summary': monthly_summary,
+                'role_monthly_summary': role_monthly_summary
+            }
+        return finish
+
+    def analyze_employers(self):
+        return self._analyze(self._plan_employers)
+
+    def _plan_employers(self, scan: _Pass):
+        employers = scan.counter(['employer_name'], first='id')
+        salaries = scan.salary_stats(['employer_name'])
+        pairs = scan.link_counter(['key_skills', 'employer_name'], first='vacancy_id')
+
+        def finish():
+            # при равенстве — в порядке первой вакансии работодателя
+            top_employers = (_drop_null(employers.result('vacancy_count'), 'employer_name')
+                             .sort_values(['vacancy_count', 'first'], ascending=[False, True])
+                             .head(10)[['employer_name', 'vacancy_count']].reset_index(drop=True))
+            employer_salary_summary = _drop_null(salaries.result(), 'employer_name').rename(
+                columns={'mean_salary_bottom': 'avg_salary_bottom', 'mean_salary_top': 'avg_salary_top',
+                         'count': 'count_vacancies'})
+            employer_salary_summary = employer_salary_summary[['employer_name', 'avg_salary_bottom', 'avg_salary_top',
+                                                               'count_vacancies']]
+
+            # компании перечисляются в порядке первой вакансии с навыком
+            skill_pairs = pairs.result('frequency').sort_values(['key_skills', 'first'])
+            skill_counts_by_employer = skill_pairs.groupby('key_skills', dropna=False).agg(
+                companies=('employer_name', ', '.join),
+                frequency=('frequency', 'sum')
+            ).reset_index()
+            skill_counts_by_employer = _sorted(skill_counts_by_employer, ['key_skills']).sort_values(
+                'frequency', ascending=False, kind='stable', ignore_index=True)
+            return {
+                'top_employers': top_employers,
+                'employer_salary_summary': employer_salary_summary,
+                'skill_counts_by_employer': skill_counts_by_employer
+            }
+        return finish
@@ -1,30 +1,68 @@
 import asyncio
 import logging
-from datetime import date, timedelta
+import time
+from datetime import date, datetime, timedelta
 import httpx
 
+from src.api.rate_controller import RateController, ThrottledError
 from src.utils import json_loads
 
 
 class HeadHunterApi:
     _API_URL = 'https://api.hh.ru'
     _HH_USER_AGENT = 'hh_analytics/1.0 (sunshineinabagg@yandex.ru)'
+    SEARCH_PER_PAGE = 100
+    SEARCH_DEPTH = 2000
 
-    def __init__(self, client: httpx.AsyncClient):
+    def __init__(self, client: httpx.AsyncClient, rate_controller: RateController | None = None,
+                 api_url: str | None = None, metrics=None):
         self.client = client
+        self.rate_controller = rate_controller or RateController()
+        self.api_url = api_url or self._API_URL
+        self.metrics = metrics
+
+    @staticmethod
+    def _retry_after(response: httpx.Response | None):
+        if response is None:
+            return None
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return None
 
     async def _send_request(self, method: str, **kwargs):
-        for attempt in (1, 2, 3):
-            response: httpx.Response = await self.__send_request(method=method, **kwargs)
-            if response.status_code == 429:
-                logging.info(f'Request {response.url} has caught code 429. That was {attempt} attempt')
-                await asyncio.sleep(attempt)
-            else:
-                return await json_loads(response.text)
-
-    async def __send_request(self, method: str, **kwargs):
-        response = await self.client.get(url=self._API_URL + method,
-                                         headers={'HH-User-Agent': self._HH_USER_AGENT},
+        response = await self._send_request_raw(method, **kwargs)
+        return json_loads(response.content)
+
+    async def _send_request_raw(self, method: str, **kwargs):
+        for attempt in range(self.rate_controller.max_attempts):
+            async with self.rate_controller.slot():
+                starting_time = time.monotonic()
+                try:
+                    response: httpx.Response | None = await self.__send_request(method=method, **kwargs)
+                except httpx.TransportError as e:
+                    logging.debug(f'Request {method} has failed with {type(e).__name__}')
+                    response = None
+                latency = time.monotonic() - starting_time
+            if self.metrics is not None:
+                self.metrics.observe('http_request', latency)
+                if response is None or response.status_code >= 500:
+                    self.metrics.inc('errors')
+                elif response.status_code == 429:
+                    self.metrics.inc('throttled')
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                self.rate_controller.on_success(latency)
+                return response
+            delay = self.rate_controller.on_throttle(attempt, self._retry_after(response))
+            if response is not None:
+                logging.debug(f'Request {response.url} has caught code {response.status_code}. '
+                             f'That was {attempt + 1} attempt')
+            await asyncio.sleep(delay)
+        raise ThrottledError(method)
+
+    async def __send_request(self, method: str, headers: dict | None = None, **kwargs):
+        response = await self.client.get(url=self.api_url + method,
+                                         headers={'HH-User-Agent': self._HH_USER_AGENT, **(headers or {})},
                                          **kwargs)
         return response
 
@@ -36,7 +74,19 @@ class HeadHunterApi:
 
     async def get_vacancies(self):
         response = await self._send_request(
-            method=f'/vacancies?per_page=1&date_from={str(date.today() - timedelta(days=1))}'
+            method=f'/vacancies?per_page=1&order_by=publication_time&date_from={str(date.today() - timedelta(days=1))}'
+        )
+        return response
+
+    async def search_vacancies(self, roles, date_from: datetime, date_to: datetime, page: int = 0):
+        response = await self._send_request(
+            method='/vacancies',
+            params={'professional_role': list(roles),
+                    'date_from': date_from.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'date_to': date_to.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'order_by': 'publication_time',
+                    'per_page': self.SEARCH_PER_PAGE,
+                    'page': page}
         )
         return response
 
@@ -45,3 +95,17 @@ class HeadHunterApi:
             method=f'/vacancies/{vacancy_id}'
         )
         return response
+
+    async def get_vacancy_conditional(self, vacancy_id: int, etag: str | None = None,
+                                      last_modified: str | None = None):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = await self._send_request_raw(
+            method=f'/vacancies/{vacancy_id}',
+            headers=headers
+        )
+        data = json_loads(response.content) if response.status_code != 304 else None
+        return response.status_code, data, response.headers.get('ETag'), response.headers.get('Last-Modified')
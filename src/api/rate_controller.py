@@ -0,0 +1,91 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+
+
+class ThrottledError(Exception):
+    pass
+
+
+class RateController:
+    """
+    Общий регулятор нагрузки на API: token bucket ограничивает частоту запросов,
+    а лимит одновременных запросов подстраивается по схеме AIMD — растёт на 1 за «окно»
+    быстрых ответов и уменьшается вдвое при 429/5xx.
+    """
+
+    def __init__(self,
+                 rate: float = 30.0,
+                 burst: int = 30,
+                 concurrency: int = 10,
+                 min_concurrency: int = 1,
+                 max_concurrency: int = 100,
+                 target_latency: float = 1.0,
+                 max_attempts: int = 6,
+                 base_delay: float = 0.5,
+                 max_delay: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limit = float(concurrency)
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            await self._take_token()
+            yield
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if latency <= self.target_latency and self._limit < self.max_concurrency:
+            self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+
+    def on_throttle(self, attempt: int, retry_after: float | None = None) -> float:
+        now = time.monotonic()
+        # несколько одновременных 429 — это один сигнал перегрузки, а не несколько
+        if now - self._last_decrease > self.target_latency:
+            self._limit = max(self.min_concurrency, self._limit / 2)
+            self._last_decrease = now
+        if retry_after is not None:
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(retry_after or 0.0, backoff)
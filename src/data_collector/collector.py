@@ -1,10 +1,28 @@
 import asyncio
 import time
 import logging
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from httpx import AsyncClient
 from src.api.hh_api import HeadHunterApi
+from src.api.rate_controller import RateController, ThrottledError
+from src.data_collector.id_index import IdIndex
+from src.data_collector.telemetry import CollectorMetrics
 from src.db_manager.db import Database
-from src.utils import formalize_data
+from src.utils import VacancyParser
+
+
+@dataclass
+class _Block:
+    ids: range | list
+    span: int = 0
+    checkpoint: tuple[int, int] | None = None
+    retried: list = field(default_factory=list)
+    pending: int = 0
+    vacancies: list = field(default_factory=list)
+    throttled: list = field(default_factory=list)
+    outcomes: list = field(default_factory=list)
 
 
 def process_roles(cluster):
@@ -18,13 +36,38 @@ def process_roles(cluster):
 
 
 class Collector:
-    def __init__(self, client: AsyncClient, db: Database):
+    _MIN_WINDOW = timedelta(minutes=1)
+    _STEP = 1000
+    _MAX_PENDING_BLOCKS = 8
+    _PARSE_BATCH = 256
+
+    def __init__(self, client: AsyncClient, db: Database, rate_controller: RateController | None = None,
+                 absent_ttl_days: int = 30, api_url: str | None = None, metrics_file: str | None = None,
+                 report_interval: float = 30.0):
+        rate_controller = rate_controller or RateController()
+        self.metrics = CollectorMetrics(rate_controller)
+        self._metrics_file = metrics_file
+        self._report_interval = report_interval
         self._hh = HeadHunterApi(
-            client
+            client,
+            rate_controller,
+            api_url,
+            self.metrics
         )
         self._db = db
         self._roles = None
         self._range = None
+        self._index: IdIndex | None = None
+        self._absent_ttl_days = absent_ttl_days
+        self._workers = self._hh.rate_controller.max_concurrency
+        self._stopping = asyncio.Event()
+        self._pending = deque()
+        self._block_slots = asyncio.Semaphore(self._MAX_PENDING_BLOCKS)
+        self._parser = VacancyParser()
+
+    def stop(self):
+        logging.info('Collector is stopping, in-flight blocks will be finished')
+        self._stopping.set()
 
     async def _get_last_vacancy(self):
         last_vacancy = await self._hh.get_vacancies()
@@ -39,35 +82,250 @@ class Collector:
         self._range = int(await self._get_last_vacancy())
         return self._range
 
-    async def _process_vacancy(self, vacancy_id: int, semaphore: asyncio.Semaphore):
-        try:
-            async with semaphore:
+    async def _load_index(self):
+        if self._index is None:
+            self._index = IdIndex.from_rows(await self._db.get_id_index(), self._absent_ttl_days)
+            logging.info(f'Id index is loaded ({self._index.memory_usage() / 2 ** 20:.1f} MB)')
+        return self._index
+
+    async def _produce(self, blocks, id_queue: asyncio.Queue, result_queue: asyncio.Queue):
+        async for block in blocks:
+            if self._stopping.is_set():
+                break
+            await self._block_slots.acquire()
+            self._pending.append(block)
+            if not block.ids:
+                # все id блока уже известны по индексу — блок проходит конвейер пустой отметкой
+                block.pending = 1
+                await result_queue.put((block, None, IdIndex.UNKNOWN, None))
+                continue
+            block.pending = len(block.ids)
+            for vacancy_id in block.ids:
+                await id_queue.put((block, vacancy_id))
+        for _ in range(self._workers):
+            await id_queue.put(None)
+
+    async def _fetch(self, id_queue: asyncio.Queue, raw_queue: asyncio.Queue):
+        while (item := await id_queue.get()) is not None:
+            block, vacancy_id = item
+            fetched = False
+            try:
                 raw_vacancy = await self._hh.get_vacancy(vacancy_id)
-                if not isinstance(raw_vacancy, dict):
-                    logging.info(f'Vacancy {vacancy_id} is not found')
-                    return
-                if raw_vacancy.get('professional_roles'):
-                    for role in raw_vacancy['professional_roles']:
-                        if role['id'] in self._roles.keys():
-                            logging.info(f'Vacancy {vacancy_id} processing has started')
-                            vacancy = await formalize_data(raw_vacancy)
-                            await self._db.insert_vacancy(vacancy)
-                            logging.info(f'Vacancy {vacancy_id} processing completed successfully')
-                            return
-                logging.info(f'Vacancy {vacancy_id} was skipped')
-        except Exception as e:
-            logging.warning(f'Error while processing: {str(e)}')
-            pass
-
-    async def start(self):
+                fetched = True
+            except ThrottledError:
+                logging.debug(f'Vacancy {vacancy_id} is throttled and will be retried later')
+                self.metrics.inc('deferred')
+                block.throttled.append(vacancy_id)
+                raw_vacancy = None
+            except Exception as e:
+                logging.warning(f'Error while processing: {str(e)}')
+                self.metrics.inc('errors')
+                raw_vacancy = None
+            await raw_queue.put((block, vacancy_id, fetched, raw_vacancy))
+
+    async def _parse(self, raw_queue: asyncio.Queue, result_queue: asyncio.Queue):
+        finished = False
+        while not finished:
+            # разбираем всё, что накопилось в очереди, одной пачкой
+            batch = [await raw_queue.get()]
+            while len(batch) < self._PARSE_BATCH and not raw_queue.empty():
+                batch.append(raw_queue.get_nowait())
+            if batch[-1] is None:
+                finished = True
+                batch.pop()
+            starting_time = time.monotonic()
+            results = list(self._process_batch(batch))
+            if batch:
+                self.metrics.observe('parse_batch', time.monotonic() - starting_time)
+            for item in results:
+                await result_queue.put(item)
+        await result_queue.put(None)
+
+    def _mark_outcomes(self, block: _Block):
+        for vacancy_id, outcome in block.outcomes:
+            self._index.set(vacancy_id, outcome)
+
+    async def _write(self, result_queue: asyncio.Queue):
+        async with self._db.batch_writer(index=self._index, metrics=self.metrics) as writer:
+            while (item := await result_queue.get()) is not None:
+                block, vacancy_id, outcome, vacancy = item
+                if vacancy is not None:
+                    block.vacancies.append(vacancy)
+                if outcome != IdIndex.UNKNOWN:
+                    block.outcomes.append((vacancy_id, outcome))
+                if vacancy_id is not None:
+                    self.metrics.advance(1)
+                block.pending -= 1
+                # блоки фиксируются строго по порядку, чтобы отметка прогресса не перескакивала через незавершённые
+                while self._pending and self._pending[0].pending == 0:
+                    block = self._pending.popleft()
+                    self._mark_outcomes(block)
+                    await writer.add(block.vacancies, checkpoint=block.checkpoint,
+                                     throttled=block.throttled, retried=block.retried)
+                    # id, пропущенные по индексу, засчитываются в прогресс вместе с блоком
+                    self.metrics.advance(block.span - len(block.ids))
+                    self._block_slots.release()
+            while self._pending:
+                block = self._pending.popleft()
+                self._mark_outcomes(block)
+                await writer.add(block.vacancies, throttled=block.throttled)
+                self._block_slots.release()
+
+    async def _run_pipeline(self, blocks):
+        id_queue = asyncio.Queue(maxsize=self._workers * 2)
+        raw_queue = asyncio.Queue(maxsize=self._workers * 2)
+        result_queue = asyncio.Queue(maxsize=self._workers * 2)
+
+        async def fetch_stage():
+            async with asyncio.TaskGroup() as workers:
+                for _ in range(self._workers):
+                    workers.create_task(self._fetch(id_queue, raw_queue))
+            await raw_queue.put(None)
+
+        reporter = asyncio.create_task(self.metrics.report_periodically(self._report_interval, self._metrics_file))
+        try:
+            async with asyncio.TaskGroup() as stages:
+                stages.create_task(self._produce(blocks, id_queue, result_queue))
+                stages.create_task(fetch_stage())
+                stages.create_task(self._parse(raw_queue, result_queue))
+                stages.create_task(self._write(result_queue))
+        finally:
+            reporter.cancel()
+        self.metrics.report(self._metrics_file)
+        if self._parser.rejected:
+            logging.warning(f'{sum(self._parser.rejected.values())} vacancies were rejected by the parser: '
+                            f'{dict(self._parser.rejected.most_common(10))}')
+            self._parser.rejected.clear()
+
+    def _classify(self, vacancy_id: int, raw_vacancy) -> int:
+        if not isinstance(raw_vacancy, dict) or raw_vacancy.get('errors'):
+            logging.debug(f'Vacancy {vacancy_id} is not found')
+            return IdIndex.ABSENT
+        try:
+            if any(role['id'] in self._roles for role in raw_vacancy.get('professional_roles') or ()):
+                return IdIndex.STORED
+        except (KeyError, TypeError) as e:
+            logging.warning(f'Error while processing vacancy {vacancy_id}: {str(e)}')
+            return IdIndex.UNKNOWN
+        logging.debug(f'Vacancy {vacancy_id} was skipped')
+        return IdIndex.NON_IT
+
+    def _process_batch(self, batch: list):
+        outcomes = [self._classify(vacancy_id, raw_vacancy) if fetched else IdIndex.UNKNOWN
+                    for _, vacancy_id, fetched, raw_vacancy in batch]
+        relevant = [item[3] for item, outcome in zip(batch, outcomes) if outcome == IdIndex.STORED]
+        parsed = iter(self._parser.parse(relevant))
+        for (block, vacancy_id, fetched, _), outcome in zip(batch, outcomes):
+            vacancy = next(parsed) if outcome == IdIndex.STORED else None
+            if fetched:
+                self.metrics.inc('fetched')
+            if outcome == IdIndex.ABSENT:
+                self.metrics.inc('not_found')
+            elif outcome == IdIndex.NON_IT:
+                self.metrics.inc('skipped')
+            elif outcome == IdIndex.STORED and vacancy is None:
+                self.metrics.inc('rejected')
+                outcome = IdIndex.UNKNOWN
+            elif vacancy is not None:
+                logging.debug(f'Vacancy {vacancy_id} processing completed successfully')
+            yield block, vacancy_id, outcome, vacancy
+
+    async def _search_page(self, date_from: datetime, date_to: datetime, page: int):
+        try:
+            return await self._hh.search_vacancies(self._roles.keys(), date_from, date_to, page)
+        except ThrottledError:
+            logging.warning(f'Search page {page} of window {date_from} - {date_to} is throttled')
+
+    async def _harvest_window(self, date_from: datetime, date_to: datetime):
+        first_page = await self._search_page(date_from, date_to, 0)
+        if not isinstance(first_page, dict) or first_page.get('errors'):
+            logging.warning(f'Search window {date_from} - {date_to} has failed')
+            return set()
+        if first_page['found'] > self._hh.SEARCH_DEPTH:
+            if date_to - date_from > self._MIN_WINDOW:
+                middle = date_from + (date_to - date_from) / 2
+                halves = await asyncio.gather(self._harvest_window(date_from, middle),
+                                              self._harvest_window(middle, date_to))
+                return halves[0] | halves[1]
+            logging.warning(f'Search window {date_from} - {date_to} exceeds the depth limit, '
+                            f'only {self._hh.SEARCH_DEPTH} of {first_page["found"]} vacancies will be collected')
+        pages = [first_page] + await asyncio.gather(
+            *(self._search_page(date_from, date_to, page) for page in range(1, first_page['pages']))
+        )
+        return {int(item['id']) for page in pages if isinstance(page, dict) for item in page.get('items', [])}
+
+    async def _id_blocks(self, vacancy_ids):
+        # id из поисковой выдачи заведомо существуют, поэтому пропускаются только уже разобранные
+        for offset in range(0, len(vacancy_ids), self._STEP):
+            chunk = vacancy_ids[offset:offset + self._STEP]
+            yield _Block(ids=[vacancy_id for vacancy_id in chunk
+                              if self._index.get(vacancy_id) not in (IdIndex.STORED, IdIndex.NON_IT)],
+                         span=len(chunk))
+
+    async def _crawl_blocks(self, origin: int, floor: int, watermark: int):
+        today = IdIndex.today()
+        for ceiling in range(watermark, floor, -self._STEP):
+            next_watermark = max(ceiling - self._STEP, floor)
+            yield _Block(ids=[vacancy_id for vacancy_id in range(ceiling, next_watermark, -1)
+                              if self._index.should_fetch(vacancy_id, today)],
+                         span=ceiling - next_watermark,
+                         checkpoint=(origin, next_watermark))
+
+    async def _throttled_blocks(self, ceiling: int | None = None, floor: int | None = None):
+        below = None if ceiling is None else ceiling + 1
+        while vacancy_ids := await self._db.get_throttled(self._STEP, below, floor):
+            below = vacancy_ids[-1]
+            yield _Block(ids=vacancy_ids, retried=vacancy_ids)
+
+    async def harvest(self, days: int = 30):
         await self._set_roles()
-        await self._set_range()
-        semaphore = asyncio.Semaphore(10)
-        step = 1000
+        await self._load_index()
         starting_time = time.time()
-        for ceiling in range(self._range, self._range - 12000000, -step):
-            tasks = set()
-            for vacancy_id in range(ceiling, ceiling - step, -1):
-                tasks.add(asyncio.create_task(self._process_vacancy(vacancy_id, semaphore)))
-            await asyncio.gather(*tasks)
+        date_to = datetime.now().replace(microsecond=0)
+        vacancy_ids = sorted(await self._harvest_window(date_to - timedelta(days=days), date_to), reverse=True)
+        logging.info(f'{len(vacancy_ids)} IT vacancies were found by search')
+        self.metrics.start_progress(len(vacancy_ids))
+        await self._run_pipeline(self._id_blocks(vacancy_ids))
+        await self._run_pipeline(self._throttled_blocks())
         logging.info(f"Collector's time spent: {time.time() - starting_time:.3f} sec")
+
+    async def _crawl(self, origin: int, floor: int, watermark: int):
+        await self._load_index()
+        starting_time = time.time()
+        self.metrics.start_progress(watermark - floor)
+        await self._run_pipeline(self._crawl_blocks(origin, floor, watermark))
+        await self._run_pipeline(self._throttled_blocks(origin, floor))
+        logging.info(f"Collector's time spent: {time.time() - starting_time:.3f} sec")
+
+    async def start(self, depth: int = 12000000):
+        await self._set_roles()
+        crawl_state = await self._db.get_crawl_state()
+        if crawl_state is None:
+            origin = await self._set_range()
+            floor = origin - depth
+            await self._db.start_crawl(origin, floor)
+            watermark = origin
+        else:
+            origin, floor, watermark = crawl_state
+            self._range = origin
+            logging.info(f'Resuming crawl from vacancy {watermark} ({origin - watermark} of {origin - floor} ids done)')
+        await self._crawl(origin, floor, watermark)
+
+    async def update(self, overlap: int = 20000):
+        await self._set_roles()
+        last_stored = await self._db.get_max_id()
+        origin = await self._set_range()
+        floor = max(last_stored - overlap, 0)
+        if origin <= floor:
+            logging.info(f'No new vacancies above {last_stored}')
+            return
+        logging.info(f'Collecting vacancies from {origin} down to {floor} (last stored {last_stored})')
+        await self._db.start_crawl(origin, floor)
+        await self._crawl(origin, floor, origin)
+
+    async def crawl_range(self, origin: int, floor: int):
+        await self._set_roles()
+        await self._db.start_crawl(origin, floor)
+        _, _, watermark = await self._db.get_crawl_state_for(origin)
+        if watermark > floor:
+            await self._crawl(origin, floor, watermark)
@@ -0,0 +1,76 @@
+import time
+import zlib
+from array import array
+
+
+class IdIndex:
+    """
+    Компактный индекс исходов по id вакансий: 2 бита на id в чанках по 65536 id
+    (16 КБ на чанк, около 3 МБ на 12 млн id) и день последней проверки на каждые 1024 id,
+    чтобы отсутствующие id можно было перепроверять по истечении TTL.
+    """
+    UNKNOWN, ABSENT, NON_IT, STORED = 0, 1, 2, 3
+    _CHUNK_BITS = 16
+    _SPAN_BITS = 10
+    CHUNK_SIZE = 1 << _CHUNK_BITS
+
+    def __init__(self, absent_ttl_days: int = 30):
+        self.absent_ttl_days = absent_ttl_days
+        self._outcomes: dict[int, bytearray] = {}
+        self._checked: dict[int, array] = {}
+        self._dirty: set[int] = set()
+
+    @staticmethod
+    def today() -> int:
+        return int(time.time() // 86400)
+
+    @classmethod
+    def from_rows(cls, rows, absent_ttl_days: int = 30):
+        index = cls(absent_ttl_days)
+        for chunk_no, outcomes, checked in rows:
+            index._outcomes[chunk_no] = bytearray(zlib.decompress(outcomes))
+            index._checked[chunk_no] = array('I', checked)
+        return index
+
+    def _locate(self, vacancy_id: int):
+        return vacancy_id >> self._CHUNK_BITS, vacancy_id & ((1 << self._CHUNK_BITS) - 1)
+
+    def get(self, vacancy_id: int) -> int:
+        chunk_no, offset = self._locate(vacancy_id)
+        outcomes = self._outcomes.get(chunk_no)
+        if outcomes is None:
+            return self.UNKNOWN
+        return (outcomes[offset >> 2] >> ((offset & 3) * 2)) & 3
+
+    def set(self, vacancy_id: int, outcome: int, day: int | None = None):
+        chunk_no, offset = self._locate(vacancy_id)
+        if chunk_no not in self._outcomes:
+            self._outcomes[chunk_no] = bytearray(1 << (self._CHUNK_BITS - 2))
+            self._checked[chunk_no] = array('I', bytes(4 << (self._CHUNK_BITS - self._SPAN_BITS)))
+        outcomes = self._outcomes[chunk_no]
+        shift = (offset & 3) * 2
+        outcomes[offset >> 2] = (outcomes[offset >> 2] & ~(3 << shift)) | (outcome << shift)
+        self._checked[chunk_no][offset >> self._SPAN_BITS] = self.today() if day is None else day
+        self._dirty.add(chunk_no)
+
+    def should_fetch(self, vacancy_id: int, day: int | None = None) -> bool:
+        outcome = self.get(vacancy_id)
+        if outcome == self.ABSENT:
+            chunk_no, offset = self._locate(vacancy_id)
+            checked = self._checked[chunk_no][offset >> self._SPAN_BITS]
+            return (self.today() if day is None else day) - checked >= self.absent_ttl_days
+        return outcome == self.UNKNOWN
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def dirty_chunks(self):
+        chunks = [(chunk_no, zlib.compress(bytes(self._outcomes[chunk_no])), self._checked[chunk_no].tobytes())
+                  for chunk_no in sorted(self._dirty)]
+        self._dirty.clear()
+        return chunks
+
+    def memory_usage(self) -> int:
+        return sum(len(outcomes) + checked.itemsize * len(checked)
+                   for outcomes, checked in zip(self._outcomes.values(), self._checked.values()))
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from httpx import AsyncClient
+
+from src.api.hh_api import HeadHunterApi
+from src.api.rate_controller import RateController, ThrottledError
+from src.db_manager.db import Database
+from src.models.vacancy_model import Vacancy
+from src.utils import VacancyParser
+
+_HOUR = 3600
+_DAY = 24 * _HOUR
+
+
+@dataclass
+class RefreshResult:
+    id: int
+    checked_at: int
+    next_check_at: int | None
+    previous_checked_at: int
+    etag: str | None = None
+    last_modified: str | None = None
+    vacancy: Vacancy | None = None
+    tracked: tuple = ()
+    changed: bool = False
+    archived: bool = False
+
+
+def next_check_interval(age_days: float, changes: int) -> int:
+    """
+    Свежие вакансии проверяются чаще старых, а каждое замеченное изменение
+    сокращает интервал: base / (1 + changes), но не чаще раза в 6 часов.
+    """
+    if age_days < 7:
+        base = _DAY
+    elif age_days < 30:
+        base = 3 * _DAY
+    else:
+        base = 14 * _DAY
+    return max(6 * _HOUR, base // (1 + changes))
+
+
+def _published_timestamp(published_at: str) -> float | None:
+    try:
+        return datetime.fromisoformat(published_at).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+class Refresher:
+    _BATCH = 500
+
+    def __init__(self, client: AsyncClient, db: Database, rate_controller: RateController | None = None,
+                 api_url: str | None = None):
+        self._hh = HeadHunterApi(
+            client,
+            rate_controller,
+            api_url
+        )
+        self._db = db
+        self._parser = VacancyParser()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        logging.info('Refresher is stopping, the current batch will be finished')
+        self._stopping.set()
+
+    async def _refresh_vacancy(self, row) -> RefreshResult | None:
+        (vacancy_id, etag, last_modified, checked_at, changes, _,
+         published_at, *previous_tracked) = row
+        try:
+            status, data, new_etag, new_last_modified = await self._hh.get_vacancy_conditional(
+                vacancy_id, etag, last_modified
+            )
+        except ThrottledError:
+            logging.info(f'Refresh of vacancy {vacancy_id} is throttled and will be retried later')
+            return None
+        except Exception as e:
+            logging.warning(f'Error while refreshing vacancy {vacancy_id}: {str(e)}')
+            return None
+        now = int(time.time())
+        result = RefreshResult(id=vacancy_id, checked_at=now, next_check_at=None,
+                               previous_checked_at=checked_at or 0, etag=new_etag,
+                               last_modified=new_last_modified, tracked=tuple(previous_tracked))
+        if status == 404 or isinstance(data, dict) and data.get('errors'):
+            result.archived = result.changed = True
+            return result
+        if status != 304:
+            vacancy = self._parser.parse([data])[0]
+            if vacancy is not None:
+                result.vacancy = vacancy
+                result.tracked = Database.vacancy_row(vacancy)[3:6]
+                result.archived = bool(data.get('archived'))
+                result.changed = result.archived or result.tracked != tuple(previous_tracked)
+        if not result.archived:
+            published = _published_timestamp(published_at)
+            age_days = (now - published) / _DAY if published else 0
+            result.next_check_at = now + next_check_interval(age_days, changes + result.changed)
+        return result
+
+    async def start(self):
+        await self._db.create_refresh_tables()
+        starting_time = time.time()
+        checked = changed = closed = 0
+        # остановка проверяется между пачками: начатая пачка дописывается через apply_refresh целиком
+        while not self._stopping.is_set() and (rows := await self._db.get_due_refresh(int(time.time()),
+                                                                                      self._BATCH)):
+            results = [result for result in await asyncio.gather(*(self._refresh_vacancy(row) for row in rows))
+                       if result is not None]
+            if not results:
+                logging.warning(f'{len(rows)} due vacancies could not be refreshed, they are left for the next run')
+                break
+            await self._db.apply_refresh(results)
+            checked += len(results)
+            changed += sum(result.changed for result in results)
+            closed += sum(result.archived for result in results)
+        if self._parser.rejected:
+            logging.warning(f'{sum(self._parser.rejected.values())} refreshed vacancies were rejected by the parser: '
+                            f'{dict(self._parser.rejected.most_common(10))}')
+        logging.info(f'Refreshed {checked} vacancies: {changed} changed, {closed} closed. '
+                     f"Refresher's time spent: {time.time() - starting_time:.3f} sec")
@@ -0,0 +1,178 @@
+"""
+Распределённый обход диапазона id: диапазон делится на аренды (leases) в общей таблице crawl_leases,
+каждый процесс-воркер забирает свободную или просроченную аренду и продлевает её, пока работает.
+
+    python -m src.data_collector.sharding plan --depth 12000000
+    python -m src.data_collector.sharding worker --processes 4
+    python -m src.data_collector.sharding status --watch 30
+
+Воркеры на нескольких машинах с общим каталогом пишут базу через сетевую файловую систему, где WAL
+не работает: каждую команду тогда нужно запускать с `--no-wal` (журнал DELETE) или с SQLITE_WAL=0, как и остальные
+программы, открывающие эту базу: соединение в режиме WAL снова переводит её в WAL.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import httpx
+
+from src.api.hh_api import HeadHunterApi
+from src.api.rate_controller import RateController
+from src.data_collector.collector import Collector
+from src.data_collector.id_index import IdIndex
+from src.db_manager.db import Database
+
+_LOCK_TIMEOUT = 60.0
+
+
+def lease_ranges(origin: int, depth: int, lease_size: int):
+    # границы аренд выровнены по чанкам IdIndex, чтобы воркеры никогда не писали один и тот же чанк
+    chunk = IdIndex.CHUNK_SIZE
+    lease_size = max(chunk, lease_size // chunk * chunk)
+    bottom = origin - depth
+    ceiling, floor = origin, origin // lease_size * lease_size - 1
+    ranges = []
+    while ceiling > bottom:
+        ranges.append((ceiling, max(floor, bottom)))
+        ceiling, floor = floor, floor - lease_size
+    return ranges
+
+
+async def plan(db_name: str, depth: int, lease_size: int, api_url: str | None = None, wal: bool = True):
+    db = Database(db_name, timeout=_LOCK_TIMEOUT, wal=wal)
+    await db.async_connect()
+    await db.create_table()
+    async with httpx.AsyncClient() as client:
+        last_vacancy = await HeadHunterApi(client, api_url=api_url).get_vacancies()
+    ranges = lease_ranges(int(last_vacancy['items'][0]['id']), depth, lease_size)
+    await db.plan_leases(ranges)
+    await db.async_disconnect()
+    logging.info(f'{len(ranges)} leases are planned from {ranges[0][0]} down to {ranges[-1][1]}')
+
+
+async def _keep_lease(lease_db: Database, range_start: int, owner: str, ttl: float, collector: Collector):
+    while True:
+        await asyncio.sleep(ttl / 3)
+        if not await lease_db.renew_lease(range_start, owner, time.time() + ttl):
+            logging.warning(f'Lease {range_start} was lost by {owner}, stopping')
+            collector.stop()
+            return
+
+
+async def run_worker(db_name: str, owner: str, ttl: float, rate: float, api_url: str | None = None,
+                     wal: bool = True):
+    db = Database(db_name, timeout=_LOCK_TIMEOUT, wal=wal)
+    # аренды продлеваются через отдельное соединение, чтобы не вмешиваться в транзакции записи
+    lease_db = Database(db_name, timeout=_LOCK_TIMEOUT, wal=wal)
+    await db.async_connect()
+    await lease_db.async_connect()
+    await db.create_table()
+    stopping = asyncio.Event()
+    collector = None
+
+    def stop():
+        stopping.set()
+        if collector is not None:
+            collector.stop()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+    async with httpx.AsyncClient() as client:
+        while not stopping.is_set() and (lease := await lease_db.claim_lease(owner, time.time(), ttl)):
+            range_start, range_end = lease
+            logging.info(f'{owner} has claimed lease {range_start} - {range_end}')
+            collector = Collector(client, db, RateController(rate=rate, burst=max(1, int(rate))), api_url=api_url)
+            keeper = asyncio.create_task(_keep_lease(lease_db, range_start, owner, ttl, collector))
+            try:
+                await collector.crawl_range(range_start, range_end)
+            finally:
+                keeper.cancel()
+            crawl_state = await db.get_crawl_state_for(range_start)
+            if crawl_state is not None and crawl_state[2] <= crawl_state[1]:
+                await lease_db.finish_lease(range_start, owner)
+                logging.info(f'{owner} has finished lease {range_start} - {range_end}')
+    await lease_db.async_disconnect()
+    await db.async_disconnect()
+
+
+def _worker_process(db_name: str, ttl: float, rate: float, api_url: str | None, wal: bool):
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    asyncio.run(run_worker(db_name, f'{socket.gethostname()}:{os.getpid()}', ttl, rate, api_url, wal))
+
+
+def start_workers(db_name: str, processes: int, ttl: float, rate: float, api_url: str | None = None,
+                  wal: bool = True):
+    workers = [multiprocessing.Process(target=_worker_process, args=(db_name, ttl, rate / processes, api_url, wal))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def report(db_name: str, wal: bool = True):
+    db = Database(db_name, timeout=_LOCK_TIMEOUT, wal=wal)
+    db.connect()
+    leases = db.get_lease_progress()
+    db.disconnect()
+    now = time.time()
+    total = sum(range_start - range_end for range_start, range_end, *_ in leases)
+    done = sum(range_start - watermark for range_start, _, _, _, _, watermark in leases)
+    finished = sum(1 for lease in leases if lease[4])
+    active = [lease for lease in leases if not lease[4] and lease[2] and lease[3] and lease[3] >= now]
+    expired = sum(1 for lease in leases if not lease[4] and lease[2] and lease[3] and lease[3] < now)
+    print(f'leases: {len(leases)} total, {finished} done, {len(active)} active, {expired} expired')
+    print(f'ids: {done} of {total} ({done / total:.1%})' if total else 'ids: no leases planned')
+    for range_start, range_end, owner, _, _, watermark in active:
+        print(f'  {owner}: {range_start} - {range_end}, {range_start - watermark} of {range_start - range_end} ids')
+    return done
+
+
+def watch(db_name: str, interval: float, wal: bool = True):
+    previous = report(db_name, wal)
+    while True:
+        time.sleep(interval)
+        done = report(db_name, wal)
+        print(f'rate: {(done - previous) / interval:.1f} ids/sec')
+        previous = done
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m src.data_collector.sharding')
+    parser.add_argument('--db', default='db.sqlite')
+    parser.add_argument('--api-url', default=os.getenv('HH_API_URL'))
+    parser.add_argument('--no-wal', dest='wal', action='store_false', default=os.getenv('SQLITE_WAL', '1') != '0',
+                        help='DELETE journal mode, required when workers on several machines share the database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan_parser = commands.add_parser('plan')
+    plan_parser.add_argument('--depth', type=int, default=12000000)
+    plan_parser.add_argument('--lease-size', type=int, default=IdIndex.CHUNK_SIZE * 2)
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('--processes', type=int, default=os.cpu_count())
+    worker_parser.add_argument('--lease-ttl', type=float, default=120.0)
+    worker_parser.add_argument('--rate', type=float, default=30.0, help='requests per second for this machine')
+    status_parser = commands.add_parser('status')
+    status_parser.add_argument('--watch', type=float, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    if args.command == 'plan':
+        asyncio.run(plan(args.db, args.depth, args.lease_size, args.api_url, args.wal))
+    elif args.command == 'worker':
+        start_workers(args.db, args.processes, args.lease_ttl, args.rate, args.api_url, args.wal)
+    elif args.watch:
+        watch(args.db, args.watch, args.wal)
+    else:
+        report(args.db, args.wal)
+
+
+if __name__ == '__main__':
+    main()
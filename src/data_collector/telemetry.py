@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+import logging
+import os
+import time
+from collections import Counter
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # верхняя граница корзины, в которую попал q-квантиль — для строки прогресса этой точности хватает
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def render(self, name: str) -> list[str]:
+        lines, seen = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {seen}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum:.6f}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+class CollectorMetrics:
+    """
+    Счётчики, гистограммы задержек и прогресс обхода сборщика.
+    Выгружаются в текстовом формате Prometheus (для node_exporter textfile collector)
+    и в одну строку лога.
+    """
+    COUNTERS = {
+        'fetched': 'Vacancy ids answered by the API, 404 included',
+        'not_found': 'Vacancy ids answered with 404',
+        'skipped': 'Vacancies skipped as non-IT',
+        'inserted': 'Vacancies written to the database',
+        'rejected': 'Vacancies rejected by the parser',
+        'throttled': 'HTTP responses with status 429',
+        'deferred': 'Vacancy ids deferred to the retry queue after exhausting attempts',
+        'errors': 'Transport errors, 5xx responses and failed writes',
+    }
+    HISTOGRAMS = {
+        'http_request': 'HTTP request latency',
+        'parse_batch': 'Parse stage latency per batch',
+        'db_write': 'Database write latency per flushed batch',
+    }
+
+    def __init__(self, rate_controller=None):
+        self.rate_controller = rate_controller
+        self.counters = Counter()
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+        self.started_at = time.monotonic()
+        self.ids_total = 0
+        self.ids_done = 0
+        self._progress_started_at = self.started_at
+
+    def inc(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def observe(self, name: str, seconds: float):
+        self.histograms[name].observe(seconds)
+
+    def start_progress(self, total: int):
+        self.ids_total = total
+        self.ids_done = 0
+        self._progress_started_at = time.monotonic()
+
+    def advance(self, ids: int):
+        self.ids_done += ids
+
+    @property
+    def ids_per_second(self) -> float:
+        elapsed = time.monotonic() - self._progress_started_at
+        return self.ids_done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        rate = self.ids_per_second
+        if not self.ids_total or not rate:
+            return None
+        return max(self.ids_total - self.ids_done, 0) / rate
+
+    def render(self) -> str:
+        lines = []
+        for name, help_text in self.COUNTERS.items():
+            metric = f'hh_collector_{name}_total'
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter', f'{metric} {self.counters[name]}']
+        for name, help_text in self.HISTOGRAMS.items():
+            metric = f'hh_collector_{name}_seconds'
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+            lines += self.histograms[name].render(metric)
+        gauges = {
+            'ids_total': ('Vacancy ids in the current range', self.ids_total),
+            'ids_done': ('Vacancy ids of the current range already processed', self.ids_done),
+            'ids_per_second': ('Average progress over the current range', round(self.ids_per_second, 3)),
+            'eta_seconds': ('Estimated time to finish the current range', round(self.eta or 0, 1)),
+            'uptime_seconds': ('Time since the collector has started', round(time.monotonic() - self.started_at, 1)),
+        }
+        if self.rate_controller is not None:
+            gauges['concurrency'] = ('Current concurrency limit', self.rate_controller.limit)
+            gauges['in_flight'] = ('Requests in flight', self.rate_controller.in_flight)
+        for name, (help_text, value) in gauges.items():
+            metric = f'hh_collector_{name}'
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge', f'{metric} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        # запись через временный файл, чтобы экспортер никогда не прочитал половину
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            file.write(self.render())
+        os.replace(temporary, path)
+
+    def progress_line(self) -> str:
+        counters = self.counters
+        eta = self.eta
+        progress = (f'{self.ids_done}/{self.ids_total} ids ({self.ids_done / self.ids_total:.1%})'
+                    if self.ids_total else f'{self.ids_done} ids')
+        concurrency = f', concurrency {self.rate_controller.limit}' if self.rate_controller is not None else ''
+        return (f'Progress: {progress}, {self.ids_per_second:.1f} ids/sec, '
+                f'fetched {counters["fetched"]}, inserted {counters["inserted"]}, 404 {counters["not_found"]}, '
+                f'non-IT {counters["skipped"]}, 429 {counters["throttled"]}, errors {counters["errors"]}, '
+                f'http p50/p99 {self.histograms["http_request"].quantile(0.5)}/'
+                f'{self.histograms["http_request"].quantile(0.99)} sec{concurrency}'
+                + (f', ETA {int(eta) // 3600}:{int(eta) % 3600 // 60:02}:{int(eta) % 60:02}' if eta is not None else ''))
+
+    def report(self, path: str | None = None):
+        if path:
+            try:
+                self.write_textfile(path)
+            except OSError as e:
+                logging.warning(f'Metrics file {path} was not written: {str(e)}')
+        logging.info(self.progress_line())
+
+    async def report_periodically(self, interval: float, path: str | None = None):
+        while True:
+            await asyncio.sleep(interval)
+            self.report(path)
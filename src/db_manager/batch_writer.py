@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+
+
+class BatchWriter:
+    """
+    Буферизует вакансии и записывает их пачками: одна транзакция на пачку,
+    сброс по размеру буфера или по времени с момента последней записи.
+    """
+
+    def __init__(self, db, batch_size: int = 500, flush_interval: float = 5.0, index=None, metrics=None):
+        self._db = db
+        self._index = index
+        self._metrics = metrics
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.failed = []
+        self._vacancies = []
+        self._checkpoint = None
+        self._throttled = []
+        self._retried = []
+        self._flushed_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._timer.cancel()
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                await self.flush()
+
+    async def add(self, vacancies, checkpoint: tuple[int, int] | None = None, throttled=(), retried=()):
+        self._vacancies.extend(vacancies)
+        self._throttled.extend(throttled)
+        self._retried.extend(retried)
+        if checkpoint is not None:
+            self._checkpoint = checkpoint
+        if (len(self._vacancies) >= self.batch_size
+                or time.monotonic() - self._flushed_at >= self.flush_interval):
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not (self._vacancies or self._checkpoint or self._throttled or self._retried
+                    or self._index is not None and self._index.dirty):
+                return
+            vacancies, self._vacancies = self._vacancies, []
+            checkpoint, self._checkpoint = self._checkpoint, None
+            throttled, self._throttled = self._throttled, []
+            retried, self._retried = self._retried, []
+            starting_time = time.monotonic()
+            failed = await self._db.insert_vacancies(vacancies, checkpoint=checkpoint,
+                                                     throttled=throttled, retried=retried, index=self._index)
+            if self._metrics is not None:
+                self._metrics.observe('db_write', time.monotonic() - starting_time)
+                self._metrics.inc('inserted', len(vacancies) - len(failed))
+                self._metrics.inc('errors', len(failed))
+            if failed:
+                logging.warning(f'{len(failed)} of {len(vacancies)} vacancies were not inserted')
+                self.failed.extend(failed)
+            self._flushed_at = time.monotonic()
@@ -1,35 +1,252 @@
+import json
 import logging
+import math
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
 
 import aiosqlite
 import sqlite3
 
-from src.db_manager.statements import CollectorStatements, AnalyticStatements
+from src.db_manager.batch_writer import BatchWriter
+from src.db_manager.statements import (SCHEMA_VERSION, CollectorStatements, RefreshStatements, AnalyticStatements,
+                                       MigrationStatements, SnapshotStatements, RollupStatements, SketchStatements)
+
+
+# WAL: читатели не блокируют писателя и видят согласованный снимок на момент начала транзакции.
+# synchronous = NORMAL в режиме WAL не теряет целостность, только последние транзакции при сбое питания.
+# WAL держит индекс в разделяемой памяти (-shm) и работает только на одной машине: если базу через сетевую
+# файловую систему пишут несколько машин, нужен журнал DELETE (Database(..., wal=False))
+_WRITER_PRAGMAS = (
+    'PRAGMA cache_size = -65536',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+)
+_READER_PRAGMAS = (
+    'PRAGMA cache_size = -65536',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+def _ln(value):
+    return math.log(value) if value is not None and value > 0 else None
+
+
+def _ceil(value):
+    return math.ceil(value) if value is not None else None
+
+
+# ln и ceil (корзины salary_sketches) есть только в SQLite 3.35+, собранной с SQLITE_ENABLE_MATH_FUNCTIONS:
+# без них на соединении записи регистрируются такие же функции на Python
+_MATH_FUNCTIONS = (('ln', 1, _ln), ('ceil', 1, _ceil))
+_MATH_PROBE = 'SELECT ln(1), ceil(1)'
+
+
+class LegacySchemaError(RuntimeError):
+    pass
+
+
+class JournalModeError(RuntimeError):
+    pass
+
+
+class ReaderPool:
+    """
+    Небольшой пул соединений только для чтения. Соединения создаются по требованию,
+    не больше `size`; при исчерпании пула `acquire` ждёт, пока соединение вернут.
+    """
+
+    def __init__(self, db_name: str, size: int = 4, timeout: float = 5.0):
+        self._uri = f'{Path(db_name).resolve().as_uri()}?mode=ro'
+        self._size = size
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._uri, uri=True, timeout=self._timeout, check_same_thread=False)
+        for pragma in _READER_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self._size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return self._open()
+        except sqlite3.Error:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
 
 
 class Database:
-    def __init__(self):
-        self._db_name = 'db.sqlite'
+    """
+    Доступ к db.sqlite: одно соединение на запись (`connect` или `async_connect`) и пул соединений
+    только для чтения, из которого `snapshot` выдаёт согласованный снимок базы для аналитики.
+    `wal=False` переводит базу в журнал DELETE — для записи с нескольких машин через общий каталог.
+    """
+
+    def __init__(self, db_name: str = 'db.sqlite', timeout: float = 5.0, readers: int = 4, wal: bool = True):
+        self._db_name = db_name
+        self._timeout = timeout
+        self._readers = readers
+        self._journal_mode = 'WAL' if wal else 'DELETE'
+        self._synchronous = 'NORMAL' if wal else 'FULL'
+        self._pool: ReaderPool | None = None
         self._conn: aiosqlite.Connection | sqlite3.Connection | None = None
 
+    def _check_journal_mode(self, mode: str):
+        # режим журнала не меняется, пока базу держат другие соединения: писать в неё в чужом режиме нельзя
+        if mode.upper() != self._journal_mode:
+            raise JournalModeError(f'{self._db_name} stays in {mode} journal mode, close other connections '
+                                   f'to switch it to {self._journal_mode}')
+
     def connect(self):
         if self._conn is None:
-            self._conn = sqlite3.connect(self._db_name)
+            conn = sqlite3.connect(self._db_name, timeout=self._timeout)
+            try:
+                self._check_journal_mode(conn.execute(f'PRAGMA journal_mode = {self._journal_mode}').fetchone()[0])
+            except Exception:
+                conn.close()
+                raise
+            for pragma in (f'PRAGMA synchronous = {self._synchronous}', *_WRITER_PRAGMAS):
+                conn.execute(pragma)
+            try:
+                conn.execute(_MATH_PROBE)
+            except sqlite3.OperationalError:
+                for name, arguments, function in _MATH_FUNCTIONS:
+                    conn.create_function(name, arguments, function, deterministic=True)
+            self._conn = conn
 
     def disconnect(self):
         self._conn.close()
         self._conn = None
+        self.close_readers()
 
     async def async_connect(self):
         if self._conn is None:
-            self._conn = await aiosqlite.connect(self._db_name)
+            conn = await aiosqlite.connect(self._db_name, timeout=self._timeout)
+            try:
+                async with conn.execute(f'PRAGMA journal_mode = {self._journal_mode}') as cursor:
+                    self._check_journal_mode((await cursor.fetchone())[0])
+            except Exception:
+                await conn.close()
+                raise
+            for pragma in (f'PRAGMA synchronous = {self._synchronous}', *_WRITER_PRAGMAS):
+                await conn.execute(pragma)
+            try:
+                await conn.execute(_MATH_PROBE)
+            except sqlite3.OperationalError:
+                for name, arguments, function in _MATH_FUNCTIONS:
+                    await conn.create_function(name, arguments, function, deterministic=True)
+            self._conn = conn
 
     async def async_disconnect(self):
         await self._conn.close()
         self._conn = None
+        self.close_readers()
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Отдаёт `Database` на соединении из пула чтения с открытой транзакцией: все запросы внутри
+        `with` видят базу на момент первого чтения, даже если параллельно идёт запись.
+        """
+        if self._pool is None:
+            self._pool = ReaderPool(self._db_name, self._readers, self._timeout)
+        pool = self._pool
+        conn = pool.acquire()
+        try:
+            conn.execute('BEGIN')
+            reader = Database(self._db_name, self._timeout)
+            reader._conn = conn
+            yield reader
+        finally:
+            conn.rollback()
+            pool.release(conn)
+
+    def close_readers(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    @staticmethod
+    def _schema_version(columns: set, user_version: int) -> int | None:
+        if not columns:
+            return None
+        if 'professional_role_id' not in columns:
+            return 1
+        return max(user_version, 2)
+
+    def schema_version(self) -> int | None:
+        columns = {row[0] for row in self._conn.execute(CollectorStatements.get_columns())}
+        return self._schema_version(columns, self._conn.execute('PRAGMA user_version').fetchone()[0])
 
     async def create_table(self):
+        async with self._conn.execute(CollectorStatements.get_columns()) as cursor:
+            columns = {row[0] for row in await cursor.fetchall()}
+        async with self._conn.execute('PRAGMA user_version') as cursor:
+            version = self._schema_version(columns, (await cursor.fetchone())[0])
+        if version is not None and version < SCHEMA_VERSION:
+            raise LegacySchemaError(f'{self._db_name} uses the v{version} schema, '
+                                    f'run python -m src.db_manager.migrate --db {self._db_name} first')
+        # схема создаётся в одной транзакции: скетчи по существующим вакансиям строит только один процесс
+        await self._conn.execute('BEGIN IMMEDIATE')
+        async with self._conn.execute(MigrationStatements.has_table(), ('salary_sketches',)) as cursor:
+            has_sketches = await cursor.fetchone() is not None
+        unused_rollups = False
+        async with self._conn.execute(MigrationStatements.has_table(), ('rollup_state',)) as cursor:
+            if await cursor.fetchone() is not None:
+                await cursor.execute(RollupStatements.get_watermark())
+                unused_rollups = await cursor.fetchone() is None
         async with self._conn.cursor() as cursor:
             await cursor.execute(CollectorStatements.create_table())
+            await cursor.execute(CollectorStatements.create_skills())
+            await cursor.execute(CollectorStatements.create_vacancy_skills())
+            await cursor.execute(CollectorStatements.create_vacancy_skills_index())
+            for statement in AnalyticStatements.create_indexes():
+                await cursor.execute(statement)
+            if unused_rollups:
+                # таблицы сводки, созданные вместе со схемой, но ни разу не построенные: журнал в них только рос
+                for statement in RollupStatements.drop_rollups():
+                    await cursor.execute(statement)
+            if not has_sketches:
+                for statement in SketchStatements.create_sketches():
+                    await cursor.execute(statement)
+                await cursor.execute(SketchStatements.build())
+            await cursor.execute(CollectorStatements.create_data_version())
+            await cursor.execute(CollectorStatements.seed_data_version())
+            await cursor.execute(CollectorStatements.create_data_origin())
+            await cursor.execute(CollectorStatements.seed_data_origin())
+            if version is None:
+                await cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            await cursor.execute(CollectorStatements.create_crawl_state())
+            await cursor.execute(CollectorStatements.create_retry_queue())
+            await cursor.execute(CollectorStatements.create_id_index())
+            await cursor.execute(CollectorStatements.create_crawl_leases())
         await self._conn.commit()
         return await self.check_table()
 
@@ -38,30 +255,360 @@ class Database:
             result = await cursor.fetchone()
         return result
 
-    async def insert_vacancy(self, vacancy):
+    async def get_max_id(self):
+        async with self._conn.execute(CollectorStatements.get_max_id()) as cursor:
+            result = await cursor.fetchone()
+        return result[0]
+
+    async def start_crawl(self, origin: int, floor: int):
+        await self._conn.execute(CollectorStatements.start_crawl(), (origin, floor, origin))
+        await self._conn.commit()
+
+    async def get_crawl_state(self):
+        async with self._conn.execute(CollectorStatements.get_crawl_state()) as cursor:
+            result = await cursor.fetchone()
+        return result
+
+    async def get_crawl_state_for(self, origin: int):
+        async with self._conn.execute(CollectorStatements.get_crawl_state_for(), (origin,)) as cursor:
+            result = await cursor.fetchone()
+        return result
+
+    async def plan_leases(self, ranges):
+        await self._conn.executemany(CollectorStatements.insert_lease(), ranges)
+        await self._conn.commit()
+
+    async def claim_lease(self, owner: str, now: float, ttl: float):
+        async with self._conn.execute(CollectorStatements.claim_lease(), (owner, now + ttl, now)) as cursor:
+            result = await cursor.fetchone()
+        await self._conn.commit()
+        return result
+
+    async def renew_lease(self, range_start: int, owner: str, expires_at: float):
+        async with self._conn.execute(CollectorStatements.renew_lease(), (expires_at, range_start, owner)) as cursor:
+            renewed = cursor.rowcount
+        await self._conn.commit()
+        return renewed > 0
+
+    async def finish_lease(self, range_start: int, owner: str):
+        await self._conn.execute(CollectorStatements.finish_lease(), (range_start, owner))
+        await self._conn.commit()
+
+    def get_lease_progress(self):
+        cursor = self._conn.cursor()
+        cursor.execute(CollectorStatements.get_lease_progress())
+        return cursor.fetchall()
+
+    async def get_throttled(self, limit: int, below: int | None = None, above: int | None = None):
+        below = (1 << 63) - 1 if below is None else below
+        above = -(1 << 63) if above is None else above
+        async with self._conn.execute(CollectorStatements.get_throttled(), (below, above, limit)) as cursor:
+            result = await cursor.fetchall()
+        return [row[0] for row in result]
+
+    async def get_id_index(self):
+        async with self._conn.execute(CollectorStatements.get_id_index()) as cursor:
+            result = await cursor.fetchall()
+        return result
+
+    @staticmethod
+    def vacancy_row(vacancy):
+        # published_at хранится как местное время публикации без смещения: 'YYYY-MM-DD HH:MM:SS'
+        return (vacancy.id,
+                vacancy.name,
+                vacancy.city,
+                vacancy.salary_bottom,
+                vacancy.salary_top,
+                vacancy.currency,
+                vacancy.published_at[:19].replace('T', ' '),
+                vacancy.employer_name,
+                ', '.join(vacancy.key_skills) if vacancy.key_skills else None,
+                vacancy.schedule,
+                vacancy.professional_role_id,
+                vacancy.professional_role,
+                vacancy.experience)
+
+    async def _upsert_vacancies(self, cursor: aiosqlite.Cursor, vacancies):
+        statement = CollectorStatements.insert_vacancy()
+        rows = [self.vacancy_row(vacancy) for vacancy in vacancies]
+        ids = json.dumps([row[0] for row in rows])
+        failed = []
+        # журнал сводки ведётся, только если она включена (create_rollups): прежние версии строк уходят
+        # из сводки, новые попадают в неё при refresh_rollups; строки, которые не записались, дают пару -1/+1
+        # с одинаковыми значениями. Скетчи зарплат обновляются сразу, в той же транзакции
+        await cursor.execute(MigrationStatements.has_table(), ('rollup_changes',))
+        rollups = await cursor.fetchone() is not None
+        if rollups:
+            await cursor.execute(RollupStatements.log_changes(-1), (ids,))
+        await cursor.execute(SketchStatements.fold(-1), {'ids': ids})
+        await cursor.execute('SAVEPOINT insert_vacancies')
         try:
-            async with self._conn.cursor() as cursor:
-                statement = CollectorStatements.insert_vacancy()
-                await cursor.execute(statement,
-                                     (vacancy.id,
-                                      f'"{vacancy.name}"',
-                                      f'"{vacancy.city}"',
-                                      f'"{vacancy.salary_bottom}"',
-                                      f'"{vacancy.salary_top}"',
-                                      f'"{vacancy.currency}"',
-                                      f'"{vacancy.published_at}"',
-                                      f'"{vacancy.employer_name}"',
-                                      f'"{vacancy.key_skills}"',
-                                      f'"{vacancy.schedule}"',
-                                      f'"{vacancy.professional_role}"',
-                                      f'"{vacancy.experience}"'))
-                await self._conn.commit()
-        except Exception as e:
-            logging.warning(f'Error while insert: {str(e)}')
-
-    def select_for_analytics(self, statement):
+            await cursor.executemany(statement, rows)
+        except sqlite3.Error:
+            # пачка целиком не прошла — повторяем построчно, чтобы сохранить остальные и назвать виновные
+            await cursor.execute('ROLLBACK TO insert_vacancies')
+            for vacancy, row in zip(vacancies, rows):
+                try:
+                    await cursor.execute(statement, row)
+                except sqlite3.Error as e:
+                    logging.warning(f'Error while insert vacancy {vacancy.id}: {str(e)}')
+                    failed.append((vacancy.id, str(e)))
+        failed_ids = {vacancy_id for vacancy_id, _ in failed}
+        await self._link_skills(cursor, [vacancy for vacancy in vacancies if vacancy.id not in failed_ids])
+        await cursor.execute('RELEASE insert_vacancies')
+        if rollups:
+            await cursor.execute(RollupStatements.log_changes(1), (ids,))
+        await cursor.execute(SketchStatements.fold(1), {'ids': ids})
+        await cursor.execute(SketchStatements.delete_empty())
+        return failed
+
+    @staticmethod
+    def _skill_names(key_skills) -> list[str]:
+        return list(dict.fromkeys(name.strip() for name in key_skills or () if name.strip()))
+
+    async def _link_skills(self, cursor, vacancies):
+        skills = [(vacancy.id, self._skill_names(vacancy.key_skills)) for vacancy in vacancies]
+        await cursor.executemany(CollectorStatements.delete_vacancy_skills(),
+                                 [(vacancy_id,) for vacancy_id, _ in skills])
+        names = list({name for _, names in skills for name in names})
+        await cursor.executemany(CollectorStatements.insert_skill(), [(name,) for name in names])
+        await cursor.execute(CollectorStatements.get_skill_ids(), (json.dumps(names, ensure_ascii=False),))
+        skill_ids = dict(await cursor.fetchall())
+        await cursor.executemany(CollectorStatements.link_skill(),
+                                 [(vacancy_id, skill_ids[name]) for vacancy_id, names in skills for name in names])
+
+    async def insert_vacancy(self, vacancy):
+        return await self.insert_vacancies([vacancy])
+
+    async def insert_vacancies(self, vacancies, checkpoint: tuple[int, int] | None = None,
+                               throttled=(), retried=(), index=None):
+        if not self._conn.in_transaction:
+            await self._conn.execute('BEGIN')
+        async with self._conn.cursor() as cursor:
+            failed = await self._upsert_vacancies(cursor, vacancies)
+            if vacancies:
+                await cursor.execute(CollectorStatements.bump_data_version())
+            if index is not None:
+                for vacancy_id, _ in failed:
+                    if str(vacancy_id).isdigit():
+                        index.set(int(vacancy_id), index.UNKNOWN)
+                await cursor.executemany(CollectorStatements.upsert_id_index(), index.dirty_chunks())
+            await cursor.executemany(CollectorStatements.delete_throttled(), [(i,) for i in retried])
+            await cursor.executemany(CollectorStatements.insert_throttled(), [(i,) for i in throttled])
+            if checkpoint is not None:
+                origin, watermark = checkpoint
+                await cursor.execute(CollectorStatements.update_crawl_state(), (watermark, origin))
+        await self._conn.commit()
+        return failed
+
+    async def create_refresh_tables(self):
+        async with self._conn.cursor() as cursor:
+            await cursor.execute(RefreshStatements.create_vacancy_refresh())
+            await cursor.execute(RefreshStatements.create_refresh_index())
+            await cursor.execute(RefreshStatements.create_vacancy_versions())
+            await cursor.execute(RefreshStatements.seed_refresh())
+        await self._conn.commit()
+
+    async def get_due_refresh(self, now: int, limit: int):
+        async with self._conn.execute(RefreshStatements.get_due(), (now, limit)) as cursor:
+            result = await cursor.fetchall()
+        return result
+
+    async def apply_refresh(self, results):
+        if not self._conn.in_transaction:
+            await self._conn.execute('BEGIN')
+        async with self._conn.cursor() as cursor:
+            changed = [result for result in results if result.changed]
+            for result in changed:
+                await cursor.execute(RefreshStatements.insert_initial_version(),
+                                     (result.previous_checked_at, result.id, result.id))
+            failed = await self._upsert_vacancies(cursor, [result.vacancy for result in changed
+                                                           if result.vacancy is not None])
+            if changed:
+                await cursor.execute(CollectorStatements.bump_data_version())
+            for result in changed:
+                salary_bottom, salary_top, currency = result.tracked
+                await cursor.execute(RefreshStatements.insert_version(),
+                                     (result.id, result.checked_at, salary_bottom, salary_top, currency,
+                                      int(result.archived)))
+            await cursor.executemany(RefreshStatements.update_refresh(),
+                                     [(result.etag, result.last_modified, result.checked_at, result.next_check_at,
+                                       int(result.changed), int(result.archived), result.id)
+                                      for result in results])
+        await self._conn.commit()
+        return failed
+
+    def batch_writer(self, batch_size: int = 500, flush_interval: float = 5.0, index=None, metrics=None):
+        return BatchWriter(self, batch_size, flush_interval, index, metrics)
+
+    def _has_table(self, name: str) -> bool:
+        return self._conn.execute(MigrationStatements.has_table(), (name,)).fetchone() is not None
+
+    def start_migration(self) -> int:
+        self._conn.execute(CollectorStatements.create_table('vacancies_v2'))
+        self._conn.commit()
+        return self._conn.execute(MigrationStatements.count_vacancies()).fetchone()[0]
+
+    def migrate_batch(self, batch_size: int) -> int:
+        # пачка копируется и удаляется из старой таблицы в одной транзакции: освобождённые страницы
+        # сразу переиспользуются новой таблицей, а прерванную миграцию можно продолжить с той же точки
+        with self._conn:
+            last_id = self._conn.execute(MigrationStatements.get_migrated_max_id()).fetchone()[0]
+            copied = self._conn.execute(MigrationStatements.copy_vacancies(), (last_id, batch_size)).rowcount
+            last_id = self._conn.execute(MigrationStatements.get_migrated_max_id()).fetchone()[0]
+            self._conn.execute(MigrationStatements.delete_migrated(), (last_id,))
+        return copied
+
+    def finish_migration(self):
+        # подмена таблиц атомарна: либо осталась v1 с недоперенесёнными строками, либо уже полностью v2
+        self._conn.execute('BEGIN')
+        with self._conn:
+            if self._has_table('vacancy_versions'):
+                self._conn.execute(RefreshStatements.create_vacancy_versions('vacancy_versions_v2'))
+                self._conn.execute(MigrationStatements.copy_versions())
+                self._conn.execute('DROP TABLE vacancy_versions')
+                self._conn.execute('ALTER TABLE vacancy_versions_v2 RENAME TO vacancy_versions')
+            self._conn.execute('DROP TABLE vacancies')
+            self._conn.execute('ALTER TABLE vacancies_v2 RENAME TO vacancies')
+            self._conn.execute('PRAGMA user_version = 2')
+
+    def start_skills_migration(self) -> int:
+        with self._conn:
+            self._conn.execute(CollectorStatements.create_skills())
+            self._conn.execute(CollectorStatements.create_vacancy_skills())
+            self._conn.execute(CollectorStatements.create_vacancy_skills_index())
+        # продолжаем после последней связанной вакансии: повторная обработка пачки безвредна
+        return self._conn.execute(MigrationStatements.get_linked_max_id()).fetchone()[0]
+
+    def link_skills_batch(self, last_id: int, batch_size: int) -> tuple[int, int]:
+        with self._conn:
+            rows = self._conn.execute(MigrationStatements.get_key_skills_batch(), (last_id, batch_size)).fetchall()
+            skills = [(vacancy_id, self._skill_names(key_skills.split(','))) for vacancy_id, key_skills in rows]
+            names = list({name for _, names in skills for name in names})
+            self._conn.executemany(CollectorStatements.insert_skill(), [(name,) for name in names])
+            skill_ids = dict(self._conn.execute(CollectorStatements.get_skill_ids(),
+                                                (json.dumps(names, ensure_ascii=False),)))
+            self._conn.executemany(CollectorStatements.link_skill(),
+                                   [(vacancy_id, skill_ids[name]) for vacancy_id, names in skills for name in names])
+        return len(rows), rows[-1][0] if rows else last_id
+
+    def finish_skills_migration(self):
+        with self._conn:
+            self._conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def vacuum(self):
+        self._conn.execute('VACUUM')
+
+    def create_analytic_indexes(self):
+        with self._conn:
+            for statement in AnalyticStatements.create_indexes():
+                self._conn.execute(statement)
+
+    def _rollup_watermark(self) -> int | None:
+        if not self._has_table('rollup_state'):
+            return None
+        state = self._conn.execute(RollupStatements.get_watermark()).fetchone()
+        return state[0] if state else None
+
+    def create_rollups(self):
+        """
+        Включает сводку vacancy_rollups: создаёт её таблицы и строит сводку по vacancies. Только после этого
+        запись вакансий ведёт журнал rollup_changes.
+        """
+        if self._rollup_watermark() is not None:
+            return
+        self._conn.execute('BEGIN IMMEDIATE')
+        with self._conn:
+            # другой процесс мог включить сводку, пока ждали блокировку
+            if self._rollup_watermark() is not None:
+                return
+            for statement in RollupStatements.create_rollups():
+                self._conn.execute(statement)
+            params = {'last': self._conn.execute(RollupStatements.get_last_change()).fetchone()[0]}
+            self._conn.execute(RollupStatements.clear_rollups())
+            self._conn.execute(RollupStatements.rebuild())
+            self._conn.execute(RollupStatements.clear_changes(), params)
+            self._conn.execute(RollupStatements.set_watermark(), params)
+
+    def create_sketches(self):
+        """Создаёт salary_sketches и заполняет её по vacancies, если базу создавала версия без скетчей."""
+        if self._has_table('salary_sketches'):
+            return
+        self._conn.execute('BEGIN IMMEDIATE')
+        with self._conn:
+            # другой процесс мог построить скетчи, пока ждали блокировку
+            if not self._has_table('salary_sketches'):
+                for statement in SketchStatements.create_sketches():
+                    self._conn.execute(statement)
+                self._conn.execute(SketchStatements.build())
+
+    def refresh_rollups(self) -> int:
+        """
+        Переносит в vacancy_rollups изменения vacancies после watermark и возвращает их число.
+        Новые строки прибавляются к своим группам, группы с изменёнными или удалёнными строками
+        пересчитываются по vacancies. Если сводка не включена, она включается и строится по всей таблице.
+        """
+        self.create_rollups()
+        # BEGIN IMMEDIATE: пока сводка обновляется, новые изменения в журнал не попадают
+        self._conn.execute('BEGIN IMMEDIATE')
+        with self._conn:
+            watermark = self._conn.execute(RollupStatements.get_watermark()).fetchone()[0]
+            last = self._conn.execute(RollupStatements.get_last_change()).fetchone()[0]
+            params = {'watermark': watermark, 'last': last}
+            if last > watermark:
+                for statement in RollupStatements.drop_temp():
+                    self._conn.execute(statement)
+                self._conn.execute(RollupStatements.create_stale(), params)
+                self._conn.execute(RollupStatements.index_stale())
+                self._conn.execute(RollupStatements.delete_stale())
+                self._conn.execute(RollupStatements.recompute_stale())
+                self._conn.execute(RollupStatements.create_delta(), params)
+                self._conn.execute(RollupStatements.merge_delta())
+                self._conn.execute(RollupStatements.insert_delta())
+                for statement in RollupStatements.drop_temp():
+                    self._conn.execute(statement)
+            changes = self._conn.execute(RollupStatements.clear_changes(), params).rowcount
+            self._conn.execute(RollupStatements.set_watermark(), params)
+        return changes
+
+    def data_stamp(self) -> str:
+        """
+        Метка версии данных: версия схемы, счётчик транзакций, менявших вакансии, и случайная метка базы.
+        Пока метка не изменилась, выгруженный по ней снимок и сохранённые результаты совпадают с базой.
+        """
+        user_version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        version = (self._conn.execute(SnapshotStatements.get_data_version()).fetchone()[0]
+                   if self._has_table('data_version') else 0)
+        stamp = f'v{user_version}.{version}'
+        if self._has_table('data_origin'):
+            stamp += '.' + self._conn.execute(SnapshotStatements.get_data_origin()).fetchone()[0]
+        return stamp
+
+    def count_for_snapshot(self) -> tuple[int, int]:
+        return (self._conn.execute(SnapshotStatements.count_vacancies()).fetchone()[0],
+                self._conn.execute(SnapshotStatements.count_vacancy_skills()).fetchone()[0])
+
+    def _fetch_batches(self, statement: str, batch_size: int, params=()):
+        cursor = self._conn.execute(statement, params)
+        while rows := cursor.fetchmany(batch_size):
+            yield rows
+
+    def iter_vacancies(self, batch_size: int = 100000):
+        return self._fetch_batches(SnapshotStatements.get_vacancies(), batch_size)
+
+    def iter_vacancy_skills(self, batch_size: int = 100000):
+        return self._fetch_batches(SnapshotStatements.get_vacancy_skills(), batch_size)
+
+    def get_skills(self) -> list[tuple[int, str]]:
+        return self._conn.execute(SnapshotStatements.get_skills()).fetchall()
+
+    def select_for_analytics(self, statement, params=()):
         cursor = self._conn.cursor()
         cursor.execute(
-            AnalyticStatements.choose_statement(statement)
+            AnalyticStatements.choose_statement(statement), params
         )
         return cursor.fetchall()
+
+    def iter_columns(self, table: str, columns: list[str], batch_size: int = 50000):
+        """Столбцы `columns` построчной выборки `stream_{table}` пачками по `batch_size`."""
+        return self._fetch_batches(getattr(AnalyticStatements, f'stream_{table}')(columns), batch_size)
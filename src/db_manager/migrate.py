@@ -0,0 +1,77 @@
+"""
+Обновление схемы db.sqlite на месте, пачками по id — прерванную миграцию достаточно запустить ещё раз.
+
+v1 -> v2: значения в кавычках и '"None"' становятся типизированными значениями и NULL. Каждая пачка
+          копируется и удаляется из старой таблицы в одной транзакции, поэтому память и место на диске ограничены.
+v2 -> v3: справочник навыков skills и связи vacancy_skills заполняются из key_skills.
+
+    python -m src.db_manager.migrate --db db.sqlite --batch-size 50000 --vacuum
+"""
+import argparse
+import logging
+import os
+import time
+
+from src.db_manager.db import Database
+from src.db_manager.statements import SCHEMA_VERSION
+
+
+def _migrate_to_v2(db: Database, db_name: str, batch_size: int):
+    remaining = db.start_migration()
+    logging.info(f'Migrating {remaining} vacancies of {db_name} to the v2 schema')
+    starting_time = time.time()
+    migrated = 0
+    while copied := db.migrate_batch(batch_size):
+        migrated += copied
+        elapsed = time.time() - starting_time
+        logging.info(f'{migrated} of {remaining} vacancies migrated ({migrated / elapsed:.0f} rows/sec)')
+    db.finish_migration()
+
+
+def _migrate_to_v3(db: Database, batch_size: int):
+    last_id = db.start_skills_migration()
+    logging.info('Filling the skills dictionary from key_skills')
+    linked = 0
+    while True:
+        count, last_id = db.link_skills_batch(last_id, batch_size)
+        if not count:
+            break
+        linked += count
+        logging.info(f'Skills of {linked} vacancies are linked (up to vacancy {last_id})')
+    db.finish_skills_migration()
+
+
+def migrate(db_name: str, batch_size: int = 50000, vacuum: bool = False, wal: bool = True):
+    db = Database(db_name, wal=wal)
+    db.connect()
+    version = db.schema_version()
+    if version is None or version >= SCHEMA_VERSION:
+        logging.info(f'{db_name} does not need a migration')
+        db.disconnect()
+        return
+    starting_time = time.time()
+    if version < 2:
+        _migrate_to_v2(db, db_name, batch_size)
+    if version < 3:
+        _migrate_to_v3(db, batch_size)
+    if vacuum:
+        logging.info('Vacuuming the database')
+        db.vacuum()
+    db.disconnect()
+    logging.info(f'Migration has finished in {time.time() - starting_time:.3f} sec')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m src.db_manager.migrate')
+    parser.add_argument('--db', default='db.sqlite')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--vacuum', action='store_true', help='reclaim the space freed by the v1 table')
+    parser.add_argument('--no-wal', dest='wal', action='store_false', default=os.getenv('SQLITE_WAL', '1') != '0',
+                        help='keep the DELETE journal mode for a database shared by several machines')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    migrate(args.db, args.batch_size, args.vacuum, args.wal)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,94 +1,878 @@
+import math
+
+SCHEMA_VERSION = 3
+# относительная погрешность квантилей по salary_sketches
+SKETCH_ACCURACY = 0.01
+SKETCH_LOG_GAMMA = math.log((1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY))
+
+
 class CollectorStatements:
 
     @staticmethod
-    def create_table():
-        return ('''CREATE TABLE IF NOT EXISTS vacancies (
+    def create_table(table: str = 'vacancies'):
+        return (f'''CREATE TABLE IF NOT EXISTS {table} (
                 id INTEGER PRIMARY KEY,
                 name TEXT,
                 city TEXT,
-                salary_bottom TEXT,
-                salary_top TEXT,
+                salary_bottom REAL,
+                salary_top REAL,
                 currency TEXT,
                 published_at TEXT,
                 employer_name TEXT,
                 key_skills TEXT,
                 schedule TEXT,
+                professional_role_id INTEGER,
                 professional_role TEXT,
                 experience TEXT)''')
 
+    @staticmethod
+    def create_skills():
+        return ('''CREATE TABLE IF NOT EXISTS skills (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE)''')
+
+    @staticmethod
+    def create_vacancy_skills():
+        return ('''CREATE TABLE IF NOT EXISTS vacancy_skills (
+                vacancy_id INTEGER NOT NULL,
+                skill_id INTEGER NOT NULL,
+                PRIMARY KEY (vacancy_id, skill_id)) WITHOUT ROWID''')
+
+    @staticmethod
+    def create_vacancy_skills_index():
+        return """CREATE INDEX IF NOT EXISTS idx_vacancy_skills_skill ON vacancy_skills (skill_id, vacancy_id)"""
+
+    @staticmethod
+    def create_data_version():
+        # счётчик записей в vacancies: увеличивается в каждой транзакции, которая меняет вакансии
+        return ("""CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                version INTEGER NOT NULL)""")
+
+    @staticmethod
+    def seed_data_version():
+        return """INSERT OR IGNORE INTO data_version (id, version) VALUES (0, 0)"""
+
+    @staticmethod
+    def bump_data_version():
+        return """UPDATE data_version SET version = version + 1"""
+
+    @staticmethod
+    def create_data_origin():
+        # случайная метка базы: пересозданная база начинает счётчик версий заново, но с другой меткой
+        return ("""CREATE TABLE IF NOT EXISTS data_origin (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                token TEXT NOT NULL)""")
+
+    @staticmethod
+    def seed_data_origin():
+        return """INSERT OR IGNORE INTO data_origin (id, token) VALUES (0, lower(hex(randomblob(8))))"""
+
+    @staticmethod
+    def get_columns():
+        return """SELECT name FROM pragma_table_info('vacancies')"""
+
+    @staticmethod
+    def create_crawl_state():
+        return ('''CREATE TABLE IF NOT EXISTS crawl_state (
+                origin INTEGER PRIMARY KEY,
+                floor INTEGER,
+                watermark INTEGER)''')
+
+    @staticmethod
+    def create_retry_queue():
+        return ('''CREATE TABLE IF NOT EXISTS retry_queue (
+                id INTEGER PRIMARY KEY)''')
+
+    @staticmethod
+    def create_id_index():
+        return ('''CREATE TABLE IF NOT EXISTS id_index (
+                chunk INTEGER PRIMARY KEY,
+                outcomes BLOB,
+                checked BLOB)''')
+
+    @staticmethod
+    def create_crawl_leases():
+        return ('''CREATE TABLE IF NOT EXISTS crawl_leases (
+                range_start INTEGER PRIMARY KEY,
+                range_end INTEGER,
+                owner TEXT,
+                expires_at REAL,
+                done INTEGER DEFAULT 0)''')
+
     @staticmethod
     def insert_vacancy():
-        return (f'''INSERT INTO vacancies
-        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+        return (f'''INSERT INTO vacancies (id, name, city, salary_bottom, salary_top, currency, published_at,
+            employer_name, key_skills, schedule, professional_role_id, professional_role, experience)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name,
+            city = excluded.city,
+            salary_bottom = excluded.salary_bottom,
+            salary_top = excluded.salary_top,
+            currency = excluded.currency,
+            published_at = excluded.published_at,
+            employer_name = excluded.employer_name,
+            key_skills = excluded.key_skills,
+            schedule = excluded.schedule,
+            professional_role_id = excluded.professional_role_id,
+            professional_role = excluded.professional_role,
+            experience = excluded.experience
         ''')
 
+    @staticmethod
+    def insert_skill():
+        return """INSERT OR IGNORE INTO skills (name) VALUES (?)"""
+
+    @staticmethod
+    def delete_vacancy_skills():
+        return """DELETE FROM vacancy_skills WHERE vacancy_id = ?"""
+
+    @staticmethod
+    def get_skill_ids():
+        return """SELECT name, id FROM skills WHERE name IN (SELECT value FROM json_each(?))"""
+
+    @staticmethod
+    def link_skill():
+        return """INSERT OR IGNORE INTO vacancy_skills (vacancy_id, skill_id) VALUES (?, ?)"""
+
     @staticmethod
     def check_table():
         return """SELECT id FROM vacancies ORDER BY id ASC LIMIT 1"""
 
+    @staticmethod
+    def get_max_id():
+        return """SELECT MAX(id) FROM vacancies"""
+
+    @staticmethod
+    def start_crawl():
+        return """INSERT OR IGNORE INTO crawl_state (origin, floor, watermark) VALUES (?, ?, ?)"""
+
+    @staticmethod
+    def get_crawl_state():
+        return """SELECT origin, floor, watermark FROM crawl_state
+        WHERE watermark > floor AND origin NOT IN (SELECT range_start FROM crawl_leases)
+        ORDER BY origin DESC LIMIT 1"""
+
+    @staticmethod
+    def get_crawl_state_for():
+        return """SELECT origin, floor, watermark FROM crawl_state WHERE origin = ?"""
+
+    @staticmethod
+    def update_crawl_state():
+        return """UPDATE crawl_state SET watermark = ? WHERE origin = ?"""
+
+    @staticmethod
+    def insert_throttled():
+        return """INSERT OR IGNORE INTO retry_queue (id) VALUES (?)"""
+
+    @staticmethod
+    def get_throttled():
+        return """SELECT id FROM retry_queue WHERE id < ? AND id > ? ORDER BY id DESC LIMIT ?"""
+
+    @staticmethod
+    def delete_throttled():
+        return """DELETE FROM retry_queue WHERE id = ?"""
+
+    @staticmethod
+    def insert_lease():
+        return """INSERT OR IGNORE INTO crawl_leases (range_start, range_end) VALUES (?, ?)"""
+
+    @staticmethod
+    def claim_lease():
+        return """
+        UPDATE crawl_leases
+        SET owner = ?, expires_at = ?
+        WHERE range_start = (
+            SELECT range_start FROM crawl_leases
+            WHERE done = 0 AND (owner IS NULL OR expires_at < ?)
+            ORDER BY range_start DESC
+            LIMIT 1
+        )
+        RETURNING range_start, range_end
+        """
+
+    @staticmethod
+    def renew_lease():
+        return """UPDATE crawl_leases SET expires_at = ? WHERE range_start = ? AND owner = ? AND done = 0"""
+
+    @staticmethod
+    def finish_lease():
+        return """UPDATE crawl_leases SET done = 1, expires_at = NULL WHERE range_start = ? AND owner = ?"""
+
+    @staticmethod
+    def get_lease_progress():
+        return """
+        SELECT
+            l.range_start,
+            l.range_end,
+            l.owner,
+            l.expires_at,
+            l.done,
+            COALESCE(c.watermark, l.range_start)
+        FROM crawl_leases AS l
+        LEFT JOIN crawl_state AS c ON c.origin = l.range_start
+        ORDER BY l.range_start DESC
+        """
+
+    @staticmethod
+    def get_id_index():
+        return """SELECT chunk, outcomes, checked FROM id_index"""
+
+    @staticmethod
+    def upsert_id_index():
+        return """INSERT INTO id_index (chunk, outcomes, checked) VALUES (?, ?, ?)
+        ON CONFLICT(chunk) DO UPDATE SET outcomes = excluded.outcomes, checked = excluded.checked"""
+
+
+class RefreshStatements:
+
+    @staticmethod
+    def create_vacancy_refresh():
+        return ('''CREATE TABLE IF NOT EXISTS vacancy_refresh (
+                id INTEGER PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at INTEGER,
+                next_check_at INTEGER,
+                changes INTEGER DEFAULT 0,
+                archived INTEGER DEFAULT 0)''')
+
+    @staticmethod
+    def create_refresh_index():
+        return """CREATE INDEX IF NOT EXISTS idx_vacancy_refresh_next ON vacancy_refresh (next_check_at)"""
+
+    @staticmethod
+    def create_vacancy_versions(table: str = 'vacancy_versions'):
+        return (f'''CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER,
+                observed_at INTEGER,
+                salary_bottom REAL,
+                salary_top REAL,
+                currency TEXT,
+                archived INTEGER,
+                PRIMARY KEY (id, observed_at))''')
+
+    @staticmethod
+    def seed_refresh():
+        return """INSERT OR IGNORE INTO vacancy_refresh (id, next_check_at) SELECT id, 0 FROM vacancies"""
+
+    @staticmethod
+    def get_due():
+        return """
+        SELECT
+            r.id,
+            r.etag,
+            r.last_modified,
+            r.checked_at,
+            r.changes,
+            r.archived,
+            v.published_at,
+            v.salary_bottom,
+            v.salary_top,
+            v.currency
+        FROM vacancy_refresh AS r
+        JOIN vacancies AS v ON v.id = r.id
+        WHERE r.next_check_at <= ? AND r.archived = 0
+        ORDER BY r.next_check_at
+        LIMIT ?
+        """
+
+    @staticmethod
+    def insert_initial_version():
+        return """
+        INSERT OR IGNORE INTO vacancy_versions (id, observed_at, salary_bottom, salary_top, currency, archived)
+        SELECT id, ?, salary_bottom, salary_top, currency, 0
+        FROM vacancies
+        WHERE id = ? AND NOT EXISTS (SELECT 1 FROM vacancy_versions WHERE id = ?)
+        """
+
+    @staticmethod
+    def insert_version():
+        return """INSERT OR REPLACE INTO vacancy_versions (id, observed_at, salary_bottom, salary_top, currency, archived)
+        VALUES (?, ?, ?, ?, ?, ?)"""
+
+    @staticmethod
+    def update_refresh():
+        return """
+        UPDATE vacancy_refresh
+        SET etag = COALESCE(?, etag),
+            last_modified = COALESCE(?, last_modified),
+            checked_at = ?,
+            next_check_at = ?,
+            changes = changes + ?,
+            archived = ?
+        WHERE id = ?
+        """
+
+
+
+def _unquote(column: str) -> str:
+    # v1 хранил каждое значение как f'"{value}"', а отсутствующие — строкой '"None"'
+    return (f"""CASE WHEN {column} IS NULL OR {column} = '"None"' THEN NULL
+                WHEN {column} LIKE '"%"' THEN substr({column}, 2, length({column}) - 2)
+                ELSE {column} END""")
+
+
+class SnapshotStatements:
+
+    @staticmethod
+    def get_data_version():
+        return """SELECT version FROM data_version"""
+
+    @staticmethod
+    def get_data_origin():
+        return """SELECT token FROM data_origin"""
+
+    @staticmethod
+    def count_vacancies():
+        return """SELECT COUNT(*) FROM vacancies"""
+
+    @staticmethod
+    def get_vacancies():
+        # published_at — секунды от эпохи для datetime64[s] без разбора строк в Python,
+        # минимальное int64 — представление NaT
+        return ("""
+        SELECT
+            id,
+            salary_bottom,
+            salary_top,
+            COALESCE(CAST(strftime('%s', published_at) AS INTEGER), -9223372036854775808),
+            currency,
+            city,
+            employer_name,
+            schedule,
+            professional_role,
+            experience
+        FROM vacancies
+        ORDER BY id
+        """)
+
+    @staticmethod
+    def count_vacancy_skills():
+        return """SELECT COUNT(*) FROM vacancy_skills"""
+
+    @staticmethod
+    def get_vacancy_skills():
+        return """SELECT vacancy_id, skill_id FROM vacancy_skills ORDER BY vacancy_id, skill_id"""
+
+    @staticmethod
+    def get_skills():
+        return """SELECT id, name FROM skills ORDER BY id"""
+
+
+_ROLLUP_KEYS = ('month', 'professional_role', 'city', 'experience', 'schedule', 'employer_name')
+_ROLLUP_VACANCIES = """(
+            SELECT id, substr(published_at, 1, 7) AS month, professional_role, city, experience, schedule,
+                   employer_name, currency, salary_bottom, salary_top
+            FROM vacancies)"""
+# унарный + отключает индексы по остальным ключам: строки группы ищутся по индексу работодателя
+_ROLLUP_STALE_VACANCIES = """(
+            SELECT v.id, s.month, v.professional_role, v.city, v.experience, v.schedule, v.employer_name,
+                   v.currency, v.salary_bottom, v.salary_top
+            FROM rollup_stale AS s
+            JOIN vacancies AS v
+                ON v.employer_name IS s.employer_name
+                AND +v.professional_role IS s.professional_role
+                AND +v.city IS s.city
+                AND +v.experience IS s.experience
+                AND +v.schedule IS s.schedule
+                AND substr(v.published_at, 1, 7) IS s.month)"""
+
+
+def _same_group(left: str, right: str) -> str:
+    # IS, а не =: NULL в ключе — отдельная группа
+    return ' AND '.join(f'{left}.{key} IS {right}.{key}' for key in _ROLLUP_KEYS)
+
+
+def _rollup_aggregate(source: str, condition: str = '1') -> str:
+    """Строки сводки по группам из `source` со столбцами id, ключами сводки, currency и зарплатами."""
+    keys = ', '.join(_ROLLUP_KEYS)
+    return (f"""
+        SELECT
+            {keys},
+            COUNT(*) AS total_vacancies,
+            COUNT(*) FILTER (WHERE {_WITH_SALARY}) AS count_vacancies,
+            TOTAL(salary_bottom) FILTER (WHERE {_WITH_SALARY}) AS sum_salary_bottom,
+            TOTAL(salary_bottom * salary_bottom) FILTER (WHERE {_WITH_SALARY}) AS sum_squares_bottom,
+            TOTAL(salary_top) FILTER (WHERE {_WITH_SALARY}) AS sum_salary_top,
+            TOTAL(salary_top * salary_top) FILTER (WHERE {_WITH_SALARY}) AS sum_squares_top,
+            MIN(salary_bottom) FILTER (WHERE {_WITH_SALARY}) AS min_salary,
+            MAX(salary_top) FILTER (WHERE {_WITH_SALARY}) AS max_salary,
+            MIN(id) AS first_id
+        FROM {source}
+        WHERE {condition}
+        GROUP BY {keys}
+        """)
+
+
+class RollupStatements:
+    """
+    Сводка vacancy_rollups: по строке на (месяц, роль, город, опыт, график, работодатель) с количеством,
+    суммами, суммами квадратов, min/max зарплат и первым id. Пока сводка включена (есть rollup_changes),
+    каждая пачка записи в vacancies попадает в журнал (-1 — строки до записи, +1 — после), refresh
+    сворачивает журнал после watermark.
+    """
+
+    @staticmethod
+    def create_rollups():
+        return [
+            """CREATE TABLE IF NOT EXISTS vacancy_rollups (
+                month TEXT,
+                professional_role TEXT,
+                city TEXT,
+                experience TEXT,
+                schedule TEXT,
+                employer_name TEXT,
+                total_vacancies INTEGER NOT NULL,
+                count_vacancies INTEGER NOT NULL,
+                sum_salary_bottom REAL NOT NULL,
+                sum_squares_bottom REAL NOT NULL,
+                sum_salary_top REAL NOT NULL,
+                sum_squares_top REAL NOT NULL,
+                min_salary REAL,
+                max_salary REAL,
+                first_id INTEGER NOT NULL)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancy_rollups_group
+               ON vacancy_rollups (employer_name, month, professional_role, city, experience, schedule)""",
+            # AUTOINCREMENT: seq не переиспользуется после очистки журнала и остаётся больше watermark
+            """CREATE TABLE IF NOT EXISTS rollup_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                sign INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                month TEXT,
+                professional_role TEXT,
+                city TEXT,
+                experience TEXT,
+                schedule TEXT,
+                employer_name TEXT,
+                currency TEXT,
+                salary_bottom REAL,
+                salary_top REAL)""",
+            """CREATE TABLE IF NOT EXISTS rollup_state (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                watermark INTEGER NOT NULL)""",
+        ]
+
+    @staticmethod
+    def drop_rollups():
+        return [
+            """DROP TABLE IF EXISTS vacancy_rollups""",
+            """DROP TABLE IF EXISTS rollup_changes""",
+            """DROP TABLE IF EXISTS rollup_state""",
+        ]
+
+    @staticmethod
+    def log_changes(sign: int):
+        # одним запросом на пачку: параметр — JSON-массив id вакансий пачки
+        return (f"""INSERT INTO rollup_changes (sign, id, month, professional_role, city, experience, schedule,
+                employer_name, currency, salary_bottom, salary_top)
+            SELECT {sign}, id, substr(published_at, 1, 7), professional_role, city, experience, schedule,
+                employer_name, currency, salary_bottom, salary_top
+            FROM vacancies
+            WHERE id IN (SELECT value FROM json_each(?))""")
+
+    @staticmethod
+    def get_watermark():
+        return """SELECT watermark FROM rollup_state"""
+
+    @staticmethod
+    def get_last_change():
+        return """SELECT COALESCE(MAX(seq), 0) FROM rollup_changes"""
+
+    @staticmethod
+    def clear_rollups():
+        return """DELETE FROM vacancy_rollups"""
+
+    @staticmethod
+    def rebuild():
+        return f"""INSERT INTO vacancy_rollups {_rollup_aggregate(_ROLLUP_VACANCIES)}"""
+
+    @staticmethod
+    def create_stale():
+        # группы, из которых строка ушла: min/max не вычитаются, такие группы пересчитываются по vacancies
+        return (f"""CREATE TEMP TABLE rollup_stale AS
+            SELECT DISTINCT {', '.join(_ROLLUP_KEYS)}
+            FROM rollup_changes
+            WHERE seq > :watermark AND seq <= :last AND sign < 0""")
+
+    @staticmethod
+    def index_stale():
+        return (f"""CREATE INDEX temp.idx_rollup_stale ON rollup_stale ({', '.join(_ROLLUP_KEYS)})""")
+
+    @staticmethod
+    def delete_stale():
+        return (f"""DELETE FROM vacancy_rollups WHERE rowid IN (
+            SELECT r.rowid FROM rollup_stale AS s JOIN vacancy_rollups AS r ON {_same_group('r', 's')})""")
+
+    @staticmethod
+    def recompute_stale():
+        return f"""INSERT INTO vacancy_rollups {_rollup_aggregate(_ROLLUP_STALE_VACANCIES)}"""
+
+    @staticmethod
+    def create_delta():
+        # новые строки остальных групп сворачиваются по журналу и прибавляются к сводке
+        condition = (f"""seq > :watermark AND seq <= :last AND sign > 0
+            AND NOT EXISTS (SELECT 1 FROM rollup_stale AS s WHERE {_same_group('s', 'rollup_changes')})""")
+        return f"""CREATE TEMP TABLE rollup_delta AS {_rollup_aggregate('rollup_changes', condition)}"""
+
+    @staticmethod
+    def merge_delta():
+        return (f"""UPDATE vacancy_rollups AS r SET
+            total_vacancies = r.total_vacancies + d.total_vacancies,
+            count_vacancies = r.count_vacancies + d.count_vacancies,
+            sum_salary_bottom = r.sum_salary_bottom + d.sum_salary_bottom,
+            sum_squares_bottom = r.sum_squares_bottom + d.sum_squares_bottom,
+            sum_salary_top = r.sum_salary_top + d.sum_salary_top,
+            sum_squares_top = r.sum_squares_top + d.sum_squares_top,
+            min_salary = COALESCE(MIN(r.min_salary, d.min_salary), r.min_salary, d.min_salary),
+            max_salary = COALESCE(MAX(r.max_salary, d.max_salary), r.max_salary, d.max_salary),
+            first_id = MIN(r.first_id, d.first_id)
+        FROM rollup_delta AS d
+        WHERE {_same_group('r', 'd')}""")
+
+    @staticmethod
+    def insert_delta():
+        return (f"""INSERT INTO vacancy_rollups
+            SELECT * FROM rollup_delta AS d
+            WHERE NOT EXISTS (SELECT 1 FROM vacancy_rollups AS r WHERE {_same_group('r', 'd')})""")
+
+    @staticmethod
+    def drop_temp():
+        return ["""DROP TABLE IF EXISTS temp.rollup_stale""", """DROP TABLE IF EXISTS temp.rollup_delta"""]
+
+    @staticmethod
+    def clear_changes():
+        return """DELETE FROM rollup_changes WHERE seq <= :last"""
+
+    @staticmethod
+    def set_watermark():
+        return """INSERT OR REPLACE INTO rollup_state (id, watermark) VALUES (0, :last)"""
+
+
+_SKETCH_KEYS = ('month', 'professional_role', 'city', 'experience')
+# NULL в ключе — отдельная группа: в уникальном индексе NULL заменяется значением, которого нет в данных
+_SKETCH_GROUP = ', '.join(f"ifnull({key}, x'00')" for key in _SKETCH_KEYS) + ', bucket'
+
+
+def _sketch_bucket(column: str) -> str:
+    # корзина i покрывает (gamma^(i-1), gamma^i]; зарплаты меньше 1 попадают в корзину 0
+    return f'CAST(ceil(ln(max({column}, 1)) / {SKETCH_LOG_GAMMA!r}) AS INTEGER)'
+
+
+def _sketch_rows(sign: int, source: str = 'vacancies') -> str:
+    """Корзины нижней и верхней границы зарплаты вакансий из `source`, сложенные по группам скетча."""
+    keys = ', '.join(_SKETCH_KEYS)
+    vacancies = (f"""SELECT substr(published_at, 1, 7) AS month, professional_role, city, experience,
+                    {{bucket}} AS bucket, {{bottom}} AS bottom, {{top}} AS top
+                FROM {source}
+                WHERE {_WITH_SALARY}""")
+    return (f"""
+        SELECT {keys}, bucket, {sign} * SUM(bottom), {sign} * SUM(top)
+        FROM (
+            {vacancies.format(bucket=_sketch_bucket('salary_bottom'), bottom=1, top=0)}
+            UNION ALL
+            {vacancies.format(bucket=_sketch_bucket('salary_top'), bottom=0, top=1)}
+        )
+        WHERE true
+        GROUP BY {keys}, bucket
+        """)
+
+
+class SketchStatements:
+    """
+    Скетчи квантилей зарплат salary_sketches: по строке на (месяц, роль, город, опыт, корзина) с числом
+    нижних и верхних границ зарплаты в корзине. Корзины логарифмические (относительная ширина
+    SKETCH_ACCURACY), поэтому скетчи любых групп и месяцев складываются суммой счётчиков, а изменение
+    вакансии вычитается так же, как прибавляется.
+    """
+
+    @staticmethod
+    def create_sketches():
+        return [
+            """CREATE TABLE IF NOT EXISTS salary_sketches (
+                month TEXT,
+                professional_role TEXT,
+                city TEXT,
+                experience TEXT,
+                bucket INTEGER NOT NULL,
+                count_bottom INTEGER NOT NULL,
+                count_top INTEGER NOT NULL)""",
+            f"""CREATE UNIQUE INDEX IF NOT EXISTS idx_salary_sketches_group ON salary_sketches ({_SKETCH_GROUP})""",
+            # только опустевшие корзины: их удаление после пачки не читает всю таблицу
+            """CREATE INDEX IF NOT EXISTS idx_salary_sketches_empty ON salary_sketches (bucket)
+               WHERE count_bottom = 0 AND count_top = 0""",
+        ]
+
+    @staticmethod
+    def build():
+        return f"""INSERT INTO salary_sketches {_sketch_rows(1)}"""
+
+    @staticmethod
+    def fold(sign: int):
+        # одним запросом на пачку: :ids — JSON-массив id вакансий пачки; CROSS JOIN закрепляет порядок
+        # соединения, чтобы вакансии читались по первичному ключу, а не перебором индекса по currency
+        source = 'json_each(:ids) AS batch CROSS JOIN vacancies ON vacancies.id = batch.value'
+        return (f"""INSERT INTO salary_sketches {_sketch_rows(sign, source)}
+            ON CONFLICT ({_SKETCH_GROUP}) DO UPDATE SET
+                count_bottom = count_bottom + excluded.count_bottom,
+                count_top = count_top + excluded.count_top""")
+
+    @staticmethod
+    def delete_empty():
+        return """DELETE FROM salary_sketches WHERE count_bottom = 0 AND count_top = 0"""
+
+
+class MigrationStatements:
+
+    @staticmethod
+    def copy_vacancies():
+        salary_bottom, salary_top = _unquote('salary_bottom'), _unquote('salary_top')
+        return (f"""
+        INSERT INTO vacancies_v2 (id, name, city, salary_bottom, salary_top, currency, published_at,
+            employer_name, key_skills, schedule, professional_role_id, professional_role, experience)
+        SELECT
+            id,
+            {_unquote('name')},
+            {_unquote('city')},
+            CASE WHEN ({salary_bottom}) GLOB '*[0-9]*' THEN CAST(({salary_bottom}) AS REAL) END,
+            CASE WHEN ({salary_top}) GLOB '*[0-9]*' THEN CAST(({salary_top}) AS REAL) END,
+            {_unquote('currency')},
+            replace(substr({_unquote('published_at')}, 1, 19), 'T', ' '),
+            {_unquote('employer_name')},
+            NULLIF(rtrim({_unquote('key_skills')}, ', '), ''),
+            {_unquote('schedule')},
+            NULL,
+            {_unquote('professional_role')},
+            {_unquote('experience')}
+        FROM vacancies
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+        """)
+
+    @staticmethod
+    def get_migrated_max_id():
+        return """SELECT COALESCE(MAX(id), -1) FROM vacancies_v2"""
+
+    @staticmethod
+    def delete_migrated():
+        return """DELETE FROM vacancies WHERE id <= ?"""
+
+    @staticmethod
+    def count_vacancies():
+        return """SELECT COUNT(*) FROM vacancies"""
+
+    @staticmethod
+    def copy_versions():
+        salary_bottom, salary_top = _unquote('salary_bottom'), _unquote('salary_top')
+        return (f"""
+        INSERT OR REPLACE INTO vacancy_versions_v2 (id, observed_at, salary_bottom, salary_top, currency, archived)
+        SELECT
+            id,
+            observed_at,
+            CASE WHEN ({salary_bottom}) GLOB '*[0-9]*' THEN CAST(({salary_bottom}) AS REAL) END,
+            CASE WHEN ({salary_top}) GLOB '*[0-9]*' THEN CAST(({salary_top}) AS REAL) END,
+            {_unquote('currency')},
+            archived
+        FROM vacancy_versions
+        """)
+
+    @staticmethod
+    def get_key_skills_batch():
+        return """SELECT id, key_skills FROM vacancies WHERE id > ? AND key_skills IS NOT NULL ORDER BY id LIMIT ?"""
+
+    @staticmethod
+    def get_linked_max_id():
+        return """SELECT COALESCE(MAX(vacancy_id), -1) FROM vacancy_skills"""
+
+    @staticmethod
+    def has_table():
+        return """SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"""
+
+
+_WITH_SALARY = """currency = 'RUR' AND salary_bottom IS NOT NULL AND salary_top IS NOT NULL"""
+
+
+def _salary_stats(keys: str, condition: str = '1') -> str:
+    """
+    Одна строка на группу `keys`: количество, суммы и суммы квадратов зарплат (для среднего и
+    стандартного отклонения), min/max и общее число вакансий группы.
+    """
+    return (f"""
+        SELECT
+            {keys},
+            s.count_vacancies,
+            s.sum_salary_bottom,
+            s.sum_squares_bottom,
+            s.sum_salary_top,
+            s.sum_squares_top,
+            s.min_salary,
+            s.max_salary,
+            t.total_vacancies
+        FROM (
+            SELECT
+                {keys},
+                COUNT(*) AS count_vacancies,
+                SUM(salary_bottom) AS sum_salary_bottom,
+                SUM(salary_bottom * salary_bottom) AS sum_squares_bottom,
+                SUM(salary_top) AS sum_salary_top,
+                SUM(salary_top * salary_top) AS sum_squares_top,
+                MIN(salary_bottom) AS min_salary,
+                MAX(salary_top) AS max_salary
+            FROM vacancies
+            WHERE {_WITH_SALARY} AND {condition}
+            GROUP BY {keys}
+        ) AS s
+        JOIN (
+            SELECT {keys}, COUNT(*) AS total_vacancies
+            FROM vacancies
+            WHERE {condition}
+            GROUP BY {keys}
+        ) AS t USING ({keys})
+        ORDER BY {keys}
+        """)
+
+
+def _salary_median(keys: str) -> str:
+    """
+    Медианы нижней и верхней границы зарплаты одной группы: среднее одной или двух центральных строк,
+    параметры — значения `keys`, :median_limit (1 или 2) и :median_offset. Строки группы читаются
+    из покрывающего индекса, а не из всей таблицы.
+    """
+    group = ' AND '.join(f'{key} IS :{key}' for key in keys.split(', '))
+    return (f"""
+        SELECT
+            (SELECT AVG(salary_bottom) FROM (
+                SELECT salary_bottom FROM vacancies
+                WHERE {_WITH_SALARY} AND {group}
+                ORDER BY salary_bottom
+                LIMIT :median_limit OFFSET :median_offset
+            )),
+            (SELECT AVG(salary_top) FROM (
+                SELECT salary_top FROM vacancies
+                WHERE {_WITH_SALARY} AND {group}
+                ORDER BY salary_top
+                LIMIT :median_limit OFFSET :median_offset
+            ))
+        """)
+
+
+def _rollup_salary_stats(keys: str, condition: str = '1') -> str:
+    """
+    Те же столбцы, что у `_salary_stats`, но из vacancy_rollups: группы сводки складываются,
+    поэтому запрос читает по строке на группу сводки, а не на вакансию. Группы с NULL в ключе
+    отбрасываются, как при соединении USING в `_salary_stats`.
+    """
+    not_null = ' AND '.join(f'{key} IS NOT NULL' for key in keys.split(', '))
+    return (f"""
+        SELECT
+            {keys},
+            SUM(count_vacancies),
+            SUM(sum_salary_bottom),
+            SUM(sum_squares_bottom),
+            SUM(sum_salary_top),
+            SUM(sum_squares_top),
+            MIN(min_salary),
+            MAX(max_salary),
+            SUM(total_vacancies)
+        FROM vacancy_rollups
+        WHERE {not_null} AND {condition}
+        GROUP BY {keys}
+        HAVING SUM(count_vacancies) > 0
+        ORDER BY {keys}
+        """)
+
+
+def _salary_sketch(keys: str) -> str:
+    """
+    Скетчи групп `keys`, сложенные за месяцы с :since по :until ('YYYY-MM', NULL — без границы):
+    по строке на группу и корзину в порядке групп и корзин. Группы с NULL в ключе отбрасываются.
+    """
+    not_null = ' AND '.join(f'{key} IS NOT NULL' for key in keys.split(', '))
+    return (f"""
+        SELECT {keys}, bucket, SUM(count_bottom), SUM(count_top)
+        FROM salary_sketches
+        WHERE {not_null}
+            AND (:since IS NULL OR month >= :since)
+            AND (:until IS NULL OR month <= :until)
+        GROUP BY {keys}, bucket
+        ORDER BY {keys}, bucket
+        """)
+
 
 class AnalyticStatements:
     @classmethod
     def choose_statement(cls, statement):
         statements = {
             'get_salary_by_role': cls.get_salary_by_role(),
+            'get_median_by_role': cls.get_median_by_role(),
             'get_salary_by_city': cls.get_salary_by_city(),
+            'get_median_by_city': cls.get_median_by_city(),
             'get_roles_count': cls.get_roles_count(),
             'get_salary_by_experience': cls.get_salary_by_experience(),
-            'get_key_skills': cls.get_key_skills(),
-            'get_schedule_analysis': cls.get_schedule_analysis(),
-            'get_vacancy_dynamics': cls.get_vacancy_dynamics(),
-            'get_employer_analysis': cls.get_employer_analysis()
+            'get_median_by_experience': cls.get_median_by_experience(),
+            'get_sketch_by_role': cls.get_sketch_by_role(),
+            'get_sketch_by_city': cls.get_sketch_by_city(),
+            'get_sketch_by_experience': cls.get_sketch_by_experience(),
+            'get_skill_frequency': cls.get_skill_frequency(),
+            'get_skills_by_role': cls.get_skills_by_role(),
+            'get_skills_by_employer': cls.get_skills_by_employer(),
+            'get_schedule_shares': cls.get_schedule_shares(),
+            'get_salary_by_schedule': cls.get_salary_by_schedule(),
+            'get_schedule_dynamics': cls.get_schedule_dynamics(),
+            'get_role_dynamics': cls.get_role_dynamics(),
+            'get_monthly_salary': cls.get_monthly_salary(),
+            'get_top_employers': cls.get_top_employers(),
+            'get_salary_by_employer': cls.get_salary_by_employer(),
+            'rollup_salary_by_role': cls.rollup_salary_by_role(),
+            'rollup_salary_by_city': cls.rollup_salary_by_city(),
+            'rollup_salary_by_experience': cls.rollup_salary_by_experience(),
+            'rollup_roles_count': cls.rollup_roles_count(),
+            'rollup_schedule_shares': cls.rollup_schedule_shares(),
+            'rollup_salary_by_schedule': cls.rollup_salary_by_schedule(),
+            'rollup_schedule_dynamics': cls.rollup_schedule_dynamics(),
+            'rollup_role_dynamics': cls.rollup_role_dynamics(),
+            'rollup_monthly_salary': cls.rollup_monthly_salary(),
+            'rollup_top_employers': cls.rollup_top_employers(),
+            'rollup_salary_by_employer': cls.rollup_salary_by_employer()
         }
         method = statements.get(statement)
         return method
 
+    @staticmethod
+    def create_indexes():
+        # покрывающие индексы: зарплатная статистика читает только диапазон currency = 'RUR'
+        # нужной группы, а общие количества и помесячные счётчики — узкие индексы вместо таблицы
+        return [
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_role_salary
+               ON vacancies (currency, professional_role, salary_bottom, salary_top)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_city_salary
+               ON vacancies (currency, city, salary_bottom, salary_top)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_experience_salary
+               ON vacancies (currency, experience, professional_role, salary_bottom, salary_top)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_role_published ON vacancies (professional_role, published_at)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_city ON vacancies (city)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_experience_role ON vacancies (experience, professional_role)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_schedule_published ON vacancies (schedule, published_at)""",
+            """CREATE INDEX IF NOT EXISTS idx_vacancies_employer ON vacancies (employer_name)""",
+        ]
+
     @staticmethod
     def get_salary_by_role():
-        return ("""
-        SELECT
-            vacancies.professional_role,
-            salary_bottom,
-        salary_top,
-        currency,
-        vac_count.count
-        FROM vacancies
-        JOIN (
-            SELECT professional_role, COUNT(id) as count
-            FROM vacancies
-            GROUP BY professional_role
-        ) as vac_count
-        ON
-            vacancies.professional_role = vac_count.professional_role
-        WHERE
-            currency = '"RUR"'
-            AND salary_bottom != '"None"'
-            AND salary_top != '"None"'
-        """)
+        return _salary_stats('professional_role')
+
+    @staticmethod
+    def get_median_by_role():
+        return _salary_median('professional_role')
 
     @staticmethod
     def get_salary_by_city():
-        return ("""
-        SELECT
-            v.city,
-            v.salary_bottom,
-            v.salary_top,
-            v.currency,
-            c.total_vacancies
-        FROM vacancies AS v
-        JOIN (
-            SELECT city, COUNT(id) as total_vacancies
-            FROM vacancies
-            WHERE city != '"None"'
-            GROUP BY city
-        ) as c
-        ON v.city = c.city
-        WHERE
-            v.currency = '"RUR"'
-            AND v.salary_bottom != '"None"'
-            AND v.salary_top != '"None"'
-            AND v.city != '"None"'
-        """)
+        return _salary_stats('city', 'city IS NOT NULL')
+
+    @staticmethod
+    def get_median_by_city():
+        return _salary_median('city')
 
     @staticmethod
     def get_roles_count():
@@ -102,79 +886,309 @@ class AnalyticStatements:
 
     @staticmethod
     def get_salary_by_experience():
+        return _salary_stats('experience, professional_role')
+
+    @staticmethod
+    def get_median_by_experience():
+        return _salary_median('experience, professional_role')
+
+    @staticmethod
+    def get_sketch_by_role():
+        return _salary_sketch('professional_role')
+
+    @staticmethod
+    def get_sketch_by_city():
+        return _salary_sketch('city')
+
+    @staticmethod
+    def get_sketch_by_experience():
+        return _salary_sketch('experience, professional_role')
+
+    @staticmethod
+    def get_skill_frequency():
+        return ("""
+        SELECT
+            s.name,
+            f.frequency
+        FROM (
+            SELECT skill_id, COUNT(*) AS frequency
+            FROM vacancy_skills
+            GROUP BY skill_id
+        ) AS f
+        JOIN skills AS s ON s.id = f.skill_id
+        ORDER BY f.frequency DESC, s.name
+        """)
+
+    @staticmethod
+    def get_skills_by_role():
         return ("""
         SELECT
-            v.experience,
             v.professional_role,
-            v.salary_bottom,
-            v.salary_top,
-            v.currency,
-            total.total_vacancies
-        FROM vacancies AS v
-        JOIN (
-            SELECT experience, professional_role, COUNT(*) AS total_vacancies
-            FROM vacancies
-            GROUP BY experience, professional_role
-        ) AS total
-        ON v.experience = total.experience AND v.professional_role = total.professional_role
+            s.name,
+            COUNT(*) AS frequency
+        FROM vacancy_skills AS vs
+        JOIN vacancies AS v ON v.id = vs.vacancy_id
+        JOIN skills AS s ON s.id = vs.skill_id
+        GROUP BY v.professional_role, s.name
+        ORDER BY v.professional_role, s.name
+        """)
+
+    @staticmethod
+    def get_skills_by_employer():
+        # компании перечисляются в порядке первой вакансии с навыком
+        return ("""
+        SELECT
+            s.name,
+            c.companies,
+            c.frequency
+        FROM (
+            SELECT skill_id, group_concat(employer_name, ', ') AS companies, SUM(frequency) AS frequency
+            FROM (
+                SELECT vs.skill_id, v.employer_name, COUNT(*) AS frequency, MIN(vs.vacancy_id) AS first_id
+                FROM vacancy_skills AS vs
+                JOIN vacancies AS v ON v.id = vs.vacancy_id
+                GROUP BY vs.skill_id, v.employer_name
+                ORDER BY vs.skill_id, first_id
+            )
+            GROUP BY skill_id
+        ) AS c
+        JOIN skills AS s ON s.id = c.skill_id
+        ORDER BY c.frequency DESC, s.name
+        """)
+
+    @staticmethod
+    def get_schedule_shares():
+        return ("""
+        SELECT
+            schedule,
+            COUNT(*) AS total_vacancies
+        FROM vacancies
+        WHERE schedule IS NOT NULL
+        GROUP BY schedule
+        """)
+
+    @staticmethod
+    def get_salary_by_schedule():
+        return ("""
+        SELECT
+            schedule,
+            AVG(salary_bottom) AS avg_salary_bottom,
+            AVG(salary_top) AS avg_salary_top
+        FROM vacancies
         WHERE
-            v.currency = '"RUR"'
-            AND v.salary_bottom != '"None"'
-            AND v.salary_top != '"None"'
+            currency = 'RUR'
+            AND salary_bottom IS NOT NULL
+            AND salary_top IS NOT NULL
+            AND schedule IS NOT NULL
+        GROUP BY schedule
+        """)
 
+    @staticmethod
+    def get_schedule_dynamics():
+        # published_at хранится как 'YYYY-MM-DD HH:MM:SS', месяц — первые 7 символов
+        return ("""
+        SELECT
+            substr(published_at, 1, 7) AS month,
+            schedule,
+            COUNT(*) AS count
+        FROM vacancies
+        WHERE schedule IS NOT NULL
+        GROUP BY month, schedule
+        ORDER BY month, schedule
         """)
 
     @staticmethod
-    def get_key_skills():
+    def get_role_dynamics():
         return ("""
         SELECT
+            substr(published_at, 1, 7) AS month,
             professional_role,
-            key_skills
+            COUNT(*) AS count
         FROM vacancies
-        WHERE
-            key_skills != '"None"'
+        GROUP BY month, professional_role
+        ORDER BY month, professional_role
         """)
 
     @staticmethod
-    def get_schedule_analysis():
+    def get_monthly_salary():
         return ("""
         SELECT
-            v.schedule,
-            v.salary_bottom,
-            v.salary_top,
-            v.currency,
-            v.published_at,
-            total.total_vacancies
-        FROM vacancies AS v
-        JOIN (
-            SELECT schedule, COUNT(*) AS total_vacancies
-            FROM vacancies
-            GROUP BY schedule
-        ) AS total
-        ON v.schedule = total.schedule
+            substr(published_at, 1, 7) AS month,
+            AVG(salary_bottom) AS avg_salary_bottom,
+            AVG(salary_top) AS avg_salary_top,
+            COUNT(*) AS count_vacancies
+        FROM vacancies
+        WHERE
+            currency = 'RUR'
+            AND salary_bottom IS NOT NULL
+            AND salary_top IS NOT NULL
+        GROUP BY month
+        ORDER BY month
         """)
 
     @staticmethod
-    def get_vacancy_dynamics():
+    def get_top_employers():
+        # при равенстве — в порядке первой вакансии работодателя, как value_counts по таблице
         return ("""
         SELECT
-            published_at,
-            salary_bottom,
-            salary_top,
-            currency,
-            professional_role
+            employer_name,
+            COUNT(*) AS vacancy_count
         FROM vacancies
+        WHERE employer_name IS NOT NULL
+        GROUP BY employer_name
+        ORDER BY vacancy_count DESC, MIN(id)
+        LIMIT 10
         """)
 
     @staticmethod
-    def get_employer_analysis():
+    def get_salary_by_employer():
         return ("""
         SELECT
             employer_name,
-            professional_role,
-            key_skills,
-            salary_bottom,
-            salary_top,
-            currency
+            AVG(salary_bottom) AS avg_salary_bottom,
+            AVG(salary_top) AS avg_salary_top,
+            COUNT(*) AS count_vacancies
         FROM vacancies
+        WHERE
+            currency = 'RUR'
+            AND salary_bottom IS NOT NULL
+            AND salary_top IS NOT NULL
+            AND employer_name IS NOT NULL
+        GROUP BY employer_name
+        ORDER BY employer_name
+        """)
+
+    # те же анализы по сводке vacancy_rollups: стоимость растёт с числом групп, а не вакансий
+
+    @staticmethod
+    def rollup_salary_by_role():
+        return _rollup_salary_stats('professional_role')
+
+    @staticmethod
+    def rollup_salary_by_city():
+        return _rollup_salary_stats('city')
+
+    @staticmethod
+    def rollup_salary_by_experience():
+        return _rollup_salary_stats('experience, professional_role')
+
+    @staticmethod
+    def rollup_roles_count():
+        return ("""
+        SELECT professional_role, SUM(total_vacancies)
+        FROM vacancy_rollups
+        GROUP BY professional_role
+        ORDER BY professional_role
+        """)
+
+    @staticmethod
+    def rollup_schedule_shares():
+        return ("""
+        SELECT schedule, SUM(total_vacancies)
+        FROM vacancy_rollups
+        WHERE schedule IS NOT NULL
+        GROUP BY schedule
+        ORDER BY schedule
+        """)
+
+    @staticmethod
+    def rollup_salary_by_schedule():
+        return ("""
+        SELECT schedule, SUM(sum_salary_bottom) / SUM(count_vacancies), SUM(sum_salary_top) / SUM(count_vacancies)
+        FROM vacancy_rollups
+        WHERE schedule IS NOT NULL
+        GROUP BY schedule
+        HAVING SUM(count_vacancies) > 0
+        ORDER BY schedule
+        """)
+
+    @staticmethod
+    def rollup_schedule_dynamics():
+        return ("""
+        SELECT month, schedule, SUM(total_vacancies)
+        FROM vacancy_rollups
+        WHERE schedule IS NOT NULL
+        GROUP BY month, schedule
+        ORDER BY month, schedule
+        """)
+
+    @staticmethod
+    def rollup_role_dynamics():
+        return ("""
+        SELECT month, professional_role, SUM(total_vacancies)
+        FROM vacancy_rollups
+        GROUP BY month, professional_role
+        ORDER BY month, professional_role
+        """)
+
+    @staticmethod
+    def rollup_monthly_salary():
+        return ("""
+        SELECT month, SUM(sum_salary_bottom) / SUM(count_vacancies), SUM(sum_salary_top) / SUM(count_vacancies),
+               SUM(count_vacancies)
+        FROM vacancy_rollups
+        GROUP BY month
+        HAVING SUM(count_vacancies) > 0
+        ORDER BY month
+        """)
+
+    @staticmethod
+    def rollup_top_employers():
+        return ("""
+        SELECT employer_name, SUM(total_vacancies) AS vacancy_count
+        FROM vacancy_rollups
+        WHERE employer_name IS NOT NULL
+        GROUP BY employer_name
+        ORDER BY vacancy_count DESC, MIN(first_id)
+        LIMIT 10
+        """)
+
+    @staticmethod
+    def rollup_salary_by_employer():
+        return ("""
+        SELECT employer_name, SUM(sum_salary_bottom) / SUM(count_vacancies),
+               SUM(sum_salary_top) / SUM(count_vacancies), SUM(count_vacancies)
+        FROM vacancy_rollups
+        WHERE employer_name IS NOT NULL
+        GROUP BY employer_name
+        HAVING SUM(count_vacancies) > 0
+        ORDER BY employer_name
+        """)
+
+    # построчные выборки для потоковой аналитики: читаются через fetchmany и сворачиваются по частям,
+    # в выборку попадают только столбцы, нужные накопителям прохода
+
+    _STREAM_VACANCIES = {
+        'id': 'id',
+        'professional_role': 'professional_role',
+        'city': 'city',
+        'experience': 'experience',
+        'schedule': 'schedule',
+        'employer_name': 'employer_name',
+        'month': 'substr(published_at, 1, 7)',
+        'currency': 'currency',
+        'salary_bottom': 'salary_bottom',
+        'salary_top': 'salary_top'
+    }
+    _STREAM_SKILL_LINKS = {
+        'vacancy_id': 'vs.vacancy_id',
+        'key_skills': 's.name',
+        'professional_role': 'v.professional_role',
+        'employer_name': 'v.employer_name'
+    }
+
+    @classmethod
+    def stream_vacancies(cls, columns: list[str]):
+        return (f"""
+        SELECT {', '.join(cls._STREAM_VACANCIES[column] for column in columns)}
+        FROM vacancies
+        """)
+
+    @classmethod
+    def stream_skill_links(cls, columns: list[str]):
+        return (f"""
+        SELECT {', '.join(cls._STREAM_SKILL_LINKS[column] for column in columns)}
+        FROM vacancy_skills AS vs
+        JOIN vacancies AS v ON v.id = vs.vacancy_id
+        JOIN skills AS s ON s.id = vs.skill_id
         """)
@@ -10,7 +10,7 @@ class Vacancy(BaseModel):
     currency: str | None
     published_at: str
     employer_name: str
-    key_skills: str | None
+    key_skills: list[str] | None
     schedule: str
     professional_role: str
     professional_role_id: int
@@ -1,41 +1,83 @@
-import json
 import logging
+from collections import Counter
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
 
 from src.models.vacancy_model import Vacancy
 
 
-async def json_loads(raw_data: str | bytes) -> dict:
-    return json.loads(raw_data)
+def json_loads(raw_data: str | bytes) -> dict:
+    return orjson.loads(raw_data)
 
 
-async def skills_check(skills):
-    result = ''
-    for skill in skills:
-        result += skill['name'] + ', '
-    if result == '':
-        return None
-    else:
-        return result
+def skills_check(skills) -> list[str] | None:
+    return [skill['name'] for skill in skills] or None
+
+
+def extract_vacancy(data: dict) -> dict:
+    """
+    Достаёт из ответа /vacancies/{id} только поля, нужные `Vacancy`.
+    При неполном документе бросает KeyError, TypeError или IndexError.
+    """
+    address = data.get('address')
+    salary = data.get('salary_range')
+    role = data['professional_roles'][0]
+    return {'id': data['id'],
+            'name': data['name'],
+            'city': address['city'] if address else None,
+            'salary_bottom': salary['from'] if salary else None,
+            'salary_top': salary['to'] if salary else None,
+            'currency': salary['currency'] if salary else None,
+            'published_at': data['published_at'],
+            'employer_name': data['employer']['name'],
+            'key_skills': skills_check(data['key_skills']),
+            'schedule': data['schedule']['id'],
+            'professional_role_id': role['id'],
+            'professional_role': role['name'],
+            'experience': data['experience']['id']}
+
 
+class VacancyParser:
+    """
+    Разбор пачки сырых вакансий: поля извлекаются напрямую, а проверка типов
+    выполняется одним вызовом `TypeAdapter` на всю пачку. Отбракованные документы
+    не пишутся в лог целиком, а считаются по причинам в `rejected`.
+    """
+    _adapter = TypeAdapter(list[Vacancy])
+
+    def __init__(self):
+        self.rejected = Counter()
+
+    def _reject(self, data, reason: str):
+        self.rejected[reason] += 1
+        logging.debug(f'Vacancy {data.get("id") if isinstance(data, dict) else None} is rejected: {reason}')
+
+    def parse(self, records: list) -> list[Vacancy | None]:
+        result: list[Vacancy | None] = [None] * len(records)
+        fields, positions = [], []
+        for position, data in enumerate(records):
+            try:
+                if data.get('errors'):
+                    self._reject(data, 'errors')
+                    continue
+                fields.append(extract_vacancy(data))
+                positions.append(position)
+            except KeyError as e:
+                self._reject(data, f'missing {e.args[0]}')
+            except (AttributeError, TypeError, IndexError):
+                self._reject(data, 'malformed')
+        try:
+            vacancies = self._adapter.validate_python(fields)
+        except ValidationError as e:
+            invalid = {}
+            for error in e.errors():
+                invalid.setdefault(error['loc'][0], f'invalid {error["loc"][1]}')
+            for item, reason in invalid.items():
+                self._reject(fields[item], reason)
+            positions = [position for item, position in enumerate(positions) if item not in invalid]
+            vacancies = self._adapter.validate_python([row for item, row in enumerate(fields) if item not in invalid])
+        for position, vacancy in zip(positions, vacancies):
+            result[position] = vacancy
+        return result
 
-async def formalize_data(data: dict):
-    try:
-        if data.get('errors'):
-            return None
-        vacancy = Vacancy(id=data['id'],
-                          name=data['name'],
-                          city=data['address']['city'] if data.get('address') else None,
-                          salary_bottom=data['salary_range']['from'] if data.get('salary_range') else None,
-                          salary_top=data['salary_range']['to'] if data.get('salary_range') else None,
-                          currency=data['salary_range']['currency'] if data.get('salary_range') else None,
-                          published_at=data['published_at'],
-                          employer_name=data['employer']['name'],
-                          key_skills=await skills_check(data['key_skills']),
-                          schedule=data['schedule']['id'],
-                          professional_role_id=data['professional_roles'][0]['id'],
-                          professional_role=data['professional_roles'][0]['name'],
-                          experience=data['experience']['id'])
-        return vacancy
-    except Exception as e:
-        logging.warning(f'Formalizing error {e} with data {data}')
-        pass